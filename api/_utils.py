@@ -1,18 +1,25 @@
 import asyncio
+import concurrent.futures
 import json
 import logging
 import threading
 from http import HTTPStatus
-from typing import Any, Dict, Iterable, Optional
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Union
+from urllib.parse import parse_qsl, urlparse
 
 from backend.config import settings
-from backend.services import atm_service
+from backend.http_cache import etag_matches, make_etag
+from backend.services import NDJSON_MEDIA_TYPE, atm_service
 
 logger = logging.getLogger("serverless")
 
 _service_ready = False
 _service_lock = threading.Lock()
 
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_thread: Optional[threading.Thread] = None
+_loop_lock = threading.Lock()
+
 _raw_origins = [origin.strip() for origin in settings.ALLOWED_ORIGINS.split(",") if origin.strip()]
 _allow_all = "*" in _raw_origins or not _raw_origins
 _allowed_origins = {origin for origin in _raw_origins if origin != "*"}
@@ -31,15 +38,50 @@ def ensure_service() -> None:
             return
 
         logger.info("Initializing ATM service for serverless execution")
-        asyncio.run(atm_service.initialize())
+        # Prebuilt snapshot (service_snapshot.py) when fresh: no CSV parsing nor validation
+        run_async(atm_service.initialize(use_snapshot=True))
         _service_ready = True
 
 
-def run_async(coro):
+def _run_loop(loop: asyncio.AbstractEventLoop) -> None:
+    asyncio.set_event_loop(loop)
+    loop.run_forever()
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """
+    The container-wide event loop, started on first use in a daemon thread.
+    Every handler lives on this single loop for the lifetime of the warm
+    container.
+    """
+    global _loop, _loop_thread
+    if _loop is not None:
+        return _loop
+
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=_run_loop, args=(loop,), name="serverless-event-loop", daemon=True)
+            thread.start()
+            _loop, _loop_thread = loop, thread
+    return _loop
+
+
+def submit(coro) -> "concurrent.futures.Future[Any]":
+    """Schedules a coroutine on the shared loop from any thread."""
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop())
+
+
+def run_async(coro, timeout: Optional[float] = None):
     """
-    Execute an async coroutine from our sync serverless handler.
+    Execute an async coroutine from our sync serverless handler and wait for
+    its result (exceptions are re-raised in the calling thread).
     """
-    return asyncio.run(coro)
+    loop = get_event_loop()
+    if threading.current_thread() is _loop_thread:
+        coro.close()
+        raise RuntimeError("run_async() called from the event loop thread would deadlock")
+    return asyncio.run_coroutine_threadsafe(coro, loop).result(timeout)
 
 
 def _resolve_allowed_origin(request_origin: Optional[str]) -> str:
@@ -50,19 +92,86 @@ def _resolve_allowed_origin(request_origin: Optional[str]) -> str:
     return next(iter(_allowed_origins), "*")
 
 
-def respond_json(handler, status: int, payload: Dict[str, Any]) -> None:
-    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
-    handler.send_response(status)
-    handler.send_header("Content-Type", "application/json; charset=utf-8")
+def _send_cors_headers(handler) -> None:
     handler.send_header("Access-Control-Allow-Origin", _resolve_allowed_origin(handler.headers.get("Origin")))
     handler.send_header("Access-Control-Allow-Credentials", "true")
     handler.send_header("Access-Control-Allow-Methods", "GET,POST,OPTIONS")
     handler.send_header("Access-Control-Allow-Headers", "Content-Type, Authorization, X-Requested-With")
+
+
+def respond_json(handler, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    handler.send_response(status)
+    handler.send_header("Content-Type", "application/json; charset=utf-8")
+    _send_cors_headers(handler)
+    for name, value in (headers or {}).items():
+        handler.send_header(name, value)
     handler.send_header("Content-Length", str(len(body)))
     handler.end_headers()
     handler.wfile.write(body)
 
 
+def respond_ndjson(handler, chunks: Iterable[bytes], headers: Optional[Dict[str, str]] = None) -> None:
+    """
+    Streams newline-delimited JSON without buffering the whole body.
+    HTTP/1.1 handlers get chunked transfer encoding; HTTP/1.0 ones get the
+    raw stream terminated by closing the connection.
+    """
+    chunked = handler.protocol_version == "HTTP/1.1" and handler.request_version == "HTTP/1.1"
+    handler.send_response(200)
+    handler.send_header("Content-Type", f"{NDJSON_MEDIA_TYPE}; charset=utf-8")
+    _send_cors_headers(handler)
+    for name, value in (headers or {}).items():
+        handler.send_header(name, value)
+    if chunked:
+        handler.send_header("Transfer-Encoding", "chunked")
+    else:
+        handler.send_header("Connection", "close")
+        handler.close_connection = True
+    handler.end_headers()
+
+    for chunk in chunks:
+        if not chunk:
+            continue
+        if chunked:
+            handler.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+        else:
+            handler.wfile.write(chunk)
+    if chunked:
+        handler.wfile.write(b"0\r\n\r\n")
+
+
+def wants_ndjson(handler) -> bool:
+    """True when the query asks for ?format=ndjson; ValueError on an unknown format."""
+    fmt = dict(parse_qsl(urlparse(handler.path).query)).get("format", "json")
+    if fmt not in ("json", "ndjson"):
+        raise ValueError(f"Unknown format '{fmt}' (expected: json, ndjson)")
+    return fmt == "ndjson"
+
+
+def respond_cached(handler, version: str, build: Callable[[], Union[Dict[str, Any], Iterator[bytes]]],
+                   ndjson: bool = False) -> None:
+    """
+    Conditional GET: strong ETag from the dataset version + path + query.
+    A matching If-None-Match gets a 304 without building the payload.
+    With ndjson=True, `build` returns NDJSON chunks that are streamed.
+    """
+    url = urlparse(handler.path)
+    etag = make_etag(version, url.path, parse_qsl(url.query, keep_blank_values=True))
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(handler.headers.get("If-None-Match"), etag):
+        handler.send_response(HTTPStatus.NOT_MODIFIED)
+        _send_cors_headers(handler)
+        for name, value in headers.items():
+            handler.send_header(name, value)
+        handler.end_headers()
+        return
+    if ndjson:
+        respond_ndjson(handler, build(), headers)
+        return
+    respond_json(handler, 200, build(), headers)
+
+
 def respond_error(handler, status: int, message: str, details: Optional[Iterable[Any]] = None) -> None:
     payload = {"error": message}
     if details:
@@ -72,10 +181,7 @@ def respond_error(handler, status: int, message: str, details: Optional[Iterable
 
 def handle_options(handler) -> None:
     handler.send_response(HTTPStatus.NO_CONTENT)
-    handler.send_header("Access-Control-Allow-Origin", _resolve_allowed_origin(handler.headers.get("Origin")))
-    handler.send_header("Access-Control-Allow-Credentials", "true")
-    handler.send_header("Access-Control-Allow-Methods", "GET,POST,OPTIONS")
-    handler.send_header("Access-Control-Allow-Headers", "Content-Type, Authorization, X-Requested-With")
+    _send_cors_headers(handler)
     handler.end_headers()
 
 
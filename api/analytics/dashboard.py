@@ -1,7 +1,7 @@
 from datetime import datetime
 from http.server import BaseHTTPRequestHandler
 
-from backend.services import atm_service
+from backend.services import atm_service, get_coverage_rate, get_opportunity_zones
 
 from .._utils import ensure_service, handle_options, respond_json
 
@@ -13,32 +13,7 @@ class handler(BaseHTTPRequestHandler):
     def do_GET(self):
         ensure_service()
 
-        atms = atm_service.existing_atms
-        total_atms = len(atms)
-        total_volume = sum(atm.monthly_volume or 0 for atm in atms)
-        avg_volume = total_volume / total_atms if total_atms else 0
-
-        regional = {}
-        for atm in atms:
-            region = atm.region or "Unknown"
-            group = regional.setdefault(
-                region,
-                {"count": 0, "volume": 0, "cities": set()},
-            )
-            group["count"] += 1
-            group["volume"] += atm.monthly_volume or 0
-            if atm.city:
-                group["cities"].add(atm.city)
-
-        regional_analysis = {
-            region: {
-                "count": stats["count"],
-                "volume": stats["volume"],
-                "cities": sorted(stats["cities"]),
-                "avg_volume": stats["volume"] / stats["count"] if stats["count"] else 0,
-            }
-            for region, stats in regional.items()
-        }
+        network = atm_service.network_summary()
 
         performance_trend = [
             {"month": "Jan", "volume": 45000, "roi": 12.5, "new_atms": 2},
@@ -49,68 +24,23 @@ class handler(BaseHTTPRequestHandler):
             {"month": "Jun", "volume": 58000, "roi": 16.1, "new_atms": 2},
         ]
 
-        opportunity_zones = [
-            {
-                "zone": "Casablanca - Maarif Extension",
-                "score": 85,
-                "potential_volume": 1800,
-                "competition_level": "Faible",
-                "priority": "Haute",
-                "region": "Casablanca-Settat",
-            },
-            {
-                "zone": "Rabat - Hay Riad",
-                "score": 78,
-                "potential_volume": 1500,
-                "competition_level": "Moyenne",
-                "priority": "Haute",
-                "region": "Rabat-Salé-Kénitra",
-            },
-            {
-                "zone": "Marrakech - Hivernage",
-                "score": 82,
-                "potential_volume": 1600,
-                "competition_level": "Faible",
-                "priority": "Haute",
-                "region": "Marrakech-Safi",
-            },
-            {
-                "zone": "Tanger - Zone Franche",
-                "score": 76,
-                "potential_volume": 1300,
-                "competition_level": "Moyenne",
-                "priority": "Moyenne",
-                "region": "Tanger-Tétouan-Al Hoceïma",
-            },
-            {
-                "zone": "Agadir - Zone Touristique",
-                "score": 74,
-                "potential_volume": 1200,
-                "competition_level": "Élevée",
-                "priority": "Moyenne",
-                "region": "Souss-Massa",
-            },
-            {
-                "zone": "Fès - Campus Universitaire",
-                "score": 71,
-                "potential_volume": 1000,
-                "competition_level": "Moyenne",
-                "priority": "Faible",
-                "region": "Fès-Meknès",
-            },
-        ]
+        try:
+            opportunity_zones = get_opportunity_zones()
+        except FileNotFoundError:
+            opportunity_zones = []
+
+        try:
+            coverage_rate = get_coverage_rate()
+        except FileNotFoundError:
+            coverage_rate = 0.0
 
         payload = {
             "summary": {
-                "total_atms": total_atms,
-                "total_monthly_volume": total_volume,
-                "average_volume_per_atm": round(avg_volume, 0),
+                **network["summary"],
                 "network_roi": 14.2,
-                "coverage_rate": 78.5,
-                "cities_covered": len({atm.city for atm in atms if atm.city}),
-                "regions_covered": len(regional_analysis),
+                "coverage_rate": coverage_rate,
             },
-            "regional_analysis": regional_analysis,
+            "regional_analysis": network["regional_analysis"],
             "performance_trend": performance_trend,
             "opportunity_zones": opportunity_zones,
             "last_updated": datetime.utcnow().isoformat() + "Z",
@@ -4,22 +4,38 @@ from typing import Any, Dict
 from pydantic import ValidationError
 
 from backend.schemas import ATMData
-from backend.services import atm_service
+from backend.services import atm_service, stream_atms
 
-from ._utils import ensure_service, handle_options, read_json_body, respond_error, respond_json, run_async
+from ._utils import (
+    ensure_service, handle_options, read_json_body, respond_cached, respond_error, respond_json, run_async,
+    wants_ndjson,
+)
 
 
 class handler(BaseHTTPRequestHandler):
+    # Keep-alive + chunked transfer for ?format=ndjson
+    protocol_version = "HTTP/1.1"
+
     def do_OPTIONS(self):
         handle_options(self)
 
     def do_GET(self):
         ensure_service()
-        payload = {
-            "atms": [atm.dict() for atm in atm_service.existing_atms],
-            "total_count": len(atm_service.existing_atms),
-        }
-        respond_json(self, 200, payload)
+        try:
+            ndjson = wants_ndjson(self)
+        except ValueError as exc:
+            respond_error(self, 400, str(exc))
+            return
+        # One snapshot for both the ETag and the body
+        state = atm_service.state
+        if ndjson:
+            respond_cached(self, state.version, lambda: stream_atms(state=state), ndjson=True)
+            return
+
+        def build() -> Dict[str, Any]:
+            return {"atms": [atm.dict() for atm in state.atms], "total_count": len(state)}
+
+        respond_cached(self, state.version, build)
 
     def do_POST(self):
         ensure_service()
@@ -1,17 +1,28 @@
 from http.server import BaseHTTPRequestHandler
 
-from backend.services import get_competitors
+from backend.services import get_competitors, get_dataset_version, stream_competitors
 
-from ._utils import handle_options, respond_error, respond_json
+from ._utils import handle_options, respond_cached, respond_error, wants_ndjson
 
 
 class handler(BaseHTTPRequestHandler):
+    # Keep-alive + chunked transfer for ?format=ndjson
+    protocol_version = "HTTP/1.1"
+
     def do_OPTIONS(self):
         handle_options(self)
 
     def do_GET(self):
         try:
-            competitors = get_competitors()
+            ndjson = wants_ndjson(self)
+        except ValueError as exc:
+            respond_error(self, 400, str(exc))
+            return
+        try:
+            if ndjson:
+                respond_cached(self, get_dataset_version("competitors"), stream_competitors, ndjson=True)
+                return
+            respond_cached(self, get_dataset_version("competitors"), get_competitors)
         except FileNotFoundError as exc:
             respond_error(self, 404, str(exc))
             return
@@ -22,8 +33,6 @@ class handler(BaseHTTPRequestHandler):
             respond_error(self, 500, "Unable to load competitors", [str(exc)])
             return
 
-        respond_json(self, 200, competitors.dict())
-
     def log_message(self, format, *args):
         return
 
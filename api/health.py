@@ -16,6 +16,7 @@ class handler(BaseHTTPRequestHandler):
             "status": "healthy" if atm_service.predictor.is_trained else "degraded",
             "timestamp": datetime.utcnow().isoformat() + "Z",
             "models_loaded": atm_service.predictor.is_trained,
+            "model": atm_service.predictor.load_metrics,
             "atms_count": len(atm_service.existing_atms),
         }
         respond_json(self, 200, payload)
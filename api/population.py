@@ -1,8 +1,42 @@
 from http.server import BaseHTTPRequestHandler
+from typing import Any, Dict
+from urllib.parse import parse_qs, urlparse
 
-from backend.services import get_population
+from backend.services import get_dataset_version, get_population
 
-from ._utils import handle_options, respond_error, respond_json
+from ._utils import handle_options, respond_cached, respond_error
+
+MAX_POPULATION_LIMIT = 5000
+
+
+def _parse_query(path: str) -> Dict[str, Any]:
+    """Same parameters as the FastAPI /population route; ValueError on a missing or invalid one."""
+    params = parse_qs(urlparse(path).query, keep_blank_values=True)
+
+    def first(name: str):
+        return (params.get(name) or [None])[0]
+
+    query: Dict[str, Any] = {}
+    for name in ("s", "n", "w", "e"):
+        raw = first(name)
+        if raw is None:
+            raise ValueError(f"Missing query parameter '{name}'")
+        try:
+            query[name] = float(raw)
+        except ValueError:
+            raise ValueError(f"Parameter '{name}' must be a number") from None
+    for name, default, upper in (("limit", 20, MAX_POPULATION_LIMIT), ("page", 1, None)):
+        raw = first(name)
+        try:
+            value = default if raw is None else int(raw)
+        except ValueError:
+            raise ValueError(f"Parameter '{name}' must be an integer") from None
+        if value < 1 or (upper is not None and value > upper):
+            bounds = f"between 1 and {upper}" if upper is not None else ">= 1"
+            raise ValueError(f"Parameter '{name}' must be {bounds}")
+        query[name] = value
+    query["cursor"] = first("cursor")
+    return query
 
 
 class handler(BaseHTTPRequestHandler):
@@ -11,7 +45,16 @@ class handler(BaseHTTPRequestHandler):
 
     def do_GET(self):
         try:
-            population = get_population()
+            query = _parse_query(self.path)
+        except ValueError as exc:
+            respond_error(self, 400, str(exc))
+            return
+        try:
+            # The ETag covers the dataset version and every query parameter above
+            respond_cached(self, get_dataset_version("population"), lambda: get_population(**query))
+        except ValueError as exc:
+            respond_error(self, 400, str(exc))
+            return
         except FileNotFoundError as exc:
             respond_error(self, 404, str(exc))
             return
@@ -22,8 +65,5 @@ class handler(BaseHTTPRequestHandler):
             respond_error(self, 500, "Unable to load population data", [str(exc)])
             return
 
-        respond_json(self, 200, population.dict())
-
     def log_message(self, format, *args):
         return
-
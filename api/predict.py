@@ -3,6 +3,7 @@ from typing import Any, Dict
 
 from pydantic import ValidationError
 
+from backend.ml_models import ModelNotReadyError
 from backend.schemas import LocationData
 from backend.services import atm_service
 
@@ -28,22 +29,14 @@ class handler(BaseHTTPRequestHandler):
             return
 
         try:
-            prediction = atm_service.predictor.predict_location(location)
-            canibalization = atm_service.canibalization_analyzer.calculate_canibalization(location)
-            adjusted_score = prediction["global_score"] * (1 - canibalization["canibalization_risk"] / 200)
+            response = atm_service.predict(location)
+        except ModelNotReadyError as exc:
+            respond_error(self, 503, str(exc))
+            return
         except Exception as exc:
             respond_error(self, 500, "Failed to generate prediction", [str(exc)])
             return
 
-        response = {
-            "predicted_volume": prediction["predicted_volume"],
-            "roi_probability": prediction["roi_probability"],
-            "roi_prediction": prediction["roi_prediction"],
-            "global_score": round(max(0, adjusted_score), 2),
-            "reason_codes": prediction["reason_codes"],
-            "recommendation": prediction["recommendation"],
-            "canibalization_analysis": canibalization,
-        }
         respond_json(self, 200, response)
 
     def log_message(self, format, *args):
@@ -0,0 +1,50 @@
+from http.server import BaseHTTPRequestHandler
+from typing import Any, List
+
+from pydantic import ValidationError, parse_obj_as
+
+from backend.ml_models import ModelNotReadyError
+from backend.schemas import LocationData
+from backend.services import MAX_PREDICTION_BATCH, atm_service
+
+from ._utils import ensure_service, handle_options, read_json_body, respond_error, respond_json
+
+
+class handler(BaseHTTPRequestHandler):
+    def do_OPTIONS(self):
+        handle_options(self)
+
+    def do_POST(self):
+        ensure_service()
+        try:
+            payload: Any = read_json_body(self)
+        except ValueError as exc:
+            respond_error(self, 400, str(exc))
+            return
+
+        if not isinstance(payload, list):
+            respond_error(self, 400, "Expected a JSON array of locations")
+            return
+        if len(payload) > MAX_PREDICTION_BATCH:
+            respond_error(self, 413, f"Batch too large: max {MAX_PREDICTION_BATCH} locations")
+            return
+
+        try:
+            locations: List[LocationData] = parse_obj_as(List[LocationData], payload)
+        except ValidationError as exc:
+            respond_error(self, 400, "Invalid payload", exc.errors())
+            return
+
+        try:
+            predictions = atm_service.predict_batch(locations)
+        except ModelNotReadyError as exc:
+            respond_error(self, 503, str(exc))
+            return
+        except Exception as exc:
+            respond_error(self, 500, "Failed to generate predictions", [str(exc)])
+            return
+
+        respond_json(self, 200, {"predictions": predictions, "total_count": len(predictions)})
+
+    def log_message(self, format, *args):
+        return
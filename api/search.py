@@ -0,0 +1,46 @@
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
+
+from backend.services import MAX_SEARCH_LIMIT, atm_service, search_communes, search_competitors
+
+from ._utils import ensure_service, handle_options, respond_error, respond_json
+
+
+class handler(BaseHTTPRequestHandler):
+    def do_OPTIONS(self):
+        handle_options(self)
+
+    def do_GET(self):
+        params = parse_qs(urlparse(self.path).query)
+        query = (params.get("q") or [""])[0].strip()
+        if not query:
+            respond_error(self, 400, "Missing query parameter 'q'")
+            return
+        try:
+            limit = int((params.get("limit") or ["10"])[0])
+        except ValueError:
+            respond_error(self, 400, "Parameter 'limit' must be an integer")
+            return
+        if not 1 <= limit <= MAX_SEARCH_LIMIT:
+            respond_error(self, 400, f"Parameter 'limit' must be between 1 and {MAX_SEARCH_LIMIT}")
+            return
+
+        ensure_service()
+        try:
+            payload = {
+                "query": query,
+                "communes": search_communes(query, limit),
+                "atms": atm_service.search_atms(query, limit),
+                "competitors": search_competitors(query, limit),
+            }
+        except FileNotFoundError as exc:
+            respond_error(self, 404, str(exc))
+            return
+        except Exception as exc:
+            respond_error(self, 500, "Search failed", [str(exc)])
+            return
+
+        respond_json(self, 200, payload)
+
+    def log_message(self, format, *args):
+        return
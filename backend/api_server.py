@@ -8,25 +8,37 @@ from datetime import datetime
 import logging
 import time
 import uuid
-from typing import Any, Optional
+from typing import Any, Callable, Iterator, List, Optional, Union
 
-from fastapi import Depends, FastAPI, HTTPException, Query, Request
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 
+from atm_state import ATMState
 from config import settings
+from data_generation import pinned
+from http_cache import etag_matches, make_etag
 from logging_config import setup_logging
 from schemas import (
-    ATMData, ATMListResponse, DashboardResponse, DashboardSummary,
-    LocationData, OpportunityZone, PerformanceTrend, PredictionResponse, RegionalAnalysis,
+    ATMData, ATMListResponse, BatchPredictionResponse, DashboardResponse, DashboardSummary,
+    GeoPoint, LocationData, OpportunityZone, PerformanceTrend, PredictionResponse, RegionalAnalysis,
     CompetitorListResponse, PopulationListResponse, POIListResponse,
-    TransportListResponse,
+    TransportListResponse, PlacementRequest, PlacementResponse,
 )
+from ml_models import ModelNotReadyError
 from services import (
-    ATMService, atm_service, clear_data_caches, get_competitors,
+    MAX_PREDICTION_BATCH, MAX_RESOLVE_BATCH, ATMService, atm_service, data_reloader, dump_json, get_competitors,
     get_population, get_pois, get_transport,
-    get_commune_indicators,
-    get_commune_feature, get_commune_indicators_by_name_or_code, _load_communes_geojson,
+    get_commune_indicators, get_commune_indicators_batch, get_commune_scores, parse_weight_profile,
+    get_commune_feature, get_commune_indicators_by_name_or_code, get_communes_geojson_bytes,
+    MAX_SEARCH_LIMIT, search_communes, search_competitors, get_clusters, get_tile, get_dataset_version,
+    NDJSON_MEDIA_TYPE, stream_atms, stream_competitors, MAX_HEX_RES, get_hexbins, get_opportunity_zones,
+    MAX_PLACEMENT_CANDIDATES, placement_candidates, get_coverage_rate, get_network_coverage, parse_coverage_bands,
+    prebuild_layers,
 )
+from tiles import MVT_MEDIA_TYPE
+
 # --------- Logging setup ----------
 setup_logging()
 logger = logging.getLogger(__name__)
@@ -59,6 +71,54 @@ async def log_requests(request: Request, call_next):
     adapter.info(f"Request finished: {response.status_code} in {process_time:.2f}ms")
     return response
 
+# --------- Data generation ----------
+@app.middleware("http")
+async def pin_data_generation(request: Request, call_next):
+    """Every dataset read during a request comes from the same published data generation."""
+    with pinned():
+        return await call_next(request)
+
+# --------- Pre-encoded JSON ----------
+def json_response(payload: Any) -> Response:
+    """Returns a payload built column-wise by the services, skipping response_model re-validation."""
+    return Response(content=dump_json(payload), media_type="application/json")
+
+# --------- Conditional GET ----------
+def cached_response(request: Request, layer: str, build: Callable[[], Union[bytes, Iterator[bytes]]],
+                    media_type: str = "application/json", version: Optional[str] = None) -> Response:
+    """
+    Strong ETag from the layer's dataset version + path + query parameters.
+    A matching If-None-Match gets a 304 without building the body.
+    `build` may return the body or an iterator of chunks (streamed).
+    `version` overrides the layer lookup when the caller already holds the
+    snapshot the body is built from.
+    """
+    if version is None:
+        version = get_dataset_version(layer)
+    etag = make_etag(version, request.url.path, request.query_params.multi_items())
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    body = build()
+    if isinstance(body, bytes):
+        return Response(content=body, media_type=media_type, headers=headers)
+    return StreamingResponse(body, media_type=media_type, headers=headers)
+
+
+def atm_snapshot(layer: str) -> Optional[ATMState]:
+    """
+    For the 'atms' layer, the ATM state read once so that the ETag and the
+    body come from the same snapshot (None for the other layers).
+    """
+    return atm_service.state if layer == "atms" else None
+
+
+def dump_format(value: str) -> str:
+    """Validates the ?format= of full-layer dumps (json | ndjson)."""
+    if value not in ("json", "ndjson"):
+        raise HTTPException(status_code=400, detail=f"Unknown format '{value}' (expected: json, ndjson)")
+    return value
+
 # --------- DI ----------
 def get_atm_service() -> ATMService:
     return atm_service
@@ -68,14 +128,24 @@ def get_atm_service() -> ATMService:
 async def startup_event():
     logger.info("Starting Saham Bank Geomarketing API")
     await atm_service.initialize()
-    clear_data_caches()
+    # Map pyramids, commune topology and the dashboard's opportunity surface
+    # built off the event loop, before the first request
+    await asyncio.to_thread(prebuild_layers)
+    try:
+        await asyncio.to_thread(get_opportunity_zones)
+    except FileNotFoundError as e:
+        logger.warning("Surface d'opportunité indisponible: %s", e)
     asyncio.create_task(periodic_update_task())
     logger.info("API ready!")
 
 async def periodic_update_task():
+    """Polls DATA_DIR and republishes only the datasets whose source files changed."""
     while True:
-        await asyncio.sleep(1800)
-        await atm_service.simulate_external_updates()
+        await asyncio.sleep(settings.DATA_RELOAD_INTERVAL_S)
+        try:
+            await data_reloader.reload()
+        except Exception as e:
+            logger.error("Rechargement des données échoué (génération précédente conservée): %s", e, exc_info=True)
 
 # --------- Endpoints ----------
 @app.get("/", tags=["Monitoring"])
@@ -88,6 +158,7 @@ async def health_check(service: ATMService = Depends(get_atm_service)):
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
         "models_loaded": service.predictor.is_trained,
+        "model": service.predictor.load_metrics,
         "atms_count": len(service.existing_atms),
     }
 
@@ -95,27 +166,67 @@ async def health_check(service: ATMService = Depends(get_atm_service)):
 @app.post("/predict", response_model=PredictionResponse, tags=["Predictions"])
 async def predict_location(location: LocationData, service: ATMService = Depends(get_atm_service)):
     try:
-        prediction = service.predictor.predict_location(location)
-        canib = service.canibalization_analyzer.calculate_canibalization(location)
-        adjusted_score = prediction["global_score"] * (1 - canib["canibalization_risk"] / 200)
-        return PredictionResponse(
-            predicted_volume=prediction["predicted_volume"],
-            roi_probability=prediction["roi_probability"],
-            roi_prediction=prediction["roi_prediction"],
-            global_score=round(max(0, adjusted_score), 2),
-            reason_codes=prediction["reason_codes"],
-            recommendation=prediction["recommendation"],
-            canibalization_analysis=canib,
-        )
+        return PredictionResponse(**service.predict(location))
+    except ModelNotReadyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=f"Invalid input for prediction: {e}")
     except Exception as e:
         logger.error("Error during prediction", extra={"error": str(e)}, exc_info=True)
         raise HTTPException(status_code=500, detail="Internal error during prediction.")
 
+@app.post("/predict/batch", response_model=BatchPredictionResponse, tags=["Predictions"])
+async def predict_locations(locations: List[LocationData], service: ATMService = Depends(get_atm_service)):
+    if len(locations) > MAX_PREDICTION_BATCH:
+        raise HTTPException(status_code=413, detail=f"Batch too large: max {MAX_PREDICTION_BATCH} locations.")
+    try:
+        results = service.predict_batch(locations)
+        return BatchPredictionResponse(
+            predictions=[PredictionResponse(**r) for r in results],
+            total_count=len(results),
+        )
+    except ModelNotReadyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid input for prediction: {e}")
+    except Exception as e:
+        logger.error("Error during batch prediction", extra={"error": str(e)}, exc_info=True)
+        raise HTTPException(status_code=500, detail="Internal error during batch prediction.")
+
+@app.post("/optimize/placement", response_model=PlacementResponse, tags=["Predictions"])
+async def optimize_placement(body: PlacementRequest, service: ATMService = Depends(get_atm_service)):
+    if body.candidates is None and not body.bbox:
+        raise HTTPException(status_code=400, detail="Provide either 'candidates' or 'bbox'.")
+    if body.candidates is not None and len(body.candidates) > MAX_PLACEMENT_CANDIDATES:
+        raise HTTPException(status_code=413, detail=f"Too many candidates: max {MAX_PLACEMENT_CANDIDATES}.")
+    try:
+        candidates = body.candidates if body.candidates is not None else placement_candidates(body.bbox)
+        return PlacementResponse(**service.optimize_placement(candidates, body.k, body.deadline_ms))
+    except ModelNotReadyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error("Error during placement optimization", extra={"error": str(e)}, exc_info=True)
+        raise HTTPException(status_code=500, detail="Internal error during placement optimization.")
+
 @app.get("/atms", response_model=ATMListResponse, tags=["ATM Management"])
-async def get_existing_atms(service: ATMService = Depends(get_atm_service)):
-    return ATMListResponse(atms=service.existing_atms, total_count=len(service.existing_atms))
+async def get_existing_atms(
+    request: Request,
+    format: str = Query("json", description="json | ndjson (one ATM per line, streamed)"),
+    service: ATMService = Depends(get_atm_service),
+):
+    # One snapshot for both the ETag and the body, even if an ATM is added meanwhile
+    state = service.state
+    if dump_format(format) == "ndjson":
+        return cached_response(request, "atms", lambda: stream_atms(state=state),
+                               media_type=NDJSON_MEDIA_TYPE, version=state.version)
+
+    def build() -> bytes:
+        return dump_json({"atms": [atm.dict() for atm in state.atms], "total_count": len(state)})
+    return cached_response(request, "atms", build, version=state.version)
 
 @app.post("/atms", response_model=ATMData, tags=["ATM Management"])
 async def add_atm(atm: ATMData, service: ATMService = Depends(get_atm_service)):
@@ -123,23 +234,7 @@ async def add_atm(atm: ATMData, service: ATMService = Depends(get_atm_service)):
 
 @app.get("/analytics/dashboard", response_model=DashboardResponse, tags=["Analytics"])
 async def get_dashboard_data(service: ATMService = Depends(get_atm_service)):
-    atms = service.existing_atms
-    total_atms = len(atms)
-    total_volume = sum(atm.monthly_volume for atm in atms if atm.monthly_volume is not None)
-    avg_volume = total_volume / total_atms if total_atms > 0 else 0
-
-    regional_analysis_data: dict[str, Any] = {}
-    for atm in atms:
-        region = atm.region or "Unknown"
-        if region not in regional_analysis_data:
-            regional_analysis_data[region] = {"count": 0, "volume": 0, "cities": set()}
-        regional_analysis_data[region]["count"] += 1
-        regional_analysis_data[region]["volume"] += atm.monthly_volume or 0
-        regional_analysis_data[region]["cities"].add(atm.city or "Unknown")
-
-    for region_data in regional_analysis_data.values():
-        region_data["cities"] = list(region_data["cities"])
-        region_data["avg_volume"] = region_data["volume"] / region_data["count"]
+    network = service.network_summary()
 
     performance_data = [
         {"month": "Jan", "volume": 45000, "roi": 12.5, "new_atms": 2},
@@ -150,34 +245,57 @@ async def get_dashboard_data(service: ATMService = Depends(get_atm_service)):
         {"month": "Jun", "volume": 58000, "roi": 16.1, "new_atms": 2},
     ]
 
-    opportunity_zones = [
-        {"zone": "Casablanca - Maarif Extension", "score": 85, "potential_volume": 1800,
-         "competition_level": "Faible", "priority": "Haute", "region": "Casablanca-Settat"},
-        {"zone": "Rabat - Hay Riad", "score": 78, "potential_volume": 1500,
-         "competition_level": "Moyenne", "priority": "Haute", "region": "Rabat-Salé-Kénitra"},
-    ]
+    try:
+        opportunity_zones = await run_in_threadpool(get_opportunity_zones)
+    except FileNotFoundError as e:
+        logger.warning("Surface d'opportunité indisponible: %s", e)
+        opportunity_zones = []
+
+    try:
+        coverage_rate = get_coverage_rate()
+    except FileNotFoundError as e:
+        logger.warning("Couverture du réseau indisponible: %s", e)
+        coverage_rate = 0.0
 
     return DashboardResponse(
-        summary=DashboardSummary(
-            total_atms=total_atms,
-            total_monthly_volume=total_volume,
-            average_volume_per_atm=round(avg_volume, 0),
-            network_roi=14.2,
-            coverage_rate=78.5,
-            cities_covered=len(set(atm.city for atm in atms if atm.city)),
-            regions_covered=len(regional_analysis_data),
-        ),
-        regional_analysis={k: RegionalAnalysis(**v) for k, v in regional_analysis_data.items()},
+        summary=DashboardSummary(**network["summary"], network_roi=14.2, coverage_rate=coverage_rate),
+        regional_analysis={k: RegionalAnalysis(**v) for k, v in network["regional_analysis"].items()},
         performance_trend=[PerformanceTrend(**p) for p in performance_data],
         opportunity_zones=[OpportunityZone(**o) for o in opportunity_zones],
         last_updated=datetime.now().isoformat(),
     )
 
+@app.get("/analytics/coverage", tags=["Analytics"])
+async def get_network_coverage_report(
+    bands: Optional[str] = Query(None, description="distances in km, e.g. 1,2,5,10 (defaults to COVERAGE_BANDS_KM)"),
+):
+    """
+    Density-weighted coverage within each distance band of an ATM: network,
+    regions and communes. Each commune centroid weighs its 'densite'
+    (inhabitants per km²), so shares are density-weighted and the `weight`
+    fields are sums of densities, not head counts.
+    """
+    try:
+        return json_response(get_network_coverage(parse_coverage_bands(bands)))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        logger.error("Erreur /analytics/coverage: %s", e, exc_info=True)
+        raise HTTPException(status_code=500, detail="Erreur interne lors du calcul de la couverture")
+
 # ---------- Layers ----------
 @app.get("/competitors", response_model=CompetitorListResponse, tags=["Layers"])
-async def list_competitors():
+async def list_competitors(
+    request: Request,
+    format: str = Query("json", description="json | ndjson (one competitor per line, streamed)"),
+):
+    fmt = dump_format(format)
     try:
-        return get_competitors()
+        if fmt == "ndjson":
+            return cached_response(request, "competitors", stream_competitors, media_type=NDJSON_MEDIA_TYPE)
+        return cached_response(request, "competitors", lambda: dump_json(get_competitors()))
     except FileNotFoundError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except KeyError as e:
@@ -188,15 +306,20 @@ async def list_competitors():
 
 @app.get("/population", response_model=PopulationListResponse, tags=["Layers"])
 async def list_population(
+    request: Request,
     s: float = Query(..., description="south"),
     n: float = Query(..., description="north"),
     w: float = Query(..., description="west"),
     e: float = Query(..., description="east"),
     limit: int = Query(20, ge=1, le=5000),
     page: int = Query(1, ge=1),
+    cursor: Optional[str] = Query(None, description="keyset cursor ('' = first page, then next_cursor); ignores page"),
 ):
     try:
-        return get_population(s=s, n=n, w=w, e=e, limit=limit, page=page)
+        return cached_response(request, "population", lambda: dump_json(
+            get_population(s=s, n=n, w=w, e=e, limit=limit, page=page, cursor=cursor)))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except FileNotFoundError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except KeyError as e:
@@ -207,15 +330,20 @@ async def list_population(
 
 @app.get("/pois", response_model=POIListResponse, tags=["Layers"])
 async def list_pois(
+    request: Request,
     s: float = Query(..., description="south"),
     n: float = Query(..., description="north"),
     w: float = Query(..., description="west"),
     e: float = Query(..., description="east"),
     limit: int = Query(300, ge=1, le=5000),
     page: int = Query(1, ge=1),
+    cursor: Optional[str] = Query(None, description="keyset cursor ('' = first page, then next_cursor); ignores page"),
 ):
     try:
-        return get_pois(s=s, n=n, w=w, e=e, limit=limit, page=page)
+        return cached_response(request, "pois", lambda: dump_json(
+            get_pois(s=s, n=n, w=w, e=e, limit=limit, page=page, cursor=cursor)))
+    except ValueError as ex:
+        raise HTTPException(status_code=400, detail=str(ex))
     except FileNotFoundError as ex:
         raise HTTPException(status_code=404, detail=str(ex))
     except KeyError as ex:
@@ -226,17 +354,88 @@ async def list_pois(
 
 
 
+@app.get("/clusters/{layer}", tags=["Layers"])
+async def list_clusters(
+    request: Request,
+    layer: str,
+    s: float = Query(..., description="south"),
+    n: float = Query(..., description="north"),
+    w: float = Query(..., description="west"),
+    e: float = Query(..., description="east"),
+    zoom: int = Query(..., ge=0, le=22),
+):
+    """Clusters précalculés (atms | competitors) visibles dans la bbox au zoom donné."""
+    try:
+        state = atm_snapshot(layer)
+        return cached_response(request, layer,
+                               lambda: dump_json(get_clusters(layer, s=s, n=n, w=w, e=e, zoom=zoom, state=state)),
+                               version=state and state.version)
+    except KeyError as ex:
+        raise HTTPException(status_code=404, detail=str(ex))
+    except FileNotFoundError as ex:
+        raise HTTPException(status_code=404, detail=str(ex))
+    except Exception as ex:
+        logger.error("Erreur /clusters/%s: %s", layer, ex, exc_info=True)
+        raise HTTPException(status_code=500, detail="Erreur interne lors du calcul des clusters")
+
+
+@app.get("/hexbins/{layer}", tags=["Layers"])
+async def list_hexbins(
+    request: Request,
+    layer: str,
+    res: int = Query(..., ge=0, le=MAX_HEX_RES, description="résolution (≈ zoom de la carte)"),
+    bbox: Optional[str] = Query(None, description="ouest,sud,est,nord (absent = tout)"),
+):
+    """Effectifs et sommes par hexagone (atms | competitors | pois | transport | population)."""
+    try:
+        state = atm_snapshot(layer)
+        return cached_response(request, layer, lambda: dump_json(get_hexbins(layer, res, bbox, state=state)),
+                               version=state and state.version)
+    except KeyError as ex:
+        raise HTTPException(status_code=404, detail=str(ex))
+    except ValueError as ex:
+        raise HTTPException(status_code=400, detail=str(ex))
+    except FileNotFoundError as ex:
+        raise HTTPException(status_code=404, detail=str(ex))
+    except Exception as ex:
+        logger.error("Erreur /hexbins/%s: %s", layer, ex, exc_info=True)
+        raise HTTPException(status_code=500, detail="Erreur interne lors du calcul des hexbins")
+
+
+@app.get("/tiles/{layer}/{z}/{x}/{y}.mvt", tags=["Layers"])
+async def vector_tile(request: Request, layer: str, z: int, x: int, y: int):
+    """Tuile vectorielle Mapbox (pois | transport | population | atms)."""
+    try:
+        state = atm_snapshot(layer)
+        return cached_response(request, layer, lambda: get_tile(layer, z, x, y, state=state),
+                               media_type=MVT_MEDIA_TYPE, version=state and state.version)
+    except KeyError as ex:
+        raise HTTPException(status_code=404, detail=str(ex))
+    except ValueError as ex:
+        raise HTTPException(status_code=400, detail=str(ex))
+    except FileNotFoundError as ex:
+        raise HTTPException(status_code=404, detail=str(ex))
+    except Exception as ex:
+        logger.error("Erreur /tiles/%s/%s/%s/%s: %s", layer, z, x, y, ex, exc_info=True)
+        raise HTTPException(status_code=500, detail="Erreur interne lors de la génération de la tuile")
+
+
 @app.get("/transport", response_model=TransportListResponse, tags=["Layers"])
 async def list_transport(
+    request: Request,
     s: float = Query(..., description="south"),
     n: float = Query(..., description="north"),
     w: float = Query(..., description="west"),
     e: float = Query(..., description="east"),
     limit: int = Query(300, ge=1, le=5000),
     page: int = Query(1, ge=1),
+    cursor: Optional[str] = Query(None, description="keyset cursor ('' = first page, then next_cursor); ignores page"),
 ):
     try:
-        return get_transport(s=s, n=n, w=w, e=e, limit=limit, page=page)
+        return cached_response(request, "transport", lambda: dump_json(
+            get_transport(s=s, n=n, w=w, e=e, limit=limit, page=page, cursor=cursor)))
+    except ValueError as ex:
+        raise HTTPException(status_code=400, detail=str(ex))
     except FileNotFoundError as ex:
         raise HTTPException(status_code=404, detail=str(ex))
     except KeyError as ex:
@@ -247,10 +446,15 @@ async def list_transport(
 
 # ---------- Communes: GeoJSON ----------
 @app.get("/communes/geojson", tags=["Communes"])
-async def communes_geojson():
+async def communes_geojson(
+    request: Request,
+    zoom: Optional[int] = Query(None, ge=0, le=22, description="Simplification pour ce zoom (absent = pleine résolution)"),
+    format: str = Query("geo", description="geo (GeoJSON) | topo (TopoJSON quantifié)"),
+):
     try:
-        gj = _load_communes_geojson()
-        return gj
+        return cached_response(request, "communes", lambda: get_communes_geojson_bytes(zoom, format))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -288,6 +492,58 @@ async def communes_indicators(
         logger.error("Erreur /communes/indicators: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail="Erreur interne lors du calcul des indicateurs")
 
+@app.get("/search", tags=["Search"])
+async def search(
+    q: str = Query(..., min_length=1, description="Nom (insensible aux accents), préfixe ou approché"),
+    limit: int = Query(10, ge=1, le=MAX_SEARCH_LIMIT, description="Résultats max par type"),
+    service: ATMService = Depends(get_atm_service),
+):
+    """Recherche communes, ATMs et concurrents par nom / code."""
+    try:
+        return json_response({
+            "query": q,
+            "communes": search_communes(q, limit),
+            "atms": service.search_atms(q, limit),
+            "competitors": search_competitors(q, limit),
+        })
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        logger.error("Erreur /search: %s", e, exc_info=True)
+        raise HTTPException(status_code=500, detail="Erreur interne lors de la recherche")
+
+@app.get("/communes/scores", tags=["Scoring"])
+async def communes_scores(
+    weights: Optional[str] = Query(None, description="e.g. population:0.3,transport:0.2 (defaults to DEFAULT_WEIGHTS)"),
+    top: int = Query(20, ge=1, le=5000),
+    region: Optional[str] = Query(None),
+):
+    try:
+        profile = parse_weight_profile(weights)
+        return json_response(get_commune_scores(profile, top=top, region=region))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        logger.error("Erreur /communes/scores: %s", e, exc_info=True)
+        raise HTTPException(status_code=500, detail="Erreur interne lors du calcul des scores")
+
+@app.post("/communes/indicators/batch", tags=["Scoring"])
+async def communes_indicators_batch(points: List[GeoPoint]) -> list[dict[str, Any]]:
+    """Resolves each point to its commune (polygon first, nearest centroid outside all polygons)."""
+    if len(points) > MAX_RESOLVE_BATCH:
+        raise HTTPException(status_code=413, detail=f"Batch too large: max {MAX_RESOLVE_BATCH} points.")
+    try:
+        return get_commune_indicators_batch(
+            [p.latitude for p in points], [p.longitude for p in points]
+        )
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        logger.error("Erreur /communes/indicators/batch: %s", e, exc_info=True)
+        raise HTTPException(status_code=500, detail="Erreur interne lors du calcul des indicateurs")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("backend.api_server:app", host="0.0.0.0", port=8000, reload=True)
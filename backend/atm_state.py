@@ -0,0 +1,85 @@
+"""
+État du réseau d'ATMs en instantanés immuables (copy-on-write).
+
+Un ATMState regroupe la liste des ATMs et tout ce qui en dérive
+(analyseur de cannibalisation, index de noms et de plus proche voisin,
+agrégats du tableau de bord, jeton de version). Il n'est plus modifié une
+fois publié : un lecteur prend l'état courant d'une seule lecture
+d'attribut et s'en sert sans verrou, même si un ajout est publié pendant
+ce temps. Un ajout construit l'état suivant (copie des index puis
+insertion, with_atm) et ATMService le publie par une seule affectation.
+Les structures rarement lues (clusters, tuiles, hexbins, couverture) sont
+calculées au premier appel et mémorisées sur l'état (derived).
+"""
+
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, Hashable, Iterable, Tuple
+
+from ml_models import CanibalizationAnalyzer
+from name_index import NameIndex
+from network_stats import NetworkAggregates
+from schemas import ATMData
+from spatial_index import NearestIndex
+
+
+def atm_names(atm: ATMData) -> Tuple[Any, ...]:
+    """Noms sous lesquels un ATM est cherchable."""
+    return atm.id, atm.bank_name, atm.city
+
+
+class ATMState:
+    """Instantané immuable du réseau : ATMs (tuple) et structures dérivées, pour un jeton de version."""
+
+    def __init__(self, atms: Tuple[ATMData, ...], version: str, analyzer: CanibalizationAnalyzer,
+                 names: NameIndex, aggregates: NetworkAggregates, points: NearestIndex,
+                 ids: Dict[str, int]):
+        self.atms = atms
+        self.version = version
+        self.analyzer = analyzer
+        self.names = names
+        self.aggregates = aggregates
+        self.points = points
+        self.ids = ids
+        self._derived: Dict[Hashable, Any] = {}
+
+    def __len__(self) -> int:
+        return len(self.atms)
+
+    @classmethod
+    def build(cls, atms: Iterable[ATMData], version: str) -> "ATMState":
+        """État construit d'un bloc à partir d'une liste d'ATMs."""
+        atms = tuple(atms)
+        analyzer = CanibalizationAnalyzer()
+        names = NameIndex()
+        for pos, atm in enumerate(atms):
+            analyzer.add_existing_atm(atm)
+            names.add(pos, *atm_names(atm))
+        points = NearestIndex([a.latitude for a in atms], [a.longitude for a in atms])
+        ids = {atm.id: pos for pos, atm in enumerate(atms)}
+        return cls(atms, version, analyzer, names, NetworkAggregates(atms), points, ids)
+
+    def with_atm(self, atm: ATMData, version: str) -> "ATMState":
+        """État suivant avec `atm` ajouté ; celui-ci reste inchangé."""
+        pos = len(self.atms)
+        analyzer = self.analyzer.copy()
+        analyzer.add_existing_atm(atm)
+        names = self.names.copy()
+        names.add(pos, *atm_names(atm))
+        aggregates = self.aggregates.copy()
+        aggregates.add(atm)
+        points = self.points.copy()
+        points.add(atm.latitude, atm.longitude)
+        nxt = ATMState(self.atms + (atm,), version, analyzer, names, aggregates, points, {**self.ids, atm.id: pos})
+        # La couverture se met à jour sans recalcul (distance min. au nouveau site)
+        for key, value in list(self._derived.items()):
+            if isinstance(key, tuple) and key[0] == "coverage":
+                nxt._derived[key] = value.with_site(atm.latitude, atm.longitude)
+        return nxt
+
+    def derived(self, key: Hashable, build: Callable[[], Any]) -> Any:
+        """Valeur dérivée de cet état, calculée au premier appel (un calcul concurrent est sans effet)."""
+        value = self._derived.get(key)
+        if value is None:
+            value = self._derived.setdefault(key, build())
+        return value
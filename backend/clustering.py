@@ -0,0 +1,158 @@
+"""
+Clustering hiérarchique de points par niveau de zoom (Web Mercator).
+
+À chaque zoom z, le monde est découpé en cellules de CLUSTER_CELL_PX pixels
+(tuiles de 256 px) : 2**(z + CELL_SHIFT) cellules par axe. Les grilles sont
+emboîtées, si bien que le niveau z se déduit du niveau z+1 en regroupant
+les cellules par 2x2 ; toute la pyramide 0..MAX_ZOOM est calculée une fois
+au chargement. Chaque cluster porte son effectif, son barycentre et la
+répartition par banque.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+MAX_ZOOM = 18
+# Cellules de 64 px : 256 / 64 = 4 = 2**2 cellules par tuile et par axe
+CLUSTER_CELL_PX = 64
+CELL_SHIFT = 2
+# Latitude max représentable en Web Mercator
+MAX_MERCATOR_LAT = 85.05112878
+
+_GRID_BITS = MAX_ZOOM + CELL_SHIFT
+
+
+def mercator_xy(lats: np.ndarray, lngs: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Coordonnées Web Mercator normalisées [0..1) (x vers l'est, y vers le sud)."""
+    lat = np.radians(np.clip(lats, -MAX_MERCATOR_LAT, MAX_MERCATOR_LAT))
+    x = (np.asarray(lngs, dtype=np.float64) + 180.0) / 360.0
+    y = 0.5 - np.log(np.tan(np.pi / 4 + lat / 2)) / (2 * np.pi)
+    eps = 1e-12
+    return np.clip(x, 0.0, 1.0 - eps), np.clip(y, 0.0, 1.0 - eps)
+
+
+class _Level:
+    """Clusters d'un niveau de zoom (tableaux alignés, triés par cellule)."""
+
+    __slots__ = ("cx", "cy", "count", "sum_lat", "sum_lng", "first",
+                 "pair_cell", "pair_bank", "pair_count")
+
+    def __init__(self, cx, cy, count, sum_lat, sum_lng, first, pair_cell, pair_bank, pair_count):
+        self.cx, self.cy = cx, cy
+        self.count, self.sum_lat, self.sum_lng, self.first = count, sum_lat, sum_lng, first
+        # Répartition par banque, creuse : (indice du cluster, banque, effectif)
+        self.pair_cell, self.pair_bank, self.pair_count = pair_cell, pair_bank, pair_count
+
+    def __len__(self) -> int:
+        return len(self.count)
+
+
+def _aggregate(cx: np.ndarray, cy: np.ndarray, count: np.ndarray, sum_lat: np.ndarray,
+               sum_lng: np.ndarray, first: np.ndarray, pair_cell: np.ndarray,
+               pair_bank: np.ndarray, pair_count: np.ndarray, n_banks: int) -> _Level:
+    """Regroupe des éléments (points ou clusters) par cellule (cx, cy)."""
+    keys = (cx.astype(np.int64) << _GRID_BITS) | cy.astype(np.int64)
+    cells, inv = np.unique(keys, return_inverse=True)
+    m = len(cells)
+
+    out_first = np.full(m, np.iinfo(np.int64).max, dtype=np.int64)
+    np.minimum.at(out_first, inv, first)
+
+    pair_keys = inv[pair_cell].astype(np.int64) * n_banks + pair_bank
+    pairs, pinv = np.unique(pair_keys, return_inverse=True)
+
+    return _Level(
+        cx=(cells >> _GRID_BITS).astype(np.int64),
+        cy=(cells & ((1 << _GRID_BITS) - 1)).astype(np.int64),
+        count=np.bincount(inv, weights=count, minlength=m).astype(np.int64),
+        sum_lat=np.bincount(inv, weights=sum_lat, minlength=m),
+        sum_lng=np.bincount(inv, weights=sum_lng, minlength=m),
+        first=out_first,
+        pair_cell=pairs // n_banks,
+        pair_bank=pairs % n_banks,
+        pair_count=np.bincount(pinv, weights=pair_count, minlength=len(pairs)).astype(np.int64),
+    )
+
+
+class ClusterPyramid:
+    """Clusters précalculés d'une couche de points pour les zooms 0..MAX_ZOOM."""
+
+    def __init__(self, lats: Sequence[float], lngs: Sequence[float],
+                 banks: Sequence[Any], ids: Optional[Sequence[Any]] = None):
+        lats = np.asarray(lats, dtype=np.float64)
+        lngs = np.asarray(lngs, dtype=np.float64)
+        self.ids: List[Any] = list(ids) if ids is not None else list(range(len(lats)))
+
+        bank_names, bank_codes = np.unique(
+            np.array([str(b) if b not in (None, "") else "Inconnue" for b in banks], dtype=object),
+            return_inverse=True,
+        )
+        self.bank_names: List[str] = bank_names.tolist()
+        n_banks = max(len(self.bank_names), 1)
+
+        self.levels: List[Optional[_Level]] = [None] * (MAX_ZOOM + 1)
+        if len(lats) == 0:
+            empty = np.empty(0, dtype=np.int64)
+            for z in range(MAX_ZOOM + 1):
+                self.levels[z] = _Level(empty, empty, empty, empty.astype(float), empty.astype(float),
+                                        empty, empty, empty, empty)
+            return
+
+        x, y = mercator_xy(lats, lngs)
+        size = float(1 << _GRID_BITS)
+        n = len(lats)
+        positions = np.arange(n, dtype=np.int64)
+
+        level = _aggregate(
+            (x * size).astype(np.int64), (y * size).astype(np.int64),
+            np.ones(n), lats, lngs, positions,
+            positions, bank_codes.astype(np.int64), np.ones(n), n_banks,
+        )
+        self.levels[MAX_ZOOM] = level
+        for z in range(MAX_ZOOM - 1, -1, -1):
+            level = _aggregate(
+                level.cx >> 1, level.cy >> 1, level.count, level.sum_lat, level.sum_lng, level.first,
+                level.pair_cell, level.pair_bank, level.pair_count, n_banks,
+            )
+            self.levels[z] = level
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def query(self, *, s: float, n: float, w: float, e: float, zoom: int) -> List[Dict[str, Any]]:
+        """Clusters du zoom `zoom` (borné à 0..MAX_ZOOM) dont le barycentre est dans la bbox."""
+        z = min(max(int(zoom), 0), MAX_ZOOM)
+        level = self.levels[z]
+        if not len(level):
+            return []
+
+        lat = level.sum_lat / level.count
+        lng = level.sum_lng / level.count
+        in_lng = (lng >= w) & (lng <= e) if w <= e else (lng >= w) | (lng <= e)
+        sel = np.flatnonzero((lat >= s) & (lat <= n) & in_lng)
+        if not sel.size:
+            return []
+
+        # Répartition par banque des clusters retenus (paires triées par cluster)
+        starts = np.searchsorted(level.pair_cell, sel, side="left")
+        ends = np.searchsorted(level.pair_cell, sel, side="right")
+        bank_names = self.bank_names
+        pair_bank = level.pair_bank.tolist()
+        pair_count = level.pair_count.tolist()
+
+        clusters = []
+        for i, a, b in zip(sel.tolist(), starts.tolist(), ends.tolist()):
+            count = int(level.count[i])
+            clusters.append({
+                "id": f"{z}/{int(level.cx[i])}/{int(level.cy[i])}",
+                "latitude": float(lat[i]),
+                "longitude": float(lng[i]),
+                "count": count,
+                "banks": {bank_names[pair_bank[k]]: pair_count[k] for k in range(a, b)},
+                "point_id": self.ids[int(level.first[i])] if count == 1 else None,
+            })
+        return clusters
+
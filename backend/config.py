@@ -8,6 +8,8 @@ class Settings(BaseSettings):
     """Manages application settings loaded from environment variables."""
     # Example: ALLOWED_ORIGINS="http://localhost:3000,https://my-prod-frontend.com"
     ALLOWED_ORIGINS: str = "*"
+    # Interval (seconds) between checks of the data files for changes
+    DATA_RELOAD_INTERVAL_S: int = 60
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,105 @@
+"""
+Couverture du réseau pondérée par la densité de population.
+
+Chaque centroïde de commune du master est rattaché à l'ATM du réseau le
+plus proche (haversine, NearestIndex) et pèse sa densité ('densite',
+0 si absente). La couverture à d km est la part de ce poids dont l'ATM le
+plus proche est à moins de d km, globalement, par région et par commune.
+'densite' est en habitants/km², pas un effectif : les parts sont pondérées
+par la densité et le poids rapporté (weight) n'est pas une population.
+Un ajout d'ATM ne recalcule rien : la distance de chaque centroïde devient
+le minimum entre l'ancienne et celle du nouveau site (with_site).
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from spatial_index import NearestIndex, haversine_km
+
+# Bandes de distance (km) rapportées par défaut
+COVERAGE_BANDS_KM = (1.0, 2.0, 5.0, 10.0)
+# Rayon retenu pour le taux de couverture du tableau de bord
+COVERAGE_RADIUS_KM = 5.0
+MAX_COVERAGE_BANDS = 10
+
+
+def _percent(covered: np.ndarray, total: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(total > 0, np.round(100.0 * covered / total, 1), 0.0)
+
+
+class NetworkCoverage:
+    """Distance des centroïdes de communes à l'ATM le plus proche (tableaux alignés, non modifiés)."""
+
+    def __init__(self, lats, lngs, weights, communes: Sequence[Any], regions: Sequence[Any],
+                 atms: Optional[NearestIndex] = None, distance_km: Optional[np.ndarray] = None):
+        self.lat = np.asarray(lats, dtype=np.float64)
+        self.lng = np.asarray(lngs, dtype=np.float64)
+        self.weight = np.nan_to_num(np.asarray(weights, dtype=np.float64), nan=0.0, posinf=0.0, neginf=0.0)
+        self.commune = np.asarray(communes, dtype=object)
+        self.region_names, self.region = np.unique(np.asarray(regions, dtype=str), return_inverse=True)
+        if distance_km is None:
+            _, distance_km = (atms or NearestIndex()).nearest(self.lat, self.lng)
+        self.distance_km = distance_km
+
+    def __len__(self) -> int:
+        return len(self.lat)
+
+    def with_site(self, lat: float, lng: float) -> "NetworkCoverage":
+        """Couverture après ajout d'un ATM en (lat, lng), sans modifier celle-ci."""
+        other = object.__new__(NetworkCoverage)
+        other.__dict__.update(self.__dict__)
+        other.distance_km = np.minimum(self.distance_km, haversine_km(self.lat, self.lng, lat, lng))
+        return other
+
+    def _covered(self, bands: np.ndarray) -> np.ndarray:
+        """Masque (bandes x centroïdes) : ATM le plus proche à moins de chaque bande."""
+        return self.distance_km[None, :] <= bands[:, None]
+
+    def share_within(self, radius_km: float) -> float:
+        """Part (%) du poids (densité) à moins de radius_km d'un ATM."""
+        total = self.weight.sum()
+        return float(_percent(self.weight[self.distance_km <= radius_km].sum(), total))
+
+    def report(self, bands: Sequence[float] = COVERAGE_BANDS_KM) -> Dict[str, Any]:
+        """Parts du poids (densité) par bande : réseau, régions (par nom) et communes."""
+        bands = np.asarray(sorted(set(float(b) for b in bands)), dtype=np.float64)
+        covered = self._covered(bands) * self.weight
+        total = self.weight.sum()
+
+        n_regions = len(self.region_names)
+        region_total = np.bincount(self.region, weights=self.weight, minlength=n_regions)
+        region_covered = np.vstack([np.bincount(self.region, weights=c, minlength=n_regions) for c in covered]) \
+            if len(bands) else np.zeros((0, n_regions))
+        region_share = _percent(region_covered, region_total).T.tolist()
+
+        # Bande de chaque commune : la plus petite qui la couvre (None au-delà de la dernière)
+        band_pos = np.searchsorted(bands, self.distance_km, side="left")
+        band_values = bands.tolist() + [None]
+        finite = np.isfinite(self.distance_km)
+        distances = np.where(finite, np.round(self.distance_km, 2), -1.0).tolist()
+
+        communes: List[Dict[str, Any]] = []
+        for i, (name, region, weight) in enumerate(zip(self.commune.tolist(), self.region.tolist(),
+                                                       self.weight.tolist())):
+            communes.append({
+                "commune": str(name),
+                "region": str(self.region_names[region]),
+                "weight": weight,
+                "nearest_atm_km": distances[i] if finite[i] else None,
+                "band_km": band_values[band_pos[i]],
+            })
+
+        return {
+            "bands_km": bands.tolist(),
+            "weight": float(total),
+            "coverage": _percent(covered.sum(axis=1), total).tolist(),
+            "regions": {
+                str(name): {"weight": float(region_total[k]), "coverage": region_share[k]}
+                for k, name in enumerate(self.region_names.tolist())
+            },
+            "communes": communes,
+        }
@@ -0,0 +1,146 @@
+"""
+Cache disque binaire des jeux de données nettoyés.
+
+Chaque _load_*_df écrit son DataFrame final (renommé, normalisé, nettoyé) dans
+CACHE_DIR. Les démarrages suivants (et chaque worker gunicorn) relisent ce
+fichier directement ; le CSV n'est reparsé que si sa taille, son mtime ou son
+contenu (sha256) a changé.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+import pandas as pd
+
+from data_generation import active_generation
+
+logger = logging.getLogger(__name__)
+
+# À côté de DATA_DIR (qui peut être monté en lecture seule)
+CACHE_DIR = Path(__file__).parent / "data_cache"
+
+# À incrémenter dès que le format ou la logique de nettoyage des loaders change
+CACHE_FORMAT_VERSION = 1
+
+def digest_version(digest: str) -> str:
+    """Jeton de version (contenu de la source + format) d'un jeu, à partir du sha256 de sa source."""
+    return f"{CACHE_FORMAT_VERSION}-{digest[:16]}"
+
+
+def record_version(name: str, digest: str) -> str:
+    """Enregistre la version du jeu `name` dans la génération de données active."""
+    version = digest_version(digest)
+    active_generation().versions[name] = version
+    return version
+
+
+def dataset_version(name: str) -> Optional[str]:
+    """Version du jeu `name` dans la génération active (None s'il n'y a pas été chargé)."""
+    return active_generation().versions.get(name)
+
+
+def file_fingerprint(path: Path) -> Dict[str, int]:
+    """Empreinte rapide d'un fichier source (taille + mtime en ns)."""
+    st = path.stat()
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def file_digest(path: Path) -> str:
+    """sha256 du contenu, lu par blocs."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _read_meta(meta_path: Path) -> Optional[Dict[str, Any]]:
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def atomic_write(path: Path, write: Callable[[str], None]) -> None:
+    """Écrit via un fichier temporaire + os.replace (sûr entre workers)."""
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    os.close(fd)
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def _write_meta(meta_path: Path, meta: Dict[str, Any]) -> None:
+    def write(tmp: str) -> None:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+    atomic_write(meta_path, write)
+
+
+def load_cached_frame(name: str, source: Path, build: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+    """
+    Retourne le DataFrame `name` depuis le cache si `source` n'a pas changé,
+    sinon appelle `build()` et réécrit le cache. Les erreurs d'écriture du
+    cache ne sont jamais bloquantes.
+    """
+    data_path = CACHE_DIR / f"{name}.pkl"
+    meta_path = CACHE_DIR / f"{name}.meta.json"
+
+    fp = file_fingerprint(source)
+    meta = _read_meta(meta_path)
+    digest: Optional[str] = None
+
+    if meta and meta.get("format") == CACHE_FORMAT_VERSION and data_path.exists():
+        fresh = meta.get("size") == fp["size"] and meta.get("mtime_ns") == fp["mtime_ns"]
+        if not fresh and meta.get("size") == fp["size"]:
+            # mtime modifié (copie, checkout...) : on tranche sur le contenu
+            digest = file_digest(source)
+            fresh = digest == meta.get("sha256")
+            if fresh:
+                try:
+                    _write_meta(meta_path, {**meta, **fp})
+                except OSError:
+                    pass
+        if fresh:
+            t0 = time.perf_counter()
+            try:
+                df = pd.read_pickle(data_path)
+                logger.info("Cache %s chargé en %.1f ms", name, (time.perf_counter() - t0) * 1000)
+                record_version(name, meta["sha256"])
+                return df
+            except Exception as e:
+                logger.warning("Cache %s illisible (%s), reconstruction depuis %s", name, e, source)
+
+    df = build()
+    digest = digest or file_digest(source)
+    record_version(name, digest)
+
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        atomic_write(data_path, lambda tmp: df.to_pickle(tmp, compression=None))
+        _write_meta(meta_path, {
+            "format": CACHE_FORMAT_VERSION,
+            "source": source.name,
+            "sha256": digest,
+            **fp,
+        })
+    except Exception as e:
+        logger.warning("Impossible d'écrire le cache %s: %s", name, e)
+
+    return df
@@ -0,0 +1,156 @@
+"""
+Générations de données : jeux chargés et structures dérivées publiés d'un bloc.
+
+Les loaders décorés par generation_cached mémorisent leur résultat dans la
+génération active (comme lru_cache), en notant les jeux de données dont il
+dépend : le jeu déclaré par le loader lui-même, plus ceux des loaders
+appelés pendant son exécution. Un rechargement dérive la génération
+suivante (entrées des jeux inchangés reprises telles quelles), la
+reconstruit hors des requêtes (building) puis la publie par une seule
+affectation : une requête voit l'ancienne génération complète ou la
+nouvelle, jamais un mélange ni un cache vidé.
+
+La génération lue est épinglée par contexte (ContextVar) : pendant une
+requête (pinned), tous les loaders répondent depuis la même génération même
+si une publication a lieu entre-temps.
+"""
+
+from __future__ import annotations
+
+import contextvars
+import functools
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, FrozenSet, Iterator, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class _Entry:
+    __slots__ = ("loader", "args", "kwargs", "datasets", "value")
+
+    def __init__(self, loader, args, kwargs, datasets, value):
+        self.loader, self.args, self.kwargs = loader, args, kwargs
+        self.datasets: FrozenSet[str] = datasets
+        self.value = value
+
+
+class DataGeneration:
+    """Valeurs des loaders et versions des jeux pour un état donné des fichiers sources."""
+
+    def __init__(self, number: int = 0):
+        self.number = number
+        self.entries: Dict[Tuple[Any, ...], _Entry] = {}
+        self.versions: Dict[str, str] = {}
+
+    def derive(self, changed: Set[str]) -> Tuple["DataGeneration", List[_Entry]]:
+        """
+        Génération suivante reprenant les entrées et versions indépendantes de
+        `changed`, et entrées écartées (ordre de calcul) à reconstruire.
+        """
+        nxt = DataGeneration(self.number + 1)
+        stale: List[_Entry] = []
+        for key, entry in list(self.entries.items()):
+            if entry.datasets & changed:
+                stale.append(entry)
+            else:
+                nxt.entries[key] = entry
+        nxt.versions = {name: v for name, v in self.versions.items() if name not in changed}
+        return nxt, stale
+
+    def discard(self, qualname: str) -> None:
+        for key in [k for k in self.entries if k[0] == qualname]:
+            self.entries.pop(key, None)
+
+
+_current = DataGeneration()
+_active: contextvars.ContextVar[Optional[DataGeneration]] = contextvars.ContextVar("data_generation", default=None)
+# Jeux lus par les loaders en cours d'exécution (un ensemble par loader, du plus externe au plus interne)
+_tracking = threading.local()
+
+
+def current_generation() -> DataGeneration:
+    """Dernière génération publiée."""
+    return _current
+
+
+def active_generation() -> DataGeneration:
+    """Génération épinglée dans ce contexte, sinon la dernière publiée."""
+    return _active.get() or _current
+
+
+def publish(generation: DataGeneration) -> None:
+    """Remplace la génération courante (une seule affectation)."""
+    global _current
+    _current = generation
+    logger.info("Génération de données %d publiée (%d entrées)", generation.number, len(generation.entries))
+
+
+@contextmanager
+def pinned(generation: Optional[DataGeneration] = None) -> Iterator[DataGeneration]:
+    """Épingle `generation` (par défaut la courante) pour le contexte : requête ou reconstruction."""
+    generation = generation or _current
+    token = _active.set(generation)
+    try:
+        yield generation
+    finally:
+        _active.reset(token)
+
+
+def _frames() -> List[Set[str]]:
+    frames = getattr(_tracking, "frames", None)
+    if frames is None:
+        frames = _tracking.frames = []
+    return frames
+
+
+def generation_cached(dataset: Optional[str] = None) -> Callable:
+    """
+    Mémorise le résultat du loader dans la génération active (clé : arguments).
+    `dataset` : jeu lu directement par le loader ; les dépendances des
+    loaders appelés s'y ajoutent. Les exceptions ne sont pas mémorisées.
+    """
+    def decorator(fn: Callable) -> Callable:
+        qualname = fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            generation = active_generation()
+            key = (qualname, args, tuple(sorted(kwargs.items())))
+            entry = generation.entries.get(key)
+            frames = _frames()
+            if entry is not None:
+                if frames:
+                    frames[-1].update(entry.datasets)
+                return entry.value
+
+            datasets = {dataset} if dataset else set()
+            frames.append(datasets)
+            try:
+                value = fn(*args, **kwargs)
+            finally:
+                frames.pop()
+                # Même en cas d'échec (fichier absent...) : l'appelant dépend de ces jeux
+                if frames:
+                    frames[-1].update(datasets)
+            generation.entries[key] = _Entry(wrapper, args, kwargs, frozenset(datasets), value)
+            return value
+
+        wrapper.cache_clear = lambda: active_generation().discard(qualname)
+        return wrapper
+
+    return decorator
+
+
+def rebuild(changed: Set[str], base: Optional[DataGeneration] = None) -> DataGeneration:
+    """
+    Génération suivante de `base` (la courante par défaut) où les entrées
+    dépendant de `changed` sont recalculées depuis les sources, sans
+    la publier. Une erreur de chargement est propagée (rien n'est publié).
+    """
+    nxt, stale = (base or _current).derive(changed)
+    with pinned(nxt):
+        for entry in stale:
+            entry.loader(*entry.args, **entry.kwargs)
+    return nxt
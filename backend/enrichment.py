@@ -0,0 +1,107 @@
+"""
+Enrichissement des LocationData à partir de leurs seules coordonnées.
+
+Les champs que l'appelant n'a pas renseignés (model_fields_set) sont
+dérivés des jeux chargés : densité et accessibilité de la commune,
+concurrents, POI et arrêts de transport dans un rayon. Les valeurs sont
+calculées par cellule de grille (ENRICH_CELL_DEG, ~200 m), en un passage
+vectorisé pour toutes les cellules nouvelles d'un lot, et gardées dans un
+cache LRU borné tant que la version des sources ne change pas.
+Un champ non dérivable (source absente, commune sans densité) garde la
+valeur fournie ou par défaut.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from schemas import LocationData
+
+# Pas de la grille de cache (degrés) : ~220 m en latitude
+ENRICH_CELL_DEG = 0.002
+MAX_CACHED_CELLS = 200_000
+# Rayon des comptages (km), aligné sur competitor_atms_500m
+NEARBY_RADIUS_KM = 0.5
+# POI dans le rayon à partir desquels la cellule est classée quartier d'affaires
+BUSINESS_POI_COUNT = 30
+
+# Champs dérivés, dans l'ordre des colonnes des valeurs en cache
+ENRICHED_FIELDS = (
+    "population_density", "accessibility_score", "competitor_atms_500m",
+    "commercial_poi_count", "public_transport_nearby", "business_district",
+)
+_INT_FIELDS = {"competitor_atms_500m", "commercial_poi_count", "public_transport_nearby", "business_district"}
+
+# calcul(lats, lngs des centres de cellules) -> {champ: valeurs, NaN si non dérivable}
+CellFeaturesFn = Callable[[np.ndarray, np.ndarray], Dict[str, np.ndarray]]
+
+
+class CellFeatureCache:
+    """Valeurs des ENRICHED_FIELDS par cellule de grille, vidé quand la version des sources change."""
+
+    def __init__(self, cell_deg: float = ENRICH_CELL_DEG, max_cells: int = MAX_CACHED_CELLS):
+        self.cell_deg = cell_deg
+        self.max_cells = max_cells
+        self._version: Optional[str] = None
+        self._cells: "OrderedDict[int, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._cells)
+
+    def values(self, lats: np.ndarray, lngs: np.ndarray, version: str, compute: CellFeaturesFn) -> np.ndarray:
+        """Matrice (points x ENRICHED_FIELDS) ; seules les cellules absentes du cache sont calculées."""
+        iy = np.floor(np.asarray(lats, dtype=np.float64) / self.cell_deg).astype(np.int64)
+        ix = np.floor((np.asarray(lngs, dtype=np.float64) + 180.0) / self.cell_deg).astype(np.int64)
+        cells, inverse = np.unique((iy << 32) + ix, return_inverse=True)
+        keys = cells.tolist()
+
+        rows: List[Optional[np.ndarray]] = [None] * len(keys)
+        with self._lock:
+            if version != self._version:
+                self._cells.clear()
+                self._version = version
+            for k, key in enumerate(keys):
+                row = self._cells.get(key)
+                if row is not None:
+                    self._cells.move_to_end(key)
+                    rows[k] = row
+
+        missing = np.array([k for k, row in enumerate(rows) if row is None], dtype=np.int64)
+        if missing.size:
+            # Centre des cellules : même valeur quel que soit le point de la cellule
+            clat = ((cells[missing] >> 32) + 0.5) * self.cell_deg
+            clng = ((cells[missing] & 0xFFFFFFFF) + 0.5) * self.cell_deg - 180.0
+            computed = compute(clat, clng)
+            block = np.full((missing.size, len(ENRICHED_FIELDS)), np.nan)
+            for j, field in enumerate(ENRICHED_FIELDS):
+                if field in computed:
+                    block[:, j] = computed[field]
+            with self._lock:
+                if version == self._version:
+                    for k, row in zip(missing.tolist(), block):
+                        self._cells[keys[k]] = row
+                    while len(self._cells) > self.max_cells:
+                        self._cells.popitem(last=False)
+            for k, row in zip(missing.tolist(), block):
+                rows[k] = row
+
+        return np.vstack(rows)[inverse] if rows else np.empty((0, len(ENRICHED_FIELDS)))
+
+
+def apply_features(locations: Sequence[LocationData], values: np.ndarray) -> List[LocationData]:
+    """Copie de chaque emplacement complétée des valeurs dérivées, pour les champs non fournis."""
+    enriched: List[LocationData] = []
+    for location, row in zip(locations, values.tolist()):
+        given = location.model_fields_set
+        update = {
+            field: (int(v) if field in _INT_FIELDS else v)
+            for field, v in zip(ENRICHED_FIELDS, row)
+            if v == v and field not in given
+        }
+        enriched.append(location.model_copy(update=update) if update else location)
+    return enriched
@@ -0,0 +1,141 @@
+"""
+Agrégation sur grille hexagonale multi-résolution (Web Mercator).
+
+À la résolution `res`, les hexagones (pointe en haut) ont un rayon de
+HEX_SIZE_PX pixels à l'écran au zoom z = res : la résolution se choisit donc
+comme le zoom de la carte. Les hexagones ne s'emboîtant pas, chaque niveau
+est calculé directement depuis les points, une fois pour toutes au
+chargement (effectif + sommes de colonnes numériques par cellule). Une
+requête ne lit que les cellules du niveau dont le centre est dans la bbox
+(bande de latitude par recherche dichotomique).
+"""
+
+from __future__ import annotations
+
+import math
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from clustering import mercator_xy
+
+MAX_HEX_RES = 16
+# Rayon (centre -> sommet) d'un hexagone, en pixels, au zoom égal à la résolution
+HEX_SIZE_PX = 24
+
+_SQRT3 = math.sqrt(3.0)
+
+
+def hex_radius(res: int) -> float:
+    """Rayon d'un hexagone de résolution `res`, en unités Mercator normalisées."""
+    return HEX_SIZE_PX / (256.0 * (1 << res))
+
+
+def _mercator_to_latlng(x: np.ndarray, y: np.ndarray):
+    lat = np.degrees(np.arctan(np.sinh(np.pi * (1.0 - 2.0 * y))))
+    return lat, x * 360.0 - 180.0
+
+
+def _hex_round(qf: np.ndarray, rf: np.ndarray):
+    """Arrondi en coordonnées cubiques (q, r, s = -q-r) vers l'hexagone le plus proche."""
+    sf = -qf - rf
+    q, r, s = np.round(qf), np.round(rf), np.round(sf)
+    dq, dr, ds = np.abs(q - qf), np.abs(r - rf), np.abs(s - sf)
+    fix_q = (dq > dr) & (dq > ds)
+    fix_r = ~fix_q & (dr > ds)
+    q = np.where(fix_q, -r - s, q)
+    r = np.where(fix_r, -q - s, r)
+    return q.astype(np.int64), r.astype(np.int64)
+
+
+def _hex_centers(q: np.ndarray, r: np.ndarray, size: float):
+    return size * _SQRT3 * (q + r / 2.0), size * 1.5 * r
+
+
+class _HexLevel:
+    """Cellules non vides d'une résolution, triées par latitude du centre."""
+
+    __slots__ = ("q", "r", "lat", "lng", "count", "sums")
+
+    def __init__(self, q, r, lat, lng, count, sums):
+        self.q, self.r, self.lat, self.lng = q, r, lat, lng
+        self.count, self.sums = count, sums
+
+    def __len__(self) -> int:
+        return len(self.count)
+
+
+class HexPyramid:
+    """Effectifs et sommes par hexagone, précalculés pour les résolutions 0..MAX_HEX_RES."""
+
+    def __init__(self, lats: Sequence[float], lngs: Sequence[float],
+                 values: Optional[Dict[str, Sequence[Any]]] = None):
+        lats = np.asarray(lats, dtype=np.float64)
+        lngs = np.asarray(lngs, dtype=np.float64)
+        ok = np.isfinite(lats) & np.isfinite(lngs)
+        self.sum_names: List[str] = list(values or {})
+        # Valeurs manquantes (NaN) comptées 0 dans les sommes
+        weights = np.zeros((len(self.sum_names), int(ok.sum())))
+        for k, name in enumerate(self.sum_names):
+            col = np.asarray(values[name], dtype=np.float64)[ok]
+            weights[k] = np.nan_to_num(col, nan=0.0, posinf=0.0, neginf=0.0)
+
+        x, y = mercator_xy(lats[ok], lngs[ok])
+        self.point_count = len(x)
+        self.levels: List[_HexLevel] = [self._bin(x, y, weights, res) for res in range(MAX_HEX_RES + 1)]
+
+    def __len__(self) -> int:
+        return self.point_count
+
+    @staticmethod
+    def _bin(x: np.ndarray, y: np.ndarray, weights: np.ndarray, res: int) -> _HexLevel:
+        size = hex_radius(res)
+        q, r = _hex_round((_SQRT3 / 3.0 * x - y / 3.0) / size, (2.0 / 3.0 * y) / size)
+        # 0 <= r < 2**31 (y dans [0, 1)) : clé q * 2**32 + r, q signé
+        keys = (q << 32) + r
+        cells, inv = np.unique(keys, return_inverse=True)
+        m = len(cells)
+        cq = cells >> 32
+        cr = cells - (cq << 32)
+
+        cx, cy = _hex_centers(cq, cr, size)
+        lat, lng = _mercator_to_latlng(cx, cy)
+        count = np.bincount(inv, minlength=m).astype(np.int64)
+        sums = np.vstack([np.bincount(inv, weights=w, minlength=m) for w in weights]) \
+            if len(weights) else np.zeros((0, m))
+
+        order = np.argsort(lat, kind="stable")
+        return _HexLevel(cq[order], cr[order], lat[order], lng[order], count[order], sums[:, order])
+
+    def query(self, res: int, s: float = -90.0, n: float = 90.0,
+              w: float = -180.0, e: float = 180.0) -> List[Dict[str, Any]]:
+        """Hexagones de la résolution `res` (bornée) dont le centre est dans la bbox."""
+        res = min(max(int(res), 0), MAX_HEX_RES)
+        level = self.levels[res]
+        band = np.arange(np.searchsorted(level.lat, s, side="left"), np.searchsorted(level.lat, n, side="right"))
+        lng = level.lng[band]
+        in_lng = (lng >= w) & (lng <= e) if w <= e else (lng >= w) | (lng <= e)
+        sel = band[in_lng]
+        if not sel.size:
+            return []
+
+        size = hex_radius(res)
+        cx, cy = _hex_centers(level.q[sel], level.r[sel], size)
+        # Sommets (pointe en haut), ordre anti-horaire à l'écran
+        angles = np.radians(30.0 + 60.0 * np.arange(6))
+        vlat, vlng = _mercator_to_latlng(cx[:, None] + size * np.cos(angles), cy[:, None] - size * np.sin(angles))
+
+        names = self.sum_names
+        sums = level.sums[:, sel].T.tolist()
+        bins = []
+        for k, i in enumerate(sel.tolist()):
+            ring = np.round(np.stack([vlng[k], vlat[k]], axis=1), 6).tolist()
+            bins.append({
+                "id": f"{res}/{int(level.q[i])}/{int(level.r[i])}",
+                "latitude": float(level.lat[i]),
+                "longitude": float(level.lng[i]),
+                "count": int(level.count[i]),
+                "sums": dict(zip(names, sums[k])),
+                "boundary": ring + ring[:1],
+            })
+        return bins
@@ -0,0 +1,38 @@
+"""
+ETags forts dérivés des versions de jeux de données (GET conditionnels).
+
+L'ETag d'une réponse = hash(version du jeu, chemin, paramètres de requête
+triés, version de l'API) : tant que le jeu n'est pas rechargé, une requête
+identique produit le même ETag, dans tous les workers.
+"""
+
+from __future__ import annotations
+
+import hashlib
+from typing import Iterable, Optional, Tuple
+
+# À incrémenter quand le format des réponses change à données égales
+RESPONSE_FORMAT_VERSION = "1"
+
+
+def make_etag(version: str, path: str, params: Iterable[Tuple[str, str]] = ()) -> str:
+    h = hashlib.sha256()
+    h.update(f"{RESPONSE_FORMAT_VERSION}|{version}|{path}".encode("utf-8"))
+    for key, value in sorted(params):
+        h.update(f"|{key}={value}".encode("utf-8"))
+    return f'"{h.hexdigest()[:32]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Vrai si l'en-tête If-None-Match désigne `etag` (liste, '*' et préfixe W/ acceptés)."""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
@@ -3,10 +3,20 @@ Saham Bank Geomarketing AI - Machine Learning Models
 ML Pipeline for optimal ATM placement.
 """
 
+import hashlib
 import json
+import os
+import tempfile
+import time
 import warnings
 from datetime import datetime
-from typing import List
+from pathlib import Path
+from typing import Any, Dict, List, Set, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou entre processus
+    fcntl = None
 from sklearn.dummy import DummyClassifier #ajoute
 import numpy as np #ajooute 
 from sklearn.dummy import DummyClassifier, DummyRegressor  #ajoute
@@ -15,6 +25,7 @@ from sklearn.dummy import DummyClassifier, DummyRegressor  #ajoute
 import joblib
 import numpy as np
 import pandas as pd
+import sklearn
 from sklearn.ensemble import RandomForestRegressor, GradientBoostingClassifier
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import StandardScaler
@@ -22,7 +33,84 @@ from sklearn.metrics import mean_squared_error, classification_report
 warnings.filterwarnings('ignore')
 
 # Import Pydantic schemas to enforce data contracts
+from data_cache import atomic_write
 from schemas import ATMData, LocationData
+from spatial_index import PointIndex
+
+# Zone d'influence d'un ATM pour la cannibalisation (km) et conversion degrés -> km
+INFLUENCE_RADIUS_KM = 2
+KM_PER_DEG = 111
+
+
+def influence_distance_km(lat, lng, lats, lngs) -> np.ndarray:
+    """
+    Distance retenue pour la cannibalisation : euclidienne en degrés x KM_PER_DEG.
+    Approximation historique du modèle, à utiliser pour tout calcul de risque
+    (réseau existant comme sites candidats) afin que la règle des 2 km soit la même.
+    """
+    return np.sqrt((np.asarray(lats) - lat) ** 2 + (np.asarray(lngs) - lng) ** 2) * KM_PER_DEG
+
+
+def influence_impact(distances) -> np.ndarray:
+    """Impact (%) d'un ATM à `distances` km : 100 au même point, 0 à INFLUENCE_RADIUS_KM et au-delà."""
+    return np.maximum(0, (INFLUENCE_RADIUS_KM - np.asarray(distances)) / INFLUENCE_RADIUS_KM * 100)
+
+
+# Artefacts versionnés : incrémenter MODEL_VERSION si les features ou les modèles changent.
+# Livrés avec le code à côté de l'instantané ATM (snapshot/, suivi par git) :
+# les conteneurs et les fonctions serverless les trouvent sans entraîner.
+MODEL_VERSION = 1
+MODEL_DIR = Path(__file__).parent / "snapshot"
+DEFAULT_MODEL_PREFIX = MODEL_DIR / f"atm_predictor_v{MODEL_VERSION}"
+MODEL_ARTIFACTS = ("volume", "roi", "scaler")
+
+
+class ModelNotReadyError(RuntimeError):
+    """Les modèles ne sont ni chargés ni entraînés (entraînement en cours en arrière-plan)."""
+
+
+def _manifest_files(manifest_path: Path) -> Set[str]:
+    """Fichiers référencés par un manifeste existant (vide si absent ou illisible)."""
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return {entry['file'] for entry in json.load(f)['files'].values()}
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return set()
+
+
+def _dump_artifact(obj: Any, prefix: Path, name: str) -> Tuple[Path, str]:
+    """Écrit `obj` dans un fichier temporaire puis le renomme d'après son sha256 (chemin, sha256)."""
+    fd, tmp = tempfile.mkstemp(dir=prefix.parent, prefix=f'.{prefix.name}_{name}.', suffix='.tmp')
+    os.close(fd)
+    try:
+        joblib.dump(obj, tmp)
+        digest = _sha256(Path(tmp))
+        path = prefix.parent / f'{prefix.name}_{name}.{digest[:12]}.pkl'
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    return path, digest
+
+
+def _sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+# Ordre des features attendu par le scaler et les modèles
+FEATURE_COLS = [
+    'population_density', 'commercial_poi_count', 'competitor_atms_500m',
+    'foot_traffic_score', 'income_level', 'accessibility_score',
+    'parking_availability', 'public_transport_nearby',
+    'business_district', 'residential_area'
+]
 
 
 class ATMLocationPredictor:
@@ -33,6 +121,8 @@ class ATMLocationPredictor:
         self.roi_model = GradientBoostingClassifier(n_estimators=100, random_state=42)
         self.scaler = StandardScaler()
         self.is_trained = False
+        self.performance: Dict[str, Any] = {}
+        self.load_metrics: Dict[str, Any] = {}
         
     def generate_synthetic_data(self, n_samples=1000):
         """Génère des données synthétiques pour l'entraînement"""
@@ -74,7 +164,8 @@ class ATMLocationPredictor:
             df['accessibility_score'] * 0.05 +
             np.random.normal(0, 0.1, n_samples)
         )
-        df['roi_positive'] = (roi_score > 0.5).astype(int)
+        # Seuil médian : un seuil fixe à 0.5 donnait une seule classe (ROI toujours positif)
+        df['roi_positive'] = (roi_score > np.median(roi_score)).astype(int)
         
         # Ajout de coordonnées géographiques (Maroc - région Casablanca)
         df['latitude'] = np.random.uniform(33.4, 33.7, n_samples)
@@ -88,14 +179,7 @@ class ATMLocationPredictor:
             data = self.generate_synthetic_data()
         
         # Préparation des features
-        feature_cols = [
-            'population_density', 'commercial_poi_count', 'competitor_atms_500m',
-            'foot_traffic_score', 'income_level', 'accessibility_score',
-            'parking_availability', 'public_transport_nearby', 
-            'business_district', 'residential_area'
-        ]
-        
-        X = data[feature_cols]
+        X = data[FEATURE_COLS]
         y_volume = data['monthly_withdrawals']
         y_roi = data['roi_positive']
         
@@ -125,6 +209,7 @@ class ATMLocationPredictor:
             'training_date': datetime.now().isoformat(),
             'n_samples': len(data)
         }
+        self.performance = performance
         
         print(f"✅ Modèles entraînés avec succès!")
         print(f"📊 Volume RMSE: {vol_rmse:.2f}")
@@ -134,45 +219,47 @@ class ATMLocationPredictor:
     
     def predict_location(self, location: LocationData) -> dict:
         """Prédit le potentiel d'un emplacement"""
+        return self.predict_locations([location])[0]
+    
+    def predict_locations(self, locations: List[LocationData]) -> List[dict]:
+        """Prédit le potentiel de plusieurs emplacements en un seul passage des modèles"""
         if not self.is_trained:
-            print("⚠️ Modèle non entraîné, entraînement automatique...")
-            self.train()
-        
-        # Préparation des données
-        features = np.array([[
-            location.population_density,
-            location.commercial_poi_count,
-            location.competitor_atms_500m,
-            location.foot_traffic_score,
-            location.income_level,
-            location.accessibility_score,
-            location.parking_availability,
-            location.public_transport_nearby,
-            location.business_district,
-            location.residential_area
-        ]])
+            # Pas d'entraînement inline : il bloquerait la requête plusieurs secondes
+            raise ModelNotReadyError("Modèles non chargés (entraînement hors ligne ou en arrière-plan requis)")
+        if not locations:
+            return []
+        
+        # Préparation des données : une ligne par emplacement
+        features = np.array([
+            [getattr(location, col) for col in FEATURE_COLS]
+            for location in locations
+        ], dtype=float)
         
         features_scaled = self.scaler.transform(features)
         
-        # Prédictions
-        volume_pred = self.volume_model.predict(features_scaled)[0]
-        roi_prob = self.roi_model.predict_proba(features_scaled)[0][1]
-        roi_pred = self.roi_model.predict(features_scaled)[0]
+        # Prédictions (matrice empilée)
+        volume_preds = self.volume_model.predict(features_scaled)
+        roi_probs = self.roi_model.predict_proba(features_scaled)[:, 1]
+        roi_preds = self.roi_model.predict(features_scaled)
         
         # Calcul du score global (0-100)
-        global_score = min(100, max(0, (volume_pred / 50 + roi_prob * 100) / 2))
-        
-        # Reason codes (explicabilité)
-        reason_codes = self._generate_reason_codes(location, volume_pred, roi_prob)
-        
-        return {
-            'predicted_volume': float(volume_pred),
-            'roi_probability': float(roi_prob),
-            'roi_prediction': bool(roi_pred),
-            'global_score': float(global_score),
-            'reason_codes': reason_codes,
-            'recommendation': 'RECOMMANDÉ' if global_score > 70 else 'À ÉTUDIER' if global_score > 40 else 'NON RECOMMANDÉ'
-        }
+        global_scores = np.minimum(100, np.maximum(0, (volume_preds / 50 + roi_probs * 100) / 2))
+        
+        results = []
+        for location, volume_pred, roi_prob, roi_pred, global_score in zip(
+            locations, volume_preds, roi_probs, roi_preds, global_scores
+        ):
+            # Reason codes (explicabilité)
+            reason_codes = self._generate_reason_codes(location, volume_pred, roi_prob)
+            results.append({
+                'predicted_volume': float(volume_pred),
+                'roi_probability': float(roi_prob),
+                'roi_prediction': bool(roi_pred),
+                'global_score': float(global_score),
+                'reason_codes': reason_codes,
+                'recommendation': 'RECOMMANDÉ' if global_score > 70 else 'À ÉTUDIER' if global_score > 40 else 'NON RECOMMANDÉ'
+            })
+        return results
     
     def _generate_reason_codes(self, location: LocationData, volume_pred: float, roi_prob: float) -> List[str]:
         """Génère les codes de raison pour l'explicabilité"""
@@ -208,69 +295,227 @@ class ATMLocationPredictor:
         
         return codes[:3]  # Limite à 3 codes principaux
     
-    def save_models(self, path_prefix='models/atm_predictor'):
-        """Sauvegarde les modèles entraînés"""
+    def save_models(self, path_prefix=DEFAULT_MODEL_PREFIX):
+        """
+        Sauvegarde les modèles entraînés + un manifeste (version, sha256, métriques).
+        Aucun fichier existant n'est réécrit : les workers qui l'ont en mmap
+        le gardent intact. Chaque artefact est écrit sous un nom dérivé de son
+        sha256 puis le manifeste est remplacé en dernier (os.replace) ; les
+        sauvegardes concurrentes (plusieurs workers) sont sérialisées par un
+        verrou de fichier.
+        """
         if not self.is_trained:
             raise ValueError("Modèles non entraînés")
         
-        joblib.dump(self.volume_model, f'{path_prefix}_volume.pkl')
-        joblib.dump(self.roi_model, f'{path_prefix}_roi.pkl')
-        joblib.dump(self.scaler, f'{path_prefix}_scaler.pkl')
+        prefix = Path(path_prefix)
+        prefix.parent.mkdir(parents=True, exist_ok=True)
+        manifest_path = Path(f'{prefix}_manifest.json')
+        objects = {'volume': self.volume_model, 'roi': self.roi_model, 'scaler': self.scaler}
+        
+        with open(f'{prefix}.lock', 'w') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            previous = _manifest_files(manifest_path)
+            files = {}
+            for name in MODEL_ARTIFACTS:
+                # non compressé : chargeable en mmap
+                path, digest = _dump_artifact(objects[name], prefix, name)
+                files[name] = {'file': path.name, 'sha256': digest}
+            
+            manifest = {
+                'version': MODEL_VERSION,
+                'created_at': datetime.now().isoformat(),
+                'sklearn_version': sklearn.__version__,
+                'features': FEATURE_COLS,
+                'performance': self.performance,
+                'files': files,
+            }
+            
+            def write(tmp: str) -> None:
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    json.dump(manifest, f, indent=2)
+            
+            atomic_write(manifest_path, write)
+            
+            # Artefacts du manifeste précédent gardés : un worker peut l'avoir lu à l'instant
+            keep = {entry['file'] for entry in files.values()} | previous
+            for name in MODEL_ARTIFACTS:
+                for path in prefix.parent.glob(f'{prefix.name}_{name}*.pkl'):
+                    if path.name not in keep:
+                        try:
+                            path.unlink()  # un mmap existant reste valide
+                        except OSError:
+                            pass
+        
+        print(f"✅ Modèles sauvegardés: {prefix}_*.pkl")
+    
+    def load_models(self, path_prefix=DEFAULT_MODEL_PREFIX, mmap: bool = True) -> Dict[str, Any]:
+        """
+        Charge les artefacts produits par save_models (memory-mapped), après
+        vérification de la version et des sha256 du manifeste.
+        Lève FileNotFoundError si absents, ValueError si invalides.
+        """
+        manifest_path = Path(f'{path_prefix}_manifest.json')
+        if not manifest_path.exists():
+            raise FileNotFoundError(f"Manifeste de modèles introuvable: {manifest_path}")
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('version') != MODEL_VERSION:
+            raise ValueError(f"Version d'artefacts {manifest.get('version')} != {MODEL_VERSION}")
+        if manifest.get('features') != FEATURE_COLS:
+            raise ValueError("Features du manifeste différentes de FEATURE_COLS")
+        
+        t0 = time.perf_counter()
+        paths = {}
+        for name in MODEL_ARTIFACTS:
+            entry = manifest['files'][name]
+            path = manifest_path.parent / entry['file']
+            if _sha256(path) != entry['sha256']:
+                raise ValueError(f"Checksum invalide pour {path}")
+            paths[name] = path
+        t1 = time.perf_counter()
+        
+        mmap_mode = 'r' if mmap else None
+        loaded = {name: joblib.load(path, mmap_mode=mmap_mode) for name, path in paths.items()}
+        t2 = time.perf_counter()
+        
+        self.volume_model = loaded['volume']
+        self.roi_model = loaded['roi']
+        self.scaler = loaded['scaler']
+        self.performance = manifest.get('performance') or {}
+        self.is_trained = True
         
-        print(f"✅ Modèles sauvegardés: {path_prefix}_*.pkl")
+        self.load_metrics = {
+            'version': MODEL_VERSION,
+            'created_at': manifest.get('created_at'),
+            'sklearn_version': manifest.get('sklearn_version'),
+            'mmap': mmap,
+            'checksum_ms': round((t1 - t0) * 1000, 2),
+            'load_ms': round((t2 - t1) * 1000, 2),
+            'size_bytes': sum(p.stat().st_size for p in paths.values()),
+        }
+        return self.load_metrics
+
+def build_models(path_prefix=DEFAULT_MODEL_PREFIX) -> Dict[str, Any]:
+    """
+    Étape de build (Dockerfile, ./run.sh models) : réutilise les artefacts
+    s'ils passent load_models, sinon entraîne et sauvegarde, puis les relit
+    (version + sha256). Renvoie les métriques de chargement.
+    """
+    predictor = ATMLocationPredictor()
+    try:
+        return predictor.load_models(path_prefix)
+    except (FileNotFoundError, ValueError, KeyError) as e:
+        print(f"⚠️ Artefacts absents ou invalides ({e}) : entraînement")
+    predictor.train()
+    predictor.save_models(path_prefix)
+    return ATMLocationPredictor().load_models(path_prefix)
+
 
 class CanibalizationAnalyzer:
     """Analyseur de cannibalisation entre ATMs"""
     
     def __init__(self):
         self.existing_atms: List[ATMData] = []
+        # Coordonnées + grille de voisinage, une cellule = la zone d'influence
+        self.index = PointIndex(cell_deg=INFLUENCE_RADIUS_KM / KM_PER_DEG)
     
+    def copy(self) -> "CanibalizationAnalyzer":
+        """Copie indépendante (ATMs et index), pour construire l'état suivant sans toucher celui-ci"""
+        other = CanibalizationAnalyzer.__new__(CanibalizationAnalyzer)
+        other.existing_atms = list(self.existing_atms)
+        other.index = self.index.copy()
+        return other
+
     def add_existing_atm(self, atm: ATMData):
-        """Ajoute un ATM existant à l'analyse"""
+        """Ajoute un ATM existant à l'analyse (insertion incrémentale dans l'index)"""
         self.existing_atms.append(atm)
+        self.index.add(atm.latitude, atm.longitude)
     
     def calculate_canibalization(self, new_location: LocationData) -> dict:
         """Calcule l'impact de cannibalisation d'un nouvel ATM"""
+        return self.calculate_canibalization_batch([new_location])[0]
+    
+    def calculate_canibalization_batch(self, new_locations: List[LocationData]) -> List[dict]:
+        """Calcule la cannibalisation de plusieurs emplacements en un seul passage vectorisé"""
         if not self.existing_atms:
-            return {'canibalization_risk': 0, 'affected_atms': []}
-        
-        new_lat = new_location.latitude
-        new_lon = new_location.longitude
-        
-        affected_atms = []
-        total_impact = 0
-        
-        for atm in self.existing_atms:
-            # Calcul de la distance (approximation)
-            distance = np.sqrt(
-                (new_lat - atm.latitude)**2 +
-                (new_lon - atm.longitude)**2
-            ) * 111  # Conversion en km approximative
-            
-            if distance < 2:  # Zone d'influence de 2km
-                impact = max(0, (2 - distance) / 2 * 100)  # Impact en %
-                affected_atms.append({
-                    'atm_id': atm.id,
-                    'distance_km': round(distance, 2),
-                    'impact_percent': round(impact, 1)
-                })
-                total_impact += impact
-        
-        return {
-            'canibalization_risk': min(100, total_impact),
-            'affected_atms': affected_atms
-        }
+            return [{'canibalization_risk': 0, 'affected_atms': []} for _ in new_locations]
+        if not new_locations:
+            return []
+        
+        new_lats = np.array([loc.latitude for loc in new_locations], dtype=float)
+        new_lons = np.array([loc.longitude for loc in new_locations], dtype=float)
+        
+        # Paires (candidat, ATM voisin) : seuls les ATMs des cellules voisines
+        # peuvent être à moins de 2 km
+        radius_deg = INFLUENCE_RADIUS_KM / KM_PER_DEG
+        neighbours = [
+            self.index.window(lat, lon, radius_deg, radius_deg)
+            for lat, lon in zip(new_lats.tolist(), new_lons.tolist())
+        ]
+        counts = np.array([len(ids) for ids in neighbours])
+        cand = np.repeat(np.arange(len(new_locations)), counts)
+        ids = np.concatenate(neighbours)
+        
+        # Calcul de la distance (approximation) pour toutes les paires
+        distances = influence_distance_km(new_lats[cand], new_lons[cand], self.index.lats[ids], self.index.lngs[ids])
+        
+        inside = distances < INFLUENCE_RADIUS_KM
+        cand, ids, distances = cand[inside], ids[inside], distances[inside]
+        impacts = influence_impact(distances)  # Impact en %
+        
+        # Regroupement par candidat (cand est trié, les ATMs dans l'ordre d'insertion)
+        bounds = np.searchsorted(cand, np.arange(len(new_locations) + 1))
+        ids = ids.tolist()
+        distances = np.round(distances, 2).tolist()
+        impacts_r = np.round(impacts, 1).tolist()
+        impacts = impacts.tolist()
+        
+        results = []
+        for k in range(len(new_locations)):
+            lo, hi = bounds[k], bounds[k + 1]
+            affected_atms = [
+                {
+                    'atm_id': self.existing_atms[i].id,
+                    'distance_km': distance,
+                    'impact_percent': impact,
+                }
+                for i, distance, impact in zip(ids[lo:hi], distances[lo:hi], impacts_r[lo:hi])
+            ]
+            total_impact = sum(impacts[lo:hi], 0)
+            results.append({
+                'canibalization_risk': min(100, total_impact),
+                'affected_atms': affected_atms
+            })
+        return results
 
 # Test et démonstration
 if __name__ == "__main__":
+    import sys
+
+    # --build : artefacts générés si besoin puis validés ; --check : validés seulement.
+    # Code de sortie 1 si les artefacts restent absents ou invalides.
+    if sys.argv[1:] in (["--build"], ["--check"]):
+        try:
+            if sys.argv[1] == "--build":
+                metrics = build_models()
+            else:
+                metrics = ATMLocationPredictor().load_models()
+        except (FileNotFoundError, ValueError, KeyError) as e:
+            print(f"❌ Artefacts du modèle invalides: {e}")
+            sys.exit(1)
+        print(f"✅ Artefacts v{metrics['version']} valides ({metrics['size_bytes']} octets)")
+        sys.exit(0)
+
     print("🏦 Saham Bank - Geomarketing AI Models")
     print("=" * 50)
     
     # Initialisation du prédicteur
     predictor = ATMLocationPredictor()
     
-    # Entraînement
+    # Entraînement (hors ligne) + sauvegarde des artefacts chargés par ATMService.initialize
     performance = predictor.train()
+    predictor.save_models()
     
     # Test de prédiction
     test_location = LocationData(
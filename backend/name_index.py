@@ -0,0 +1,153 @@
+"""
+Index de noms insensible aux accents (communes, ATMs, concurrents).
+
+Chaque nom est replié (accents, casse, ponctuation) en clés : le nom complet
+et chacun de ses mots. Recherche en trois niveaux :
+  - égalité exacte d'une clé (dict),
+  - préfixe d'une clé (bisect sur la liste triée des clés),
+  - trigrammes (similarité de Dice) pour les fautes de frappe.
+Les ajouts sont incrémentaux (ATMs ajoutés via l'API).
+"""
+
+from __future__ import annotations
+
+import bisect
+import threading
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, Hashable, List, Set, Tuple
+
+# Similarité de Dice minimale pour un résultat par trigrammes
+MIN_FUZZY_SIMILARITY = 0.45
+
+# Scores de pertinence par niveau de correspondance
+_EXACT, _PREFIX, _WORD_PREFIX = 1.0, 0.9, 0.8
+
+
+def fold_key(value: Any) -> str:
+    """Clé insensible aux accents, à la casse et à la ponctuation ('Aïn-Chock' -> 'ainchock')."""
+    txt = unicodedata.normalize("NFKD", str(value or ""))
+    return "".join(ch for ch in txt if ch.isalnum() and not unicodedata.combining(ch)).lower()
+
+
+def _words(value: Any) -> List[str]:
+    """Mots repliés d'un nom ('Sidi Bernoussi-Zenata' -> ['sidi', 'bernoussi', 'zenata'])."""
+    txt = unicodedata.normalize("NFKD", str(value or ""))
+    txt = "".join(ch if ch.isalnum() else " " for ch in txt if not unicodedata.combining(ch))
+    return [w for w in txt.lower().split() if w]
+
+
+def _trigrams(key: str) -> Set[str]:
+    padded = f"${key}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class NameIndex:
+    """Clés repliées -> références (rang iloc, id...) des objets nommés."""
+
+    def __init__(self):
+        # clé complète -> refs ; mot -> refs (pour les préfixes de mots)
+        self._full: Dict[str, List[Hashable]] = {}
+        self._word: Dict[str, List[Hashable]] = {}
+        self._sorted_full: List[str] = []
+        self._sorted_word: List[str] = []
+        self._grams: Dict[str, Set[str]] = {}
+        self._gram_counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._full)
+
+    def copy(self) -> "NameIndex":
+        """Copie indépendante (les ajouts dans l'une ne touchent pas l'autre)."""
+        other = NameIndex()
+        with self._lock:
+            other._full = {key: list(refs) for key, refs in self._full.items()}
+            other._word = {key: list(refs) for key, refs in self._word.items()}
+            other._sorted_full = list(self._sorted_full)
+            other._sorted_word = list(self._sorted_word)
+            other._grams = {gram: set(keys) for gram, keys in self._grams.items()}
+            other._gram_counts = dict(self._gram_counts)
+        return other
+
+    def add(self, ref: Hashable, *names: Any) -> None:
+        """Indexe `ref` sous chacun des noms (ignorés si vides)."""
+        with self._lock:
+            for name in names:
+                key = fold_key(name)
+                if not key:
+                    continue
+                self._insert(self._full, self._sorted_full, key, ref, grams=True)
+                for word in _words(name):
+                    if word != key:
+                        self._insert(self._word, self._sorted_word, word, ref, grams=False)
+
+    def _insert(self, table: Dict[str, List[Hashable]], ordered: List[str],
+                key: str, ref: Hashable, grams: bool) -> None:
+        refs = table.get(key)
+        if refs is None:
+            table[key] = [ref]
+            bisect.insort(ordered, key)
+            if grams:
+                g = _trigrams(key)
+                self._gram_counts[key] = len(g)
+                for gram in g:
+                    self._grams.setdefault(gram, set()).add(key)
+        elif ref not in refs:
+            refs.append(ref)
+
+    def exact(self, name: Any) -> List[Hashable]:
+        """Refs dont un nom complet a exactement la même clé repliée."""
+        return list(self._full.get(fold_key(name), ()))
+
+    @staticmethod
+    def _prefixed(ordered: List[str], prefix: str):
+        i = bisect.bisect_left(ordered, prefix)
+        while i < len(ordered) and ordered[i].startswith(prefix):
+            yield ordered[i]
+            i += 1
+
+    def search(self, query: Any, limit: int = 10) -> List[Tuple[Hashable, float]]:
+        """
+        Meilleures refs pour `query` : [(ref, pertinence 0..1)], pertinence
+        décroissante, puis clé la plus courte (la plus proche de la requête).
+        """
+        q = fold_key(query)
+        if not q or limit <= 0:
+            return []
+
+        found: Dict[Hashable, float] = {}
+
+        def collect(candidates, table, score: float) -> None:
+            for key in sorted(candidates, key=len):
+                for ref in table[key]:
+                    if ref not in found:
+                        found[ref] = score
+                        if len(found) >= limit:
+                            return
+
+        with self._lock:
+            collect([q] if q in self._full else [], self._full, _EXACT)
+            if len(found) < limit:
+                collect(list(self._prefixed(self._sorted_full, q)), self._full, _PREFIX)
+            if len(found) < limit:
+                collect(list(self._prefixed(self._sorted_word, q)), self._word, _WORD_PREFIX)
+            if len(found) < limit and len(q) >= 3:
+                q_grams = _trigrams(q)
+                shared: Counter = Counter()
+                for gram in q_grams:
+                    shared.update(self._grams.get(gram, ()))
+                scored = []
+                for key, n in shared.items():
+                    dice = 2.0 * n / (len(q_grams) + self._gram_counts[key])
+                    if dice >= MIN_FUZZY_SIMILARITY:
+                        scored.append((dice, key))
+                scored.sort(key=lambda t: (-t[0], len(t[1]), t[1]))
+                for dice, key in scored:
+                    for ref in self._full[key]:
+                        if ref not in found:
+                            found[ref] = round(dice * _WORD_PREFIX, 3)
+                    if len(found) >= limit:
+                        break
+
+        return list(found.items())[:limit]
@@ -0,0 +1,93 @@
+"""
+Agrégats du réseau d'ATMs tenus à jour de façon incrémentale.
+
+Un ajout d'ATM met à jour les compteurs en O(1) ; la vue servie par les
+tableaux de bord (résumé + analyse régionale) est matérialisée une fois,
+au premier appel après une modification, puis réutilisée telle quelle.
+"""
+
+from __future__ import annotations
+
+from collections import Counter
+from typing import Any, Dict, Iterable, Optional
+
+UNKNOWN = "Unknown"
+
+
+class _RegionStats:
+    __slots__ = ("count", "volume", "cities")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.volume = 0.0
+        self.cities: Counter = Counter()
+
+
+class NetworkAggregates:
+    """Effectifs, volumes et villes du réseau, par région et au total."""
+
+    def __init__(self, atms: Iterable[Any] = ()):
+        self.total_atms = 0
+        self.total_volume = 0.0
+        self.cities: Counter = Counter()
+        self.regions: Dict[str, _RegionStats] = {}
+        self._snapshot: Optional[Dict[str, Any]] = None
+        for atm in atms:
+            self.add(atm)
+
+    def copy(self) -> "NetworkAggregates":
+        """Copie indépendante (les ajouts dans l'une ne touchent pas l'autre)."""
+        other = NetworkAggregates()
+        other.total_atms, other.total_volume = self.total_atms, self.total_volume
+        other.cities = Counter(self.cities)
+        for name, stats in self.regions.items():
+            region = other.regions[name] = _RegionStats()
+            region.count, region.volume, region.cities = stats.count, stats.volume, Counter(stats.cities)
+        other._snapshot = self._snapshot
+        return other
+
+    def add(self, atm: Any) -> None:
+        # ATMData ne porte pas (encore) de volume : 0 par défaut
+        volume = getattr(atm, "monthly_volume", None) or 0
+        key = atm.region or UNKNOWN
+        region = self.regions.get(key)
+        if region is None:
+            region = self.regions[key] = _RegionStats()
+        region.count += 1
+        region.volume += volume
+        region.cities[atm.city or UNKNOWN] += 1
+
+        self.total_atms += 1
+        self.total_volume += volume
+        if atm.city:
+            self.cities[atm.city] += 1
+        self._snapshot = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Vue figée : `summary` (champs calculés de DashboardSummary) et
+        `regional_analysis` (format RegionalAnalysis). Ne pas modifier.
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            total = self.total_atms
+            snapshot = {
+                "summary": {
+                    "total_atms": total,
+                    "total_monthly_volume": self.total_volume,
+                    "average_volume_per_atm": round(self.total_volume / total, 0) if total else 0,
+                    "cities_covered": len(self.cities),
+                    "regions_covered": len(self.regions),
+                },
+                "regional_analysis": {
+                    name: {
+                        "count": stats.count,
+                        "volume": stats.volume,
+                        "cities": sorted(stats.cities),
+                        "avg_volume": stats.volume / stats.count,
+                    }
+                    for name, stats in self.regions.items()
+                },
+            }
+            self._snapshot = snapshot
+        return snapshot
@@ -0,0 +1,147 @@
+"""
+Surface d'opportunité nationale (zones prioritaires d'implantation).
+
+Une grille régulière couvre le Maroc ; chaque cellule reçoit le score
+d'indicateurs de sa commune (type compute_site_score), sa distance au
+centroïde de la commune (faute de données infra-communales, la population
+est supposée concentrée autour), la distance à l'ATM du réseau le plus
+proche et le nombre de concurrents alentour. Le calcul part d'une grille
+grossière puis raffine (REFINE_FACTOR x REFINE_FACTOR sous-cellules) autour
+des meilleures cellules, sur REFINE_LEVELS niveaux.
+Les distances sont évaluées par blocs vectorisés, répartis sur un pool de
+processus quand le nombre de cellules d'un niveau le justifie.
+"""
+
+from __future__ import annotations
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from spatial_index import NearestIndex
+
+# Emprise (s, n, w, e), Sahara compris
+MOROCCO_BBOX = (20.7, 35.95, -17.2, -0.95)
+# Pas de la grille grossière (~22 km), puis division par REFINE_FACTOR à chaque niveau
+COARSE_STEP_DEG = 0.2
+REFINE_FACTOR = 4
+REFINE_LEVELS = 2
+# Part des cellules d'un niveau raffinées au niveau suivant
+REFINE_TOP_FRACTION = 0.1
+# Décroissance (km) du poids d'une cellule avec sa distance au centroïde de sa commune
+SETTLEMENT_DECAY_KM = 5.0
+# Distance au réseau au-delà de laquelle une cellule est considérée non desservie
+GAP_SATURATION_KM = 10.0
+# Concurrents comptés dans ce rayon ; au-delà de COMPETITION_SATURATION, pénalité maximale
+COMPETITOR_RADIUS_KM = 2.0
+COMPETITION_SATURATION = 10
+# En dessous, l'évaluation reste dans le processus courant (coût du pool > gain).
+# La grille du Maroc (~6k cellules grossières, quelques milliers par niveau
+# raffiné) reste toujours en dessous : le pool ne sert qu'aux emprises plus vastes.
+POOL_MIN_CELLS = 200_000
+POOL_CHUNK_CELLS = 50_000
+
+# indicateur(lats, lngs) -> (score 0..100, position de la commune, km au centroïde, cellule retenue ?)
+IndicatorFn = Callable[[np.ndarray, np.ndarray], Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]]
+
+
+def grid_centers(s: float, n: float, w: float, e: float, step: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Centres des cellules de pas `step` couvrant la bbox."""
+    lats = np.arange(s + step / 2, n, step)
+    lngs = np.arange(w + step / 2, e, step)
+    glat, glng = np.meshgrid(lats, lngs, indexing="ij")
+    return glat.ravel(), glng.ravel()
+
+
+def subdivide(lats: np.ndarray, lngs: np.ndarray, step: float,
+              factor: int = REFINE_FACTOR) -> Tuple[np.ndarray, np.ndarray]:
+    """Centres des factor x factor sous-cellules de chaque cellule."""
+    sub = step / factor
+    offsets = (np.arange(factor) - (factor - 1) / 2.0) * sub
+    dlat, dlng = np.meshgrid(offsets, offsets, indexing="ij")
+    return (lats[:, None] + dlat.ravel()).ravel(), (lngs[:, None] + dlng.ravel()).ravel()
+
+
+def _network_chunk(args) -> Tuple[np.ndarray, np.ndarray]:
+    lats, lngs, atms, competitors = args
+    _, atm_km = atms.nearest(lats, lngs)
+    return atm_km, competitors.count_within(lats, lngs, COMPETITOR_RADIUS_KM)
+
+
+def network_distances(lats: np.ndarray, lngs: np.ndarray, atms: NearestIndex, competitors: NearestIndex,
+                      workers: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """(distance km à l'ATM le plus proche, concurrents dans COMPETITOR_RADIUS_KM) par cellule."""
+    workers = workers if workers is not None else (os.cpu_count() or 1)
+    if len(lats) < POOL_MIN_CELLS or workers <= 1:
+        return _network_chunk((lats, lngs, atms, competitors))
+
+    chunks = [(lats[a:a + POOL_CHUNK_CELLS], lngs[a:a + POOL_CHUNK_CELLS], atms, competitors)
+              for a in range(0, len(lats), POOL_CHUNK_CELLS)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        parts = list(pool.map(_network_chunk, chunks))
+    return np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts])
+
+
+def opportunity_score(indicator: np.ndarray, centroid_km: np.ndarray, atm_km: np.ndarray,
+                      competitors: np.ndarray) -> np.ndarray:
+    """
+    Score 0..100 : indicateurs de la commune, pondérés par la proximité de
+    son centroïde (exp(-d / SETTLEMENT_DECAY_KM)), par l'éloignement du
+    réseau (x0.5 sur un ATM, x1 à GAP_SATURATION_KM et au-delà) et par la
+    concurrence locale (x1 sans concurrent, x0.5 à COMPETITION_SATURATION).
+    """
+    settlement = np.exp(-centroid_km / SETTLEMENT_DECAY_KM)
+    gap = np.minimum(atm_km / GAP_SATURATION_KM, 1.0)
+    competition = np.minimum(competitors / COMPETITION_SATURATION, 1.0)
+    return indicator * settlement * (0.5 + 0.5 * gap) * (1.0 - 0.5 * competition)
+
+
+class OpportunitySurface:
+    """Cellules évaluées, tous niveaux confondus (tableaux alignés)."""
+
+    def __init__(self, lat, lng, step, commune, indicator, centroid_km, atm_km, competitors):
+        self.lat, self.lng, self.step, self.commune = lat, lng, step, commune
+        self.indicator, self.centroid_km = indicator, centroid_km
+        self.atm_km, self.competitors = atm_km, competitors
+        self.opportunity = opportunity_score(indicator, centroid_km, atm_km, competitors)
+
+    def __len__(self) -> int:
+        return len(self.lat)
+
+    def top_zones(self, k: int) -> np.ndarray:
+        """Positions des k meilleures cellules, au plus une par commune (opportunité décroissante)."""
+        order = np.lexsort((np.arange(len(self)), -self.opportunity))
+        _, first = np.unique(self.commune[order], return_index=True)
+        best = order[np.sort(first)]
+        return best[:max(k, 0)]
+
+
+def build_surface(indicator: IndicatorFn, atms: NearestIndex, competitors: NearestIndex,
+                  bbox: Tuple[float, float, float, float] = MOROCCO_BBOX,
+                  workers: Optional[int] = None) -> OpportunitySurface:
+    """Évaluation grossière puis raffinement autour des meilleures cellules."""
+    fields = ("lat", "lng", "step", "commune", "indicator", "centroid_km", "atm_km", "competitors")
+    columns: Dict[str, List[np.ndarray]] = {k: [] for k in fields}
+    step = COARSE_STEP_DEG
+    lats, lngs = grid_centers(*bbox, step)
+    for level in range(REFINE_LEVELS + 1):
+        score, commune, centroid_km, keep = indicator(lats, lngs)
+        lats, lngs = lats[keep], lngs[keep]
+        score, commune, centroid_km = score[keep], commune[keep], centroid_km[keep]
+        atm_km, n_comp = network_distances(lats, lngs, atms, competitors, workers)
+
+        level_columns = (lats, lngs, np.full(len(lats), step), commune, score, centroid_km, atm_km, n_comp)
+        for key, values in zip(fields, level_columns):
+            columns[key].append(values)
+
+        if level == REFINE_LEVELS or not len(lats):
+            break
+        opp = opportunity_score(score, centroid_km, atm_km, n_comp)
+        n_top = max(1, int(len(lats) * REFINE_TOP_FRACTION))
+        top = np.argpartition(-opp, n_top - 1)[:n_top]
+        lats, lngs = subdivide(lats[top], lngs[top], step)
+        step /= REFINE_FACTOR
+
+    return OpportunitySurface(*(np.concatenate(columns[k]) for k in fields))
@@ -0,0 +1,104 @@
+"""
+Choix de k nouveaux sites parmi un ensemble de candidats (glouton paresseux).
+
+Valeur d'un site = score global du prédicteur ajusté de sa
+cannibalisation, comme dans ATMService.predict_batch :
+    score * (1 - min(100, risque) / 200)
+où le risque cumule l'impact des ATMs existants (calculé une fois) et celui
+des autres sites choisis à moins de INFLUENCE_RADIUS_KM. L'interaction est
+symétrique : choisir B près de A augmente le risque de B et celui de A, et
+le gain de B est son score ajusté moins la baisse qu'il impose aux sites
+déjà choisis. Les distances sont celles du CanibalizationAnalyzer
+(influence_distance_km), pour que la règle des 2 km soit la même partout.
+Choisir un site ne fait qu'augmenter le risque des autres : les gains ne
+font que baisser, et la borne supérieure en tas suffit (glouton paresseux)
+— un candidat n'est réévalué que lorsqu'il remonte en tête. Un candidat à
+moins de MIN_SITE_SPACING_KM d'un site choisi est écarté.
+"""
+
+from __future__ import annotations
+
+import heapq
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from ml_models import INFLUENCE_RADIUS_KM, KM_PER_DEG, influence_distance_km, influence_impact
+from spatial_index import PointIndex
+
+# Cellule de l'index des sites choisis : la zone d'influence (~2 km)
+_CELL_DEG = INFLUENCE_RADIUS_KM / KM_PER_DEG
+# Écart minimal entre deux sites choisis (km) : en deçà, c'est le même emplacement
+MIN_SITE_SPACING_KM = 0.1
+
+
+def adjusted_score(score: float, risk: float) -> float:
+    return max(0.0, score * (1 - min(100.0, risk) / 200))
+
+
+def lazy_greedy(scores: np.ndarray, base_risk: np.ndarray, lats: np.ndarray, lngs: np.ndarray,
+                k: int, deadline: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Sélection gloutonne d'au plus k candidats (positions) maximisant la somme
+    des scores ajustés des sites choisis ; s'arrête plus tôt si plus aucun
+    candidat n'augmente cette somme. `deadline` (time.perf_counter()) : au-delà,
+    la meilleure solution partielle (au moins un site) est rendue avec complete=False.
+    """
+    picked = PointIndex(cell_deg=_CELL_DEG)
+    picked_score: List[float] = []
+    picked_risk: List[float] = []  # risque courant de chaque site choisi (non plafonné)
+    sites: List[Dict[str, Any]] = []
+    # Tas de bornes supérieures (-gain, position) ; gain initial = sans site choisi
+    heap = [(-adjusted_score(s, r), i) for i, (s, r) in enumerate(zip(scores.tolist(), base_risk.tolist()))]
+    heapq.heapify(heap)
+    evaluations = len(heap)
+    total = 0.0
+    complete = True
+
+    while heap and len(sites) < k:
+        if sites and deadline is not None and time.perf_counter() > deadline:
+            complete = False
+            break
+        _, i = heapq.heappop(heap)
+        lat, lng = float(lats[i]), float(lngs[i])
+        near = picked.window(lat, lng, _CELL_DEG, _CELL_DEG)
+        d = influence_distance_km(lat, lng, picked.lats[near], picked.lngs[near])
+        evaluations += 1
+        if (d < MIN_SITE_SPACING_KM).any():
+            continue  # emplacement déjà choisi : écarté définitivement
+        inside = d < INFLUENCE_RADIUS_KM
+        near, impacts = near[inside].tolist(), influence_impact(d[inside]).tolist()
+
+        risk = float(base_risk[i]) + sum(impacts)
+        # Baisse imposée aux sites déjà choisis dans la zone d'influence
+        loss = sum(
+            adjusted_score(picked_score[j], picked_risk[j]) - adjusted_score(picked_score[j], picked_risk[j] + impact)
+            for j, impact in zip(near, impacts)
+        )
+        gain = adjusted_score(float(scores[i]), risk) - loss
+
+        if heap and gain < -heap[0][0]:
+            heapq.heappush(heap, (-gain, i))
+            continue
+        if gain <= 0:
+            break  # borne de tous les autres candidats <= gain : plus rien à gagner
+
+        for j, impact in zip(near, impacts):
+            picked_risk[j] += impact
+        picked.add(lat, lng)
+        picked_score.append(float(scores[i]))
+        picked_risk.append(risk)
+        total += gain
+        sites.append({
+            "position": i,
+            "marginal_score": round(gain, 2),
+            "cumulative_score": round(total, 2),
+        })
+
+    # Risque final de chaque site : réseau existant + tous les autres sites choisis
+    objective = 0.0
+    for site, score, risk in zip(sites, picked_score, picked_risk):
+        site["canibalization_risk"] = round(min(100.0, risk), 1)
+        objective += adjusted_score(score, risk)
+    return {"sites": sites, "objective": round(objective, 2), "evaluations": evaluations, "complete": complete}
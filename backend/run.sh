@@ -21,10 +21,29 @@ elif [ "$MODE" = "prod" ]; then
     # This is a robust setup for production.
     # -w 4: Spawns 4 worker processes. A good starting point is (2 * number of CPU cores) + 1.
     # -k uvicorn.workers.UvicornWorker: Specifies that Uvicorn should handle the requests.
+    # Model artifacts are built/validated once here, not trained by each worker.
+    python ml_models.py --build || exit 1
     echo "🏭 Starting server in PRODUCTION mode on http://0.0.0.0:8000"
     gunicorn -w 4 -k uvicorn.workers.UvicornWorker api_server:app --bind 0.0.0.0:8000
 
+elif [ "$MODE" = "models" ]; then
+    # --- Build step ---
+    # Validates the model artifacts in snapshot/ (manifest version + sha256) and
+    # trains and saves them only if they are missing or invalid. Fails if they
+    # stay invalid. Commit snapshot/ afterwards: the artifacts ship with the code.
+    echo "🧠 Building ML model artifacts"
+    python ml_models.py --build
+
+elif [ "$MODE" = "snapshot" ]; then
+    # --- Build step ---
+    # Regenerates the cold-start snapshot (snapshot/atm_service.npz). Fails if the
+    # model artifacts in snapshot/ are missing or fail their checksum (see 'models').
+    # Run after any change to the ATM data and commit snapshot/: it is deployed
+    # with the code for serverless cold starts.
+    echo "📦 Building ATM service snapshot"
+    python service_snapshot.py
+
 else
-    echo "❌ Invalid mode: '$MODE'. Use 'dev' or 'prod'."
+    echo "❌ Invalid mode: '$MODE'. Use 'dev', 'prod', 'models' or 'snapshot'."
     exit 1
 fi
\ No newline at end of file
@@ -10,7 +10,11 @@ from pydantic import BaseModel, Field
 
 
 class LocationData(BaseModel):
-    """Input data for predicting the potential of a new ATM location."""
+    """
+    Input data for predicting the potential of a new ATM location.
+    Only latitude/longitude are required: omitted fields are derived from the
+    coordinates where the loaded datasets allow it, otherwise the defaults apply.
+    """
     latitude: float = Field(..., ge=-90, le=90, description="Latitude of the location.", example=33.5731)
     longitude: float = Field(..., ge=-180, le=180, description="Longitude of the location.", example=-7.5898)
     population_density: Optional[float] = Field(1000, description="Population density in the area.", example=1500)
@@ -43,6 +47,12 @@ class LocationData(BaseModel):
         }
 
 
+class GeoPoint(BaseModel):
+    """A bare latitude/longitude pair."""
+    latitude: float = Field(..., ge=-90, le=90, example=33.5731)
+    longitude: float = Field(..., ge=-180, le=180, example=-7.5898)
+
+
 class ATMData(BaseModel):
     """Represents an ATM machine's data."""
     id: str = Field(..., description="Unique identifier for the ATM.", example="ATMCASA01")
@@ -66,6 +76,12 @@ class PredictionResponse(BaseModel):
     canibalization_analysis: Dict[str, Any] = Field(..., description="Analysis of the potential impact on nearby ATMs.")
 
 
+class BatchPredictionResponse(BaseModel):
+    """The response from the batch prediction endpoint, one prediction per input location."""
+    predictions: List[PredictionResponse]
+    total_count: int
+
+
 class ATMListResponse(BaseModel):
     """Response model for a list of ATMs."""
     atms: List[ATMData]
@@ -146,6 +162,8 @@ class PopulationPoint(BaseModel):
 class PopulationListResponse(BaseModel):
     population: list[PopulationPoint]
     total_count: int
+    total_is_estimate: bool = False
+    next_cursor: Optional[str] = None
 
 class POI(BaseModel):
     id: str
@@ -170,6 +188,8 @@ class POI(BaseModel):
 class POIListResponse(BaseModel):
     pois: List[POI]
     total_count: int    
+    total_is_estimate: bool = False
+    next_cursor: Optional[str] = None
     
 
 class TransportPoint(BaseModel):
@@ -196,3 +216,35 @@ class TransportPoint(BaseModel):
 class TransportListResponse(BaseModel):
     transports: List[TransportPoint]
     total_count: int
+    total_is_estimate: bool = False
+    next_cursor: Optional[str] = None
+
+
+class PlacementRequest(BaseModel):
+    """Input of the multi-site placement optimizer: a candidate pool or a bbox, and a budget k."""
+    k: int = Field(..., ge=1, le=50, description="Number of new sites to choose.", example=5)
+    candidates: Optional[List[LocationData]] = Field(None, description="Candidate locations (takes precedence over bbox).")
+    bbox: Optional[str] = Field(None, description="Candidate area 'west,south,east,north', sampled on a grid.", example="-7.75,33.45,-7.45,33.65")
+    deadline_ms: int = Field(2000, ge=10, le=30000, description="Time budget for scoring and selection; the best solution so far is returned when it runs out.")
+
+
+class PlacedSite(BaseModel):
+    """One chosen site, in selection order."""
+    rank: int
+    latitude: float
+    longitude: float
+    predicted_volume: float
+    base_score: float = Field(..., description="Predictor global score before cannibalization.")
+    canibalization_risk: float = Field(..., description="Final risk from existing ATMs and the other chosen sites.")
+    marginal_score: float = Field(..., description="Objective gained by this site: its adjusted score minus the drop it causes on the sites chosen before it.")
+    cumulative_score: float = Field(..., description="Objective after this site was chosen.")
+
+
+class PlacementResponse(BaseModel):
+    """Result of the placement optimizer."""
+    sites: List[PlacedSite]
+    objective: float = Field(..., description="Sum of the adjusted scores of the chosen sites.")
+    candidate_count: int
+    evaluations: int
+    elapsed_ms: float
+    complete: bool = Field(..., description="False when the deadline stopped the search early (some candidates may be unscored).")
@@ -0,0 +1,79 @@
+"""
+Moteur de scoring vectorisé des communes.
+
+La matrice des indicateurs normalisés [0..1] (une ligne par commune, une
+colonne par critère) est construite une fois au chargement du master ; un
+profil de pondération se score alors en un seul produit matrice-vecteur, et
+les scores sont mis en cache par profil.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Nombre de profils de pondération gardés en cache
+SCORE_CACHE_SIZE = 32
+
+
+class ScoringEngine:
+    """Scores de toutes les communes pour n'importe quel jeu de poids."""
+
+    def __init__(self, keys: Sequence[str], parts: np.ndarray):
+        self.keys: Tuple[str, ...] = tuple(keys)
+        self.parts = np.ascontiguousarray(parts, dtype=np.float64)
+        if self.parts.shape[1] != len(self.keys):
+            raise ValueError("parts doit avoir une colonne par critère")
+        self._cache: "OrderedDict[Tuple[float, ...], np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self.parts.shape[0]
+
+    def normalized_weights(self, weights: Dict[str, float]) -> np.ndarray:
+        """Poids ramenés à une somme de 1 (mêmes règles que compute_site_score)."""
+        w = [float(weights.get(k, 0.0)) for k in self.keys]
+        sumw = sum(w)
+        return np.array(w, dtype=np.float64) / (sumw if sumw > 0 else 1.0)
+
+    def scores(self, weights: Dict[str, float]) -> np.ndarray:
+        """Score 0..100 (arrondi à 2 décimales) de chaque commune, en cache par profil."""
+        profile = tuple(float(weights.get(k, 0.0)) for k in self.keys)
+        with self._lock:
+            cached = self._cache.get(profile)
+            if cached is not None:
+                self._cache.move_to_end(profile)
+                return cached
+
+        # Accumulation colonne par colonne, dans l'ordre des critères, puis
+        # round() Python (arrondi exact, contrairement à np.round) : scores
+        # identiques à ceux de compute_site_score
+        total01 = np.zeros(len(self), dtype=np.float64)
+        for j, wk in enumerate(self.normalized_weights(weights)):
+            total01 += wk * self.parts[:, j]
+        scores = np.array([round(x, 2) for x in (100.0 * total01).tolist()], dtype=np.float64)
+        scores.setflags(write=False)
+
+        with self._lock:
+            self._cache[profile] = scores
+            if len(self._cache) > SCORE_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return scores
+
+    def top_k(self, weights: Dict[str, float], k: int, mask: Optional[np.ndarray] = None) -> np.ndarray:
+        """Positions des k meilleures communes (score décroissant), filtrées par `mask`."""
+        scores = self.scores(weights)
+        candidates = np.flatnonzero(mask) if mask is not None else np.arange(len(scores))
+        if k <= 0 or candidates.size == 0:
+            return np.empty(0, dtype=np.int64)
+        sub = scores[candidates]
+        if k < sub.size:
+            part = np.argpartition(-sub, k - 1)[:k]
+        else:
+            part = np.arange(sub.size)
+        # Tri final des k retenus seulement ; égalités départagées par position
+        order = np.lexsort((candidates[part], -sub[part]))
+        return candidates[part[order]]
@@ -0,0 +1,144 @@
+"""
+Instantané compact de l'état initialisé d'ATMService (démarrages à froid).
+
+Les ATMs sont stockés en colonnes dans un .npz sans pickle : coordonnées en
+float64, identifiants en chaînes fixes, champs catégoriels encodés en codes
+int32 + vocabulaire. La relecture reconstruit les ATMData sans validation
+(construct) et sans reparser le CSV ; le jeton de version de la liste est
+stocké tel quel. Les artefacts du modèle restent ceux de save_models
+(chargés en mmap, vérifiés par checksum), livrés dans le même dossier.
+
+Génération : `python service_snapshot.py` depuis backend/, ou
+`./run.sh snapshot`, après toute modification des ATMs. L'instantané est
+versionné avec le code (snapshot/, hors data_cache/ qui n'est ni suivi ni
+déployé) : les fonctions serverless le trouvent au démarrage à froid. La
+génération échoue si les artefacts du modèle sont absents ou invalides
+(`./run.sh models` les produit).
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from data_cache import atomic_write, file_digest, file_fingerprint
+from schemas import ATMData
+
+logger = logging.getLogger(__name__)
+
+# Versionné et déployé avec le code (data_cache/ est ignoré par git et Docker)
+SNAPSHOT_PATH = Path(__file__).parent / "snapshot" / "atm_service.npz"
+
+# À incrémenter dès que le format de l'instantané ou la logique de _load_atm_csv change
+SNAPSHOT_FORMAT_VERSION = 1
+
+# Champs texte à faible cardinalité, encodés par dictionnaire (None permis)
+_CATEGORICAL_FIELDS = ("bank_name", "status", "installation_type", "city", "region")
+
+
+def _encode_categorical(values: Sequence[Optional[str]]) -> Tuple[np.ndarray, List[Optional[str]]]:
+    vocab: Dict[Optional[str], int] = {}
+    codes = np.fromiter((vocab.setdefault(v, len(vocab)) for v in values), dtype=np.int32, count=len(values))
+    return codes, list(vocab)
+
+
+def write_snapshot(atms: Sequence[ATMData], version: str, source: Path, path: Path = SNAPSHOT_PATH) -> Path:
+    """Écrit l'instantané de `atms` (liste chargée depuis `source`) de façon atomique."""
+    meta: Dict[str, Any] = {
+        "format": SNAPSHOT_FORMAT_VERSION,
+        "version": version,
+        "count": len(atms),
+        "source": source.name,
+    }
+    if source.exists():
+        meta.update(file_fingerprint(source), sha256=file_digest(source))
+
+    arrays: Dict[str, np.ndarray] = {
+        "id": np.array([str(a.id) for a in atms], dtype=str),
+        "latitude": np.array([a.latitude for a in atms], dtype=np.float64),
+        "longitude": np.array([a.longitude for a in atms], dtype=np.float64),
+    }
+    vocabularies = {}
+    for field in _CATEGORICAL_FIELDS:
+        arrays[field], vocabularies[field] = _encode_categorical([getattr(a, field) for a in atms])
+    meta["vocabularies"] = vocabularies
+    arrays["meta"] = np.array(json.dumps(meta, ensure_ascii=False))
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    def write(tmp: str) -> None:
+        with open(tmp, "wb") as f:
+            np.savez(f, **arrays)
+
+    atomic_write(path, write)
+    logger.info("Instantané ATM écrit: %s (%d ATMs)", path, len(atms))
+    return path
+
+
+def _is_fresh(meta: Dict[str, Any], source: Path) -> bool:
+    """L'instantané correspond-il encore à `source` ? (taille + mtime, sinon sha256)."""
+    if meta.get("format") != SNAPSHOT_FORMAT_VERSION:
+        return False
+    if not source.exists():
+        # Source non déployée : l'instantané fait foi
+        return True
+    fp = file_fingerprint(source)
+    if meta.get("size") != fp["size"]:
+        return False
+    return meta.get("mtime_ns") == fp["mtime_ns"] or meta.get("sha256") == file_digest(source)
+
+
+def read_snapshot(source: Path, path: Path = SNAPSHOT_PATH) -> Optional[Tuple[List[ATMData], str]]:
+    """
+    (ATMs, jeton de version) depuis l'instantané, ou None s'il est absent,
+    illisible ou périmé par rapport à `source`.
+    """
+    if not path.exists():
+        return None
+    t0 = time.perf_counter()
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            if not _is_fresh(meta, source):
+                logger.info("Instantané ATM périmé (%s modifié), ignoré", source.name)
+                return None
+            columns = {
+                "id": data["id"].tolist(),
+                "latitude": data["latitude"].tolist(),
+                "longitude": data["longitude"].tolist(),
+            }
+            for field in _CATEGORICAL_FIELDS:
+                vocab = meta["vocabularies"][field]
+                columns[field] = [vocab[c] for c in data[field].tolist()]
+    except Exception as e:
+        logger.warning("Instantané ATM illisible (%s), ignoré", e)
+        return None
+
+    names = list(columns)
+    # Données déjà validées au build : pas de revalidation Pydantic
+    atms = [ATMData.construct(**dict(zip(names, row))) for row in zip(*columns.values())]
+    logger.info("Instantané ATM chargé en %.1f ms (%d ATMs)", (time.perf_counter() - t0) * 1000, len(atms))
+    return atms, meta["version"]
+
+
+if __name__ == "__main__":
+    import asyncio
+    import sys
+
+    from services import ATM_FILE, atm_service
+
+    logging.basicConfig(level=logging.INFO)
+    # Les artefacts du modèle sont livrés avec l'instantané : absents ou invalides, le build échoue
+    try:
+        atm_service.predictor.load_models()
+    except (FileNotFoundError, ValueError, KeyError) as e:
+        logger.error("Artefacts du modèle absents ou invalides (%s) : lancer ./run.sh models", e)
+        sys.exit(1)
+
+    asyncio.run(atm_service.reload_data())
+    write_snapshot(atm_service.existing_atms, atm_service.version, ATM_FILE)
@@ -6,31 +6,42 @@ Unifie les noms de colonnes (CSV) et normalise les indicateurs en [0..1].
 from __future__ import annotations
 
 import asyncio
+import base64
+import functools
+import hashlib
 import itertools
 import json
 import logging
 import math
-from functools import lru_cache
+import threading
+import time
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 import aiofiles
+import numpy as np
 import pandas as pd
-from pydantic import ValidationError, parse_obj_as
-
-from ml_models import ATMLocationPredictor, CanibalizationAnalyzer
-
-from schemas import (
-    ATMData,
-    CompetitorData,
-    CompetitorListResponse,
-    PopulationPoint,
-    PopulationListResponse,
-    POI,
-    POIListResponse,
-    TransportPoint,
-    TransportListResponse,
-)
+from pydantic import parse_obj_as
+
+from ml_models import ATMLocationPredictor, CanibalizationAnalyzer, ModelNotReadyError
+from atm_state import ATMState
+from clustering import ClusterPyramid
+from coverage import COVERAGE_BANDS_KM, COVERAGE_RADIUS_KM, MAX_COVERAGE_BANDS, NetworkCoverage
+from data_cache import dataset_version, digest_version, file_digest, file_fingerprint, load_cached_frame, record_version
+from data_generation import DataGeneration, current_generation, generation_cached, pinned, publish, rebuild
+from enrichment import BUSINESS_POI_COUNT, NEARBY_RADIUS_KM, CellFeatureCache, apply_features
+from hexbin import MAX_HEX_RES, HexPyramid
+from name_index import NameIndex, fold_key
+from network_stats import NetworkAggregates
+from opportunity import OpportunitySurface, build_surface, grid_centers
+from placement import lazy_greedy
+from scoring import ScoringEngine
+from service_snapshot import read_snapshot
+from spatial_index import KM_PER_DEG_LAT, GridIndex, NearestIndex, PolygonIndex, haversine_km
+from tiles import TileSource
+from topology import Topology
+
+from schemas import ATMData, LocationData
 
 
 logger = logging.getLogger(__name__)
@@ -148,47 +159,309 @@ def _load_atm_csv() -> List[ATMData]:
 # ATM service
 # =====================================================================
 
+# Nombre maximal d'emplacements par appel /predict/batch
+MAX_PREDICTION_BATCH = 1000
+# Nombre maximal de points par appel /communes/indicators/batch
+MAX_RESOLVE_BATCH = 5000
+
+def _atm_list_version(atms: List[ATMData], previous: str = "") -> str:
+    """Jeton de version d'une liste d'ATMs (hash du contenu, chaîné lors des ajouts)."""
+    h = hashlib.sha256(previous.encode("utf-8"))
+    for atm in atms:
+        h.update(json.dumps(atm.dict(), sort_keys=True, default=str).encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+def _atm_clusters(state: ATMState) -> ClusterPyramid:
+    def build() -> ClusterPyramid:
+        atms = state.atms
+        return ClusterPyramid(
+            [a.latitude for a in atms], [a.longitude for a in atms],
+            [a.bank_name for a in atms], [a.id for a in atms],
+        )
+    return state.derived("clusters", build)
+
+
+def _atm_tiles(state: ATMState) -> TileSource:
+    def build() -> TileSource:
+        atms = state.atms
+        return TileSource(
+            "atms", [a.latitude for a in atms], [a.longitude for a in atms],
+            {
+                "id": [a.id for a in atms],
+                "bank_name": [a.bank_name for a in atms],
+                "installation_type": [a.installation_type for a in atms],
+                "status": [a.status for a in atms],
+                "city": [a.city for a in atms],
+            },
+        )
+    return state.derived("tiles", build)
+
+
+def _atm_hexbins(state: ATMState) -> HexPyramid:
+    return state.derived("hexbins", lambda: HexPyramid([a.latitude for a in state.atms],
+                                                       [a.longitude for a in state.atms]))
+
+
+def _prebuild_state(state: ATMState) -> ATMState:
+    """
+    Construit les pyramides de carte (clusters, tuiles, hexbins) d'un état,
+    entrées derived calculées sinon à la première lecture. Appelée hors de la
+    boucle : avant la publication au chargement, juste après pour un ajout.
+    """
+    _atm_clusters(state)
+    _atm_tiles(state)
+    _atm_hexbins(state)
+    return state
+
+
 class ATMService:
     def __init__(self):
         self.predictor = ATMLocationPredictor()
-        self.canibalization_analyzer = CanibalizationAnalyzer()
-        self.existing_atms: List[ATMData] = []
-        self.lock = asyncio.Lock()
+        self._training_thread: Optional[threading.Thread] = None
+        # État courant (immuable, cf. atm_state) : lu sans verrou, remplacé d'un bloc
+        self._state = ATMState.build([], _atm_list_version([]))
+        # Tenu seulement le temps de comparer et remplacer self._state ; jamais pris par les lecteurs
+        self._publish_lock = threading.Lock()
+
+    # Vue de l'état courant ; un lecteur qui en utilise plusieurs prend `state` une fois
+    @property
+    def state(self) -> ATMState:
+        return self._state
+
+    @property
+    def existing_atms(self) -> Tuple[ATMData, ...]:
+        return self._state.atms
+
+    @property
+    def version(self) -> str:
+        return self._state.version
+
+    @property
+    def canibalization_analyzer(self) -> CanibalizationAnalyzer:
+        return self._state.analyzer
+
+    @property
+    def name_index(self) -> NameIndex:
+        return self._state.names
+
+    @property
+    def aggregates(self) -> NetworkAggregates:
+        return self._state.aggregates
+
+    @property
+    def points(self) -> NearestIndex:
+        return self._state.points
 
     async def _load_and_merge_atms(self) -> List[ATMData]:
-     csv_atms: List[ATMData] = _load_atm_csv()
+     csv_atms: List[ATMData] = await asyncio.to_thread(_load_atm_csv)
      return csv_atms
 
 
-    async def initialize(self):
-        logger.info("Training ML models (temporarily disabled)...")
+    async def initialize(self, use_snapshot: bool = False):
+        """
+        Charge les artefacts du modèle puis les ATMs. Avec use_snapshot, les
+        ATMs viennent de l'instantané de build s'il est à jour (cf. service_snapshot).
+        """
+        logger.info("Loading ML model artifacts...")
         try:
-            # self.predictor.train()
-            self.predictor.is_trained = True
-            logger.info("Skipping model training, using dummy predictor.")
+            metrics = self.predictor.load_models()
+            logger.info("Model artifacts v%s loaded in %.1f ms (checksums %.1f ms)",
+                        metrics["version"], metrics["load_ms"], metrics["checksum_ms"])
+        except (FileNotFoundError, ValueError, KeyError) as e:
+            # Repli seulement : les artefacts sont produits au build (./run.sh models, Dockerfile)
+            logger.warning("No usable model artifacts (%s); training in background.", e)
+            self.start_background_training()
         except Exception as e:
-            logger.error(f"Error initializing predictor: {e}", exc_info=True)
+            logger.error(f"Error loading model artifacts: {e}", exc_info=True)
+            self.start_background_training()
 
+        if use_snapshot and self.load_snapshot():
+            return
         logger.info("Loading ATM data...")
         await self.reload_data()
 
+    def start_background_training(self) -> None:
+        """Entraîne un nouveau prédicteur dans un thread, puis le publie d'un coup."""
+        if self._training_thread is not None and self._training_thread.is_alive():
+            return
+        self._training_thread = threading.Thread(
+            target=self._train_in_background, name="model-training", daemon=True
+        )
+        self._training_thread.start()
+
+    def _train_in_background(self) -> None:
+        predictor = ATMLocationPredictor()
+        try:
+            predictor.train()
+        except Exception as e:
+            logger.error("Background model training failed: %s", e, exc_info=True)
+            return
+        try:
+            predictor.save_models()
+        except Exception as e:
+            logger.warning("Could not persist trained models: %s", e)
+        self.predictor = predictor
+        logger.info("Background training done, predictor swapped in.")
+
     async def reload_data(self):
-        self.existing_atms = await self._load_and_merge_atms()
-        self.canibalization_analyzer = CanibalizationAnalyzer()
-        for atm in self.existing_atms:
-            self.canibalization_analyzer.add_existing_atm(atm)
-        logger.info("%d ATMs loaded and analyzer updated.", len(self.existing_atms))
+        atms = await self._load_and_merge_atms()
+        # Structures dérivées construites hors de la boucle, publiées à la fin de _publish
+        await asyncio.to_thread(self._publish, atms)
+
+    def load_snapshot(self) -> bool:
+        """Publie les ATMs de l'instantané de build ; False s'il est absent ou périmé."""
+        snapshot = read_snapshot(ATM_FILE)
+        if snapshot is None:
+            return False
+        atms, version = snapshot
+        self._publish(atms, version)
+        return True
+
+    def _publish(self, atms: List[ATMData], version: Optional[str] = None) -> None:
+        """Construit l'état d'une liste d'ATMs (structures dérivées comprises), puis le publie."""
+        state = _prebuild_state(ATMState.build(atms, version or _atm_list_version(atms)))
+        with self._publish_lock:
+            self._state = state
+        logger.info("%d ATMs loaded and analyzer updated.", len(state))
 
-    
     async def add_new_atm(self, atm: ATMData) -> ATMData:
-        async with self.lock:
-            if any(existing.id == atm.id for existing in self.existing_atms):
+        """
+        Construit l'état suivant depuis l'état courant, hors verrou, puis le
+        publie s'il n'a pas changé entre-temps (sinon recommence sur le nouvel
+        état). Les pyramides de carte du nouvel état sont ensuite construites
+        dans un thread ; une lecture antérieure les calcule elle-même.
+        """
+        while True:
+            base = self._state
+            if atm.id in base.ids:
                 raise ValueError(f"An ATM with id '{atm.id}' already exists.")
-            self.existing_atms.append(atm)
-            self.canibalization_analyzer.add_existing_atm(atm)
-            
+            state = base.with_atm(atm, _atm_list_version([atm], previous=base.version))
+            with self._publish_lock:
+                if self._state is base:
+                    self._state = state
+                    break
+        await asyncio.to_thread(self._prebuild_if_current, state)
         return atm
 
+    def _prebuild_if_current(self, state: ATMState) -> None:
+        """Pyramides de `state` s'il est encore l'état publié (inutile s'il a déjà été remplacé)."""
+        if self._state is state:
+            _prebuild_state(state)
+
+    def cluster_pyramid(self) -> ClusterPyramid:
+        """Pyramide de clusters des ATMs (construite au chargement et après chaque ajout, cf. _prebuild_state)."""
+        return _atm_clusters(self._state)
+
+    def tile_source(self) -> TileSource:
+        """Tuiles MVT des ATMs (source construite au chargement et après chaque ajout, cf. _prebuild_state)."""
+        return _atm_tiles(self._state)
+
+    def network_summary(self) -> Dict[str, Any]:
+        """Résumé et analyse régionale du réseau (précalculés, cf. NetworkAggregates)."""
+        return self._state.aggregates.snapshot()
+
+    def hex_pyramid(self) -> HexPyramid:
+        """Hexbins des ATMs (construits au chargement et après chaque ajout, cf. _prebuild_state)."""
+        return _atm_hexbins(self._state)
+
+    def coverage(self) -> NetworkCoverage:
+        """
+        Couverture pondérée par la population (cf. coverage), calculée une
+        fois par état et version du master ; un ajout la met à jour sans recalcul.
+        """
+        state = self._state
+        _load_population_df()
+        key = ("coverage", dataset_version("population") or "")
+        return state.derived(key, lambda: _build_network_coverage(state.points))
+
+    def search_atms(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """ATMs dont l'id, la banque ou la ville correspond à `query` (insensible aux accents)."""
+        state = self._state
+        return [
+            {**state.atms[pos].dict(), "relevance": relevance}
+            for pos, relevance in state.names.search(query, limit)
+        ]
+
+    def predict(self, location: LocationData) -> Dict[str, Any]:
+        """Prédiction d'un emplacement, ajustée de la cannibalisation (format PredictionResponse)."""
+        return self.predict_batch([location])[0]
+
+    def predict_batch(self, locations: List[LocationData]) -> List[Dict[str, Any]]:
+        """
+        Prédictions d'un lot d'emplacements : champs non fournis dérivés des
+        coordonnées (enrich_locations), scaler + modèles sur la matrice
+        empilée, cannibalisation de tous les candidats en un passage.
+        """
+        locations = enrich_locations(locations)
+        predictions = self.predictor.predict_locations(locations)
+        canibs = self._state.analyzer.calculate_canibalization_batch(locations)
+
+        results: List[Dict[str, Any]] = []
+        for prediction, canib in zip(predictions, canibs):
+            adjusted_score = prediction["global_score"] * (1 - canib["canibalization_risk"] / 200)
+            results.append({
+                "predicted_volume": prediction["predicted_volume"],
+                "roi_probability": prediction["roi_probability"],
+                "roi_prediction": prediction["roi_prediction"],
+                "global_score": round(max(0, adjusted_score), 2),
+                "reason_codes": prediction["reason_codes"],
+                "recommendation": prediction["recommendation"],
+                "canibalization_analysis": canib,
+            })
+        return results
+
+    def optimize_placement(self, candidates: List[LocationData], k: int,
+                           deadline_ms: Optional[float] = None) -> Dict[str, Any]:
+        """
+        k nouveaux sites parmi `candidates` (glouton paresseux, cf. placement) :
+        scores du prédicteur, cannibalisation par le réseau existant puis entre
+        sites choisis. Format PlacementResponse. `deadline_ms` couvre le
+        scoring (par blocs de PLACEMENT_SCORE_CHUNK candidats, au moins un
+        bloc) et la sélection : les candidats non scorés à temps sont ignorés.
+        """
+        t0 = time.perf_counter()
+        deadline = t0 + deadline_ms / 1000.0 if deadline_ms is not None else None
+        analyzer = self._state.analyzer
+        candidate_count = len(candidates)
+        scored: List[LocationData] = []
+        predictions: List[Dict[str, Any]] = []
+        canibs: List[Dict[str, Any]] = []
+        for start in range(0, len(candidates), PLACEMENT_SCORE_CHUNK):
+            if scored and deadline is not None and time.perf_counter() > deadline:
+                break
+            chunk = enrich_locations(candidates[start:start + PLACEMENT_SCORE_CHUNK])
+            predictions += self.predictor.predict_locations(chunk)
+            canibs += analyzer.calculate_canibalization_batch(chunk)
+            scored += chunk
+        candidates = scored
+
+        scores = np.array([p["global_score"] for p in predictions], dtype=np.float64)
+        risks = np.array([c["canibalization_risk"] for c in canibs], dtype=np.float64)
+        lats = np.array([c.latitude for c in candidates], dtype=np.float64)
+        lngs = np.array([c.longitude for c in candidates], dtype=np.float64)
+        result = lazy_greedy(scores, risks, lats, lngs, k, deadline)
+
+        sites = []
+        for rank, site in enumerate(result["sites"], start=1):
+            i = site.pop("position")
+            sites.append({
+                "rank": rank,
+                "latitude": candidates[i].latitude,
+                "longitude": candidates[i].longitude,
+                "predicted_volume": predictions[i]["predicted_volume"],
+                "base_score": round(float(scores[i]), 2),
+                **site,
+            })
+        return {
+            "sites": sites,
+            "objective": result["objective"],
+            "candidate_count": candidate_count,
+            "evaluations": result["evaluations"],
+            "elapsed_ms": round((time.perf_counter() - t0) * 1000, 1),
+            "complete": result["complete"] and len(scored) == candidate_count,
+        }
+
     async def simulate_external_updates(self):
         await self.reload_data()
 
@@ -223,12 +496,13 @@ def _geom_centroid_latlng(geometry: Dict[str, Any]) -> Tuple[float, float]:
     return (sum(lats) / len(lats), sum(lngs) / len(lngs))
 
 
-@lru_cache(maxsize=1)
+@generation_cached("communes")
 def _load_communes_geojson() -> Dict[str, Any]:
     if not COMMUNES_GEOJSON.exists():
         raise FileNotFoundError(f"Fichier manquant: {COMMUNES_GEOJSON}")
     with open(COMMUNES_GEOJSON, "r", encoding="utf-8") as f:
         gj = json.load(f)
+    record_version("communes", file_digest(COMMUNES_GEOJSON))
 
     for feat in gj.get("features", []):
         props = feat.setdefault("properties", {})
@@ -251,26 +525,97 @@ def _load_communes_geojson() -> Dict[str, Any]:
     return gj
 
 
+@generation_cached()
+def _load_commune_polygons() -> Tuple[Optional[PolygonIndex], np.ndarray]:
+    """
+    Index des polygones de communes.geojson + rang (iloc) de la ligne du master
+    associée à chaque feature (-1 si la commune n'est pas dans le master).
+    (None, []) si le GeoJSON est absent : résolution par centroïde uniquement.
+    """
+    df = _load_population_df()
+    try:
+        gj = _load_communes_geojson()
+    except FileNotFoundError:
+        logger.warning("communes.geojson absent : résolution des communes par centroïde uniquement.")
+        return None, np.empty(0, dtype=np.int64)
+
+    master: Dict[str, int] = {}
+    for col in ("commune_norm", "commune"):
+        if col in df.columns:
+            for pos, name in enumerate(df[col].tolist()):
+                master.setdefault(fold_key(name), pos)
+
+    features = gj.get("features", [])
+    rows = np.full(len(features), -1, dtype=np.int64)
+    for fid, feat in enumerate(features):
+        props = feat.get("properties", {})
+        for name in (props.get("commune_norm"), props.get("commune")):
+            pos = master.get(fold_key(name)) if name else None
+            if pos is not None:
+                rows[fid] = pos
+                break
+
+    index = PolygonIndex([feat.get("geometry") for feat in features])
+    logger.info("Index polygones communes: %d parties, %d/%d features reliées au master",
+                len(index), int((rows >= 0).sum()), len(features))
+    return index, rows
+
+
+# Au-delà, la simplification ne retire plus rien de visible : pleine résolution
+MAX_GEOJSON_ZOOM = 16
+COMMUNES_FORMATS = ("geo", "topo")
+
+
+@generation_cached()
+def _load_commune_topology() -> Topology:
+    """Topologie quantifiée des communes (arcs partagés + poids de simplification)."""
+    return Topology(_load_communes_geojson().get("features", []))
+
+
+@generation_cached()
+def get_communes_geojson_bytes(zoom: Optional[int] = None, fmt: str = "geo") -> bytes:
+    """
+    Polygones des communes prêts à servir : GeoJSON ('geo') ou TopoJSON
+    ('topo'), simplifiés pour `zoom` (None = pleine résolution). Sans zoom,
+    'geo' renvoie le GeoJSON d'origine tel quel.
+    """
+    if fmt not in COMMUNES_FORMATS:
+        raise ValueError(f"Format inconnu '{fmt}' (attendu: {', '.join(COMMUNES_FORMATS)})")
+    if zoom is not None and zoom >= MAX_GEOJSON_ZOOM:
+        zoom = None
+    if fmt == "geo" and zoom is None:
+        return dump_json(_load_communes_geojson())
+    topo = _load_commune_topology()
+    return dump_json(topo.to_topojson(zoom) if fmt == "topo" else topo.to_geojson(zoom))
+
+
+@generation_cached()
+def _load_commune_feature_keys() -> Dict[str, int]:
+    """Clé repliée (commune_norm, commune, code) -> indice de la première feature correspondante."""
+    keys: Dict[str, int] = {}
+    for fid, feat in enumerate(_load_communes_geojson().get("features", [])):
+        p = feat.get("properties", {})
+        for name in (p.get("commune_norm"), p.get("commune"), p.get("code")):
+            key = fold_key(name)
+            if key:
+                keys.setdefault(key, fid)
+    return keys
+
+
 def get_commune_feature(commune_or_code: str) -> Optional[Dict[str, Any]]:
     if not commune_or_code:
         return None
-    key = str(commune_or_code).strip().lower()
-    gj = _load_communes_geojson()
-    for feat in gj.get("features", []):
-        p = feat.get("properties", {})
-        if p.get("commune_norm") == key:
-            return feat
-        if str(p.get("code", "")).strip().lower() == key:
-            return feat
-    return None
+    fid = _load_commune_feature_keys().get(fold_key(commune_or_code))
+    if fid is None:
+        return None
+    return _load_communes_geojson()["features"][fid]
 
 
 # =====================================================================
 # Compétiteurs
 # =====================================================================
 
-@lru_cache(maxsize=1)
-def _load_competitors_df() -> pd.DataFrame:
+def _read_competitors_csv() -> pd.DataFrame:
     """
     Charge les concurrents depuis un CSV de points réels.
 
@@ -317,49 +662,58 @@ def _load_competitors_df() -> pd.DataFrame:
     return df
 
 
+@generation_cached("competitors")
+def _load_competitors_df() -> pd.DataFrame:
+    """Concurrents nettoyés, servis depuis le cache disque tant que le CSV ne change pas."""
+    if not COMPETITORS_FILE.exists():
+        raise FileNotFoundError(f"Fichier introuvable: {COMPETITORS_FILE}")
+    return load_cached_frame("competitors", COMPETITORS_FILE, _read_competitors_csv)
+
+
 
-def get_competitors() -> CompetitorListResponse:
+def get_competitors() -> Dict[str, Any]:
     """
     Retourne les concurrents à partir du CSV de points réels.
     1 ligne CSV = 1 ATM concurrent (nb_atm = 1).
+    Payload au format CompetitorListResponse, sérialisé colonne par colonne.
     """
-    df = _load_competitors_df()
-    items: List[CompetitorData] = []
+    items = _load_competitor_records()
+    return {"competitors": items, "total_count": len(items)}
 
-    for i, row in df.iterrows():
-        try:
-            # Nom de la banque : operator puis name
-            bank_name = row["operator"] if row["operator"] not in ("", "nan", "None") else row["name"]
 
-            # Commune / commune_norm
-            commune = row.get("commune") or row.get("city_name") or ""
-            commune_norm = (
-                str(commune).strip().lower()
-                if commune not in ("", "nan", "None")
-                else ""
-            )
+@generation_cached()
+def _load_competitor_records() -> List[Dict[str, Any]]:
+    return _competitor_records(_load_competitors_df())
 
-            # id = name, sinon operator, sinon fallback CMP-i
-            comp_id = row["name"] if row["name"] not in ("", "nan", "None") else row["operator"]
-            if not comp_id:
-                comp_id = f"CMP-{i+1}"
 
-            items.append(
-                CompetitorData(
-                    id=comp_id,
-                    bank_name=bank_name or "Inconnue",
-                    latitude=float(row["lat"]),
-                    longitude=float(row["lon"]),
-                    commune=commune,
-                    commune_norm=commune_norm,
-                    nb_atm=1,  # 1 point = 1 ATM concurrent
-                )
-            )
-        except (ValueError, TypeError, ValidationError) as e:
-            logger.error("Ligne concurrents ignorée (%s): %s", e.__class__.__name__, e)
+def _competitor_records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Lignes concurrents -> dicts CompetitorData, sans boucle ligne à ligne pandas."""
+    name = df["name"]
+    operator = df["operator"]
+
+    # Nom de la banque : operator puis name
+    bank_name = operator.where(_is_filled(operator), name)
+    bank_name = bank_name.where(bank_name != "", "Inconnue")
 
-    return CompetitorListResponse(competitors=items, total_count=len(items))
+    # Commune / commune_norm
+    commune = df["commune"] if "commune" in df.columns else df["city_name"]
+    commune = commune.where(commune.notna() & (commune != ""), df["city_name"]).fillna("")
+    commune_norm = commune.astype(str).str.strip().str.lower().where(_is_filled(commune), "")
 
+    # id = name, sinon operator, sinon fallback CMP-i
+    comp_id = name.where(_is_filled(name), operator)
+    comp_id = comp_id.where(comp_id != "", "CMP-" + _label_numbers(df))
+
+    columns = {
+        "id": comp_id.tolist(),
+        "bank_name": bank_name.tolist(),
+        "latitude": df["lat"].astype(float).tolist(),
+        "longitude": df["lon"].astype(float).tolist(),
+        "commune": commune.tolist(),
+        "commune_norm": commune_norm.tolist(),
+        "nb_atm": [1] * len(df),  # 1 point = 1 ATM concurrent
+    }
+    return _records(columns)
 
 
 # =====================================================================
@@ -386,12 +740,157 @@ def _to01(v: Any) -> float:
     return x / 100.0 if x > 1.0 else (x if x <= 1.0 else 1.0)
 
 
+def _to01_array(values: Any) -> np.ndarray:
+    """Version vectorisée de _to01 pour des colonnes déjà numériques."""
+    x = np.asarray(values, dtype=np.float64)
+    return np.where(x < 0, 0.0, np.where(x > 1.0, x / 100.0, np.where(x <= 1.0, x, 1.0)))
+
+
+# =====================================================================
+# Sérialisation colonnaire (réponses des couches)
+# =====================================================================
+
+_EMPTY_MARKERS = ("", "nan", "None")
+
+
+def _is_filled(col: pd.Series) -> pd.Series:
+    """True si la cellule n'est ni vide ni un marqueur 'nan'/'None' issu de astype(str)."""
+    return col.notna() & ~col.isin(_EMPTY_MARKERS)
+
+
+def _label_numbers(df: pd.DataFrame) -> pd.Series:
+    """Numéros '1'-based des labels d'index (ids stables POP-/POI-/TP-/CMP-)."""
+    return pd.Series(df.index + 1, index=df.index).astype(str)
+
+
+def _or_none(values: List[Any]) -> List[Any]:
+    """Équivalent de `row.get(col) or None`, NaN compris."""
+    return [v if v and v == v else None for v in values]
+
+
+def _optional_column(df: pd.DataFrame, col: str) -> List[Any]:
+    if col not in df.columns:
+        return [None] * len(df)
+    return _or_none(df[col].tolist())
+
+
+def _records(columns: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    """Colonnes -> liste de dicts, dans l'ordre des champs du schéma."""
+    keys = list(columns)
+    return [dict(zip(keys, row)) for row in zip(*columns.values())]
+
+
+def _parse_tags(raw: Any) -> Optional[Dict[str, Any]]:
+    """tags_json -> dict (une seule fois, au chargement)."""
+    if raw is None or (isinstance(raw, float) and math.isnan(raw)):
+        return None
+    try:
+        tags = json.loads(raw)
+    except Exception:
+        return None
+    return tags if isinstance(tags, dict) else None
+
+
+def dump_json(payload: Any) -> bytes:
+    """Encode un payload de réponse en JSON compact UTF-8 (même rendu que FastAPI)."""
+    return json.dumps(payload, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+# ---------- NDJSON (dumps de couches complètes en flux) ----------
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+# Lignes par bloc écrit : assez pour amortir les écritures, assez peu pour un premier octet rapide
+NDJSON_CHUNK_LINES = 256
+
+
+def ndjson_chunks(items: Iterable[Dict[str, Any]], lines_per_chunk: int = NDJSON_CHUNK_LINES) -> Iterator[bytes]:
+    """Un objet JSON par ligne, encodés au fil de l'eau et regroupés en blocs."""
+    buf: List[bytes] = []
+    for item in items:
+        buf.append(dump_json(item))
+        if len(buf) >= lines_per_chunk:
+            yield b"\n".join(buf) + b"\n"
+            buf = []
+    if buf:
+        yield b"\n".join(buf) + b"\n"
+
+
+def stream_atms(service: Optional["ATMService"] = None, state: Optional[ATMState] = None) -> Iterator[bytes]:
+    """ATMs (de `state`, par défaut l'état courant) au format NDJSON, sérialisés un à un."""
+    atms = (state or (service or atm_service).state).atms
+    return ndjson_chunks(atm.dict() for atm in atms)
+
+
+def stream_competitors() -> Iterator[bytes]:
+    """Concurrents au format NDJSON (CompetitorData par ligne)."""
+    return ndjson_chunks(iter(_load_competitor_records()))
+
+
+@generation_cached()
+def _load_spatial_index(layer: str) -> GridIndex:
+    """Index bbox d'une couche (population | pois | transport), construit une fois par chargement."""
+    if layer == "population":
+        df, lat_col, lng_col = _load_population_df(), "latitude", "longitude"
+    elif layer == "pois":
+        df, lat_col, lng_col = _load_poi_df(), "latitude", "longitude"
+    elif layer == "transport":
+        df, lat_col, lng_col = _load_transport_df(), "lat", "lon"
+    else:
+        raise KeyError(f"Couche sans index spatial '{layer}'")
+    return GridIndex(df[lat_col].to_numpy(), df[lng_col].to_numpy())
+
+
+def _bbox_positions(layer: str, *, s: float, n: float, w: float, e: float) -> np.ndarray:
+    """Positions (iloc) des lignes de la couche dans la bbox, gère le méridien 180°."""
+    return _load_spatial_index(layer).query(s, n, w, e)
+
+
+def encode_cursor(version: str, rank: int) -> str:
+    """Curseur opaque : version du jeu + rang du dernier point émis (ordre de l'index)."""
+    return base64.urlsafe_b64encode(f"{version}:{rank}".encode("ascii")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, version: str) -> int:
+    """Rang à partir duquel reprendre ; '' = première page. ValueError si invalide ou périmé."""
+    if not cursor:
+        return -1
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("ascii")
+        cursor_version, rank = raw.rsplit(":", 1)
+        rank = int(rank)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Curseur invalide")
+    if cursor_version != version:
+        raise ValueError("Curseur périmé : les données ont été rechargées, reprendre sans curseur")
+    return rank
+
+
+def _page_positions(layer: str, *, s: float, n: float, w: float, e: float, limit: int, page: int,
+                    cursor: Optional[str]) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """
+    Positions de la page demandée + champs de pagination de la réponse.
+    Sans curseur : pagination page/limit, total exact. Avec curseur (keyset) :
+    coût proportionnel à la page, total estimé et next_cursor.
+    """
+    if cursor is None:
+        pos = _bbox_positions(layer, s=s, n=n, w=w, e=e)
+        start = (page - 1) * limit
+        return pos[start:start + limit], {"total_count": int(len(pos))}
+
+    version = get_dataset_version(layer)
+    index = _load_spatial_index(layer)
+    pos, last = index.query_page(s, n, w, e, after=decode_cursor(cursor, version), limit=limit)
+    return pos, {
+        "total_count": index.estimate_count(s, n, w, e),
+        "total_is_estimate": True,
+        "next_cursor": encode_cursor(version, last) if last is not None else None,
+    }
+
+
 # =====================================================================
 # Population (master indicateurs)
 # =====================================================================
 
-@lru_cache(maxsize=1)
-def _load_population_df() -> pd.DataFrame:
+def _read_population_csv() -> pd.DataFrame:
     """Charge master_indicateurs_normalise.csv, renomme vers des colonnes canoniques et normalise en [0..1]."""
     if not POP_FILE.exists():
         raise FileNotFoundError(f"Fichier introuvable: {POP_FILE}")
@@ -503,48 +1002,44 @@ def _load_population_df() -> pd.DataFrame:
     return df
 
 
-def get_population(*, s: float, n: float, w: float, e: float, limit: int = 20, page: int = 1) -> PopulationListResponse:
-    df = _load_population_df()
-
-    if w <= e:
-        mask = (df["latitude"].between(s, n)) & (df["longitude"].between(w, e))
-    else:
-        mask = (df["latitude"].between(s, n)) & ((df["longitude"] >= w) | (df["longitude"] <= e))
-
-    dfv = df.loc[mask].copy()
+@generation_cached("population")
+def _load_population_df() -> pd.DataFrame:
+    """Master d'indicateurs normalisé, servi depuis le cache disque tant que le CSV ne change pas."""
+    if not POP_FILE.exists():
+        raise FileNotFoundError(f"Fichier introuvable: {POP_FILE}")
+    return load_cached_frame("population", POP_FILE, _read_population_csv)
 
-    total = int(len(dfv))
-    start = (page - 1) * limit
-    end = start + limit
-    page_df = dfv.iloc[start:end]
 
-    population_points: list[PopulationPoint] = []
-    for i, row in page_df.iterrows():
-        try:
-            population_points.append(
-                PopulationPoint(
-                    id=f"POP-{i+1}",
-                    commune=row.get("commune") or "",
-                    commune_norm=row["commune_norm"],
-                    latitude=float(row["latitude"]),
-                    longitude=float(row["longitude"]),
-                    densite_norm=float(_to01(row["densite_norm"])),
-                    densite=(float(row["densite"]) if pd.notna(row.get("densite")) else None),
-                )
-            )
-        except Exception as e:
-            logger.error("Ligne ignorée (Population): %s", e)
-            continue
+def get_population(*, s: float, n: float, w: float, e: float, limit: int = 20, page: int = 1,
+                   cursor: Optional[str] = None) -> Dict[str, Any]:
+    df = _load_population_df()
+    pos, paging = _page_positions("population", s=s, n=n, w=w, e=e, limit=limit, page=page, cursor=cursor)
+    page_df = df.iloc[pos]
 
-    return PopulationListResponse(population=population_points, total_count=total)
+    commune = page_df["commune"].tolist() if "commune" in page_df.columns else [None] * len(page_df)
+    if "densite" in page_df.columns:
+        densite = page_df["densite"].astype(float)
+        densite = densite.astype(object).where(densite.notna(), None).tolist()
+    else:
+        densite = [None] * len(page_df)
+
+    columns = {
+        "id": ("POP-" + _label_numbers(page_df)).tolist(),
+        "commune": [c or "" for c in commune],
+        "commune_norm": page_df["commune_norm"].tolist(),
+        "latitude": page_df["latitude"].astype(float).tolist(),
+        "longitude": page_df["longitude"].astype(float).tolist(),
+        "densite_norm": _to01_array(page_df["densite_norm"]).tolist(),
+        "densite": densite,
+    }
+    return {"population": _records(columns), **paging}
 
 
 # =====================================================================
 # POI
 # =====================================================================
 
-@lru_cache(maxsize=1)
-def _load_poi_df() -> pd.DataFrame:
+def _read_poi_csv() -> pd.DataFrame:
     if not POI_FILE.exists():
         raise FileNotFoundError(f"Fichier introuvable: {POI_FILE}")
 
@@ -628,52 +1123,37 @@ def _load_poi_df() -> pd.DataFrame:
         df["type"] = None
     df["type"] = df["type"].where(df["type"].notna() & (df["type"] != ""), df.get("value"))
 
+    # tags bruts parsés une fois pour toutes (plus de json.loads par requête)
+    df["tags"] = df["tags_json"].map(_parse_tags) if "tags_json" in df.columns else None
+
     return df
 
 
-def get_pois(*, s: float, n: float, w: float, e: float, limit: int = 300, page: int = 1) -> POIListResponse:
-    df = _load_poi_df()
+@generation_cached("poi")
+def _load_poi_df() -> pd.DataFrame:
+    """POI nettoyés (tags déjà parsés), servis depuis le cache disque tant que le CSV ne change pas."""
+    if not POI_FILE.exists():
+        raise FileNotFoundError(f"Fichier introuvable: {POI_FILE}")
+    return load_cached_frame("poi", POI_FILE, _read_poi_csv)
 
-    if w <= e:
-        mask = (df["latitude"].between(s, n)) & (df["longitude"].between(w, e))
-    else:
-        mask = (df["latitude"].between(s, n)) & ((df["longitude"] >= w) | (df["longitude"] <= e))
 
-    dfv = df.loc[mask].copy()
+def get_pois(*, s: float, n: float, w: float, e: float, limit: int = 300, page: int = 1,
+             cursor: Optional[str] = None) -> Dict[str, Any]:
+    df = _load_poi_df()
+    pos, paging = _page_positions("pois", s=s, n=n, w=w, e=e, limit=limit, page=page, cursor=cursor)
+    page_df = df.iloc[pos]
 
-    total = int(len(dfv))
-    start = (page - 1) * limit
-    end = start + limit
-    page_df = dfv.iloc[start:end]
+    columns: Dict[str, List[Any]] = {
+        "id": ("POI-" + _label_numbers(page_df)).tolist(),
+        "latitude": page_df["latitude"].astype(float).tolist(),
+        "longitude": page_df["longitude"].astype(float).tolist(),
+    }
+    for c in ("type", "key", "value", "name", "brand", "operator", "address",
+              "commune", "province", "region", "code"):
+        columns[c] = _optional_column(page_df, c)
+    columns["tags"] = [t if isinstance(t, dict) else None for t in page_df["tags"].tolist()]
 
-    items = []
-    for i, r in page_df.iterrows():
-        tags = None
-        if "tags_json" in df.columns and pd.notna(r.get("tags_json")):
-            try:
-                tags = json.loads(r["tags_json"])
-            except Exception:
-                tags = None
-
-        items.append(POI(
-            id=f"POI-{i+1}",
-            latitude=float(r["latitude"]),
-            longitude=float(r["longitude"]),
-            type=(r.get("type") or None),
-            key=(r.get("key") or None),
-            value=(r.get("value") or None),
-            name=(r.get("name") or None),
-            brand=(r.get("brand") or None),
-            operator=(r.get("operator") or None),
-            address=(r.get("address") or None),
-            commune=(r.get("commune") or None),
-            province=(r.get("province") or None),
-            region=(r.get("region") or None),
-            code=(r.get("code") or None),
-            tags=tags,
-        ))
-
-    return POIListResponse(pois=items, total_count=total)
+    return {"pois": _records(columns), **paging}
 
 def get_transport(
     *,
@@ -683,53 +1163,30 @@ def get_transport(
     e: float,
     limit: int = 300,
     page: int = 1,
-) -> TransportListResponse:
+    cursor: Optional[str] = None,
+) -> Dict[str, Any]:
     """
     Retourne les points de transport dans une bbox (s, n, w, e),
-    avec pagination.
+    avec pagination (payload au format TransportListResponse).
     """
     df = _load_transport_df()
+    # Même logique que pour get_pois : l'index gère le meridien 180°
+    pos, paging = _page_positions("transport", s=s, n=n, w=w, e=e, limit=limit, page=page, cursor=cursor)
+    page_df = df.iloc[pos]
+
+    columns: Dict[str, List[Any]] = {
+        "id": ("TP-" + _label_numbers(page_df)).tolist(),
+        "latitude": page_df["lat"].astype(float).tolist(),
+        "longitude": page_df["lon"].astype(float).tolist(),
+    }
+    for c in ("transport_mode", "name", "operator", "network", "osmid", "osm_type",
+              "railway", "highway", "amenity", "tram", "bus", "route"):
+        columns[c] = _optional_column(page_df, c)
 
-    # Même logique que pour get_pois : gestion du meridien 180°
-    if w <= e:
-        mask = (df["lat"].between(s, n)) & (df["lon"].between(w, e))
-    else:
-        mask = (df["lat"].between(s, n)) & ((df["lon"] >= w) | (df["lon"] <= e))
-
-    dfv = df.loc[mask].copy()
-
-    total = int(len(dfv))
-    start = (page - 1) * limit
-    end = start + limit
-    page_df = dfv.iloc[start:end]
-
-    items: list[TransportPoint] = []
-    for i, r in page_df.iterrows():
-        items.append(
-            TransportPoint(
-                id=f"TP-{i+1}",
-                latitude=float(r["lat"]),
-                longitude=float(r["lon"]),
-                transport_mode=(r.get("transport_mode") or None),
-                name=(r.get("name") or None),
-                operator=(r.get("operator") or None),
-                network=(r.get("network") or None),
-                osmid=(r.get("osmid") or None),
-                osm_type=(r.get("osm_type") or None),
-                railway=(r.get("railway") or None),
-                highway=(r.get("highway") or None),
-                amenity=(r.get("amenity") or None),
-                tram=(r.get("tram") or None),
-                bus=(r.get("bus") or None),
-                route=(r.get("route") or None),
-            )
-        )
-
-    return TransportListResponse(transports=items, total_count=total)
+    return {"transports": _records(columns), **paging}
 
 
-@lru_cache(maxsize=1)
-def _load_transport_df() -> pd.DataFrame:
+def _read_transport_csv() -> pd.DataFrame:
     """
     Charge les données de transport (train / tram / bus / taxi...) depuis TRANSPORT_FILE.
 
@@ -768,6 +1225,14 @@ def _load_transport_df() -> pd.DataFrame:
         df[c] = df[c].astype(str).str.strip()
 
     return df
+
+
+@generation_cached("transport")
+def _load_transport_df() -> pd.DataFrame:
+    """Points de transport nettoyés, servis depuis le cache disque tant que le CSV ne change pas."""
+    if not TRANSPORT_FILE.exists():
+        raise FileNotFoundError(f"Fichier introuvable: {TRANSPORT_FILE}")
+    return load_cached_frame("transport", TRANSPORT_FILE, _read_transport_csv)
 # =====================================================================
 # Scoring (communes)
 # =====================================================================
@@ -857,20 +1322,126 @@ def compute_site_score(row: Dict[str, Any], weights: Dict[str, float] | None = N
     }
 
 
-def get_commune_indicators_by_name_or_code(commune_or_code: str) -> Dict[str, Any]:
-    """Trouve la ligne du master (population/indicateurs) pour une commune donnée."""
+def _score_column(df: pd.DataFrame, *names: str) -> np.ndarray:
+    """Première colonne présente parmi `names`, passée par _to01 (0 si aucune)."""
+    for name in names:
+        if name in df.columns:
+            return df[name].map(_to01).to_numpy(dtype=np.float64)
+    return np.zeros(len(df), dtype=np.float64)
+
+
+@generation_cached()
+def _load_scoring_engine() -> ScoringEngine:
+    """Matrice des critères normalisés [0..1] du master, mêmes règles que compute_site_score."""
+    df = _load_population_df()
+    if "nb_atm" in df.columns:
+        nb_atm = df["nb_atm"].map(lambda v: float(v or 0)).to_numpy(dtype=np.float64)
+    else:
+        nb_atm = np.zeros(len(df), dtype=np.float64)
+
+    parts = {
+        "population":       _score_column(df, "densite_norm"),
+        "competitors":      1.0 / (1.0 + np.maximum(nb_atm, 0.0)),
+        "vieillissement":   1.0 - _score_column(df, "taux_vieilless", "taux_vieillesse"),
+        "niveau_vie":       _score_column(df, "INIV"),
+        "fecondite":        _score_column(df, "indice_fecondite"),
+        "accessibilite":    _score_column(df, "Indice_acces", "indice_acces"),
+        "jeunesse":         _score_column(df, "taux_jeuness", "taux_jeunesse"),
+        "education":        _score_column(df, "IEDU"),
+        "transport":        _score_column(df, "Indice_trans", "indice_trans"),
+        "densite_routiere": _score_column(df, "indice_densite", "indice_densi"),
+    }
+    return ScoringEngine(list(parts), np.column_stack(list(parts.values())))
+
+
+def parse_weight_profile(raw: Optional[str]) -> Dict[str, float]:
+    """
+    'population:0.3,transport:0.2' -> {'population': 0.3, 'transport': 0.2}.
+    Comme pour compute_site_score, les critères absents ont un poids nul.
+    Vide/None -> DEFAULT_WEIGHTS.
+    """
+    if not raw or not raw.strip():
+        return dict(DEFAULT_WEIGHTS)
+    weights: Dict[str, float] = {}
+    for item in raw.split(","):
+        key, sep, value = item.partition(":")
+        key = key.strip()
+        if not sep or key not in DEFAULT_WEIGHTS:
+            raise ValueError(f"Poids invalide '{item}'. Critères: {', '.join(DEFAULT_WEIGHTS)}")
+        try:
+            weights[key] = float(value)
+        except ValueError:
+            raise ValueError(f"Poids non numérique pour '{key}': {value!r}")
+        if weights[key] < 0 or not math.isfinite(weights[key]):
+            raise ValueError(f"Poids négatif ou infini pour '{key}'")
+    return weights
+
+
+@generation_cached()
+def _load_commune_regions() -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Région de chaque ligne du master (et sa clé repliée) : colonne 'region'
+    si présente, sinon propriétés des polygones communes.geojson, sinon 'Unknown'.
+    """
     df = _load_population_df()
-    key = str(commune_or_code).strip().lower()
+    if "region" in df.columns:
+        regions = df["region"].fillna("Unknown").astype(str).to_numpy(dtype=object)
+    else:
+        regions = np.full(len(df), "Unknown", dtype=object)
+        index, feature_rows = _load_commune_polygons()
+        if index is not None:
+            features = _load_communes_geojson().get("features", [])
+            for fid, pos in enumerate(feature_rows.tolist()):
+                if pos < 0 or regions[pos] != "Unknown":
+                    continue
+                props = features[fid].get("properties", {})
+                region = props.get("region") or props.get("region_name") or props.get("nom_region")
+                if region:
+                    regions[pos] = str(region)
+    folded = np.array([fold_key(r) for r in regions], dtype=object)
+    return regions, folded
+
+
+def get_commune_scores(weights: Optional[Dict[str, float]] = None, top: int = 20,
+                       region: Optional[str] = None) -> Dict[str, Any]:
+    """Classement des communes pour un profil de poids (top-k par argpartition)."""
+    df = _load_population_df()
+    engine = _load_scoring_engine()
+    w = weights if weights is not None else DEFAULT_WEIGHTS
+
+    regions, folded = _load_commune_regions()
+    mask = (folded == fold_key(region)) if region else None
+
+    positions = engine.top_k(w, top, mask)
+    scores = engine.scores(w)
+    norm_w = engine.normalized_weights(w)
+
+    commune = df["commune"] if "commune" in df.columns else df["commune_norm"]
+    columns = {
+        "rank": list(range(1, len(positions) + 1)),
+        "commune": commune.to_numpy()[positions].tolist(),
+        "commune_norm": df["commune_norm"].to_numpy()[positions].tolist(),
+        "latitude": df["latitude"].to_numpy(dtype=np.float64)[positions].tolist(),
+        "longitude": df["longitude"].to_numpy(dtype=np.float64)[positions].tolist(),
+        "region": regions[positions].tolist(),
+        "score": scores[positions].tolist(),
+    }
+    return {
+        "weights": {k: round(100.0 * float(v), 2) for k, v in zip(engine.keys, norm_w)},
+        "region": region,
+        "total_count": int(mask.sum()) if mask is not None else len(engine),
+        "communes": _records(columns),
+    }
 
-    mask = df["commune_norm"].astype(str).str.strip().str.lower() == key
-    if not mask.any():
-        if "commune" in df.columns:
-            mask = df["commune"].astype(str).str.strip().str.lower() == key
 
-    if not mask.any():
+def get_commune_indicators_by_name_or_code(commune_or_code: str) -> Dict[str, Any]:
+    """Trouve la ligne du master (population/indicateurs) pour une commune donnée."""
+    df = _load_population_df()
+    positions = _load_commune_names().exact(commune_or_code)
+    if not positions:
         raise KeyError(f"Commune introuvable dans le master: '{commune_or_code}'")
 
-    row = df.loc[mask].iloc[0].to_dict()
+    row = df.iloc[positions[0]].to_dict()
 
     indicators_keys = [
         "densite_norm", "Indice_POI", "Indice_POI_r",
@@ -892,14 +1463,256 @@ def get_commune_indicators_by_name_or_code(commune_or_code: str) -> Dict[str, An
     }
 
 
-def get_commune_indicators(lat: float, lng: float) -> Dict[str, Any]:
-    """Retourne la commune (centroïde le + proche) et ses indicateurs + score détaillé."""
+# =====================================================================
+# Clusters par zoom (ATMs, concurrents)
+# =====================================================================
+
+CLUSTER_LAYERS = ("atms", "competitors")
+
+
+@generation_cached()
+def _load_competitor_clusters() -> ClusterPyramid:
+    records = _load_competitor_records()
+    return ClusterPyramid(
+        [r["latitude"] for r in records], [r["longitude"] for r in records],
+        [r["bank_name"] for r in records], [r["id"] for r in records],
+    )
+
+
+def get_clusters(layer: str, *, s: float, n: float, w: float, e: float, zoom: int,
+                 state: Optional[ATMState] = None) -> Dict[str, Any]:
+    """
+    Clusters de la couche au zoom donné, avec effectifs et répartition par
+    banque. Couche 'atms' : depuis `state` (par défaut l'état courant).
+    """
+    if layer == "atms":
+        pyramid = _atm_clusters(state or atm_service.state)
+    elif layer == "competitors":
+        pyramid = _load_competitor_clusters()
+    else:
+        raise KeyError(f"Couche inconnue '{layer}' (attendu: {', '.join(CLUSTER_LAYERS)})")
+
+    clusters = pyramid.query(s=s, n=n, w=w, e=e, zoom=zoom)
+    return {
+        "layer": layer,
+        "zoom": zoom,
+        "clusters": clusters,
+        "total_count": len(clusters),
+        "point_count": sum(c["count"] for c in clusters),
+    }
+
+
+# =====================================================================
+# Tuiles vectorielles (MVT) des couches de points
+# =====================================================================
+
+TILE_LAYERS = ("pois", "transport", "population", "atms")
+MAX_TILE_ZOOM = 22
+
+
+def _tile_column(df: pd.DataFrame, col: str) -> List[Any]:
+    """Valeurs de la colonne, None pour les cellules vides/'nan' (propriété omise de la tuile)."""
+    if col not in df.columns:
+        return [None] * len(df)
+    return df[col].where(_is_filled(df[col]), None).tolist()
+
+
+@generation_cached()
+def _load_tile_source(layer: str) -> TileSource:
+    """Source de tuiles d'une couche DataFrame, construite sur le DataFrame chargé."""
+    if layer == "pois":
+        df = _load_poi_df()
+        props = {"id": ("POI-" + _label_numbers(df)).tolist()}
+        for c in ("type", "name", "brand", "operator"):
+            props[c] = _tile_column(df, c)
+        return TileSource(layer, df["latitude"].to_numpy(), df["longitude"].to_numpy(), props)
+
+    if layer == "transport":
+        df = _load_transport_df()
+        props = {"id": ("TP-" + _label_numbers(df)).tolist()}
+        for c in ("transport_mode", "name", "operator", "network"):
+            props[c] = _tile_column(df, c)
+        return TileSource(layer, df["lat"].to_numpy(), df["lon"].to_numpy(), props)
+
+    if layer == "population":
+        df = _load_population_df()
+        props = {
+            "id": ("POP-" + _label_numbers(df)).tolist(),
+            "commune": _tile_column(df, "commune"),
+            "commune_norm": _tile_column(df, "commune_norm"),
+            "densite_norm": _to01_array(df["densite_norm"]).tolist(),
+            "densite": _tile_column(df, "densite"),
+        }
+        return TileSource(layer, df["latitude"].to_numpy(), df["longitude"].to_numpy(), props)
+
+    raise KeyError(f"Couche inconnue '{layer}' (attendu: {', '.join(TILE_LAYERS)})")
+
+
+def get_tile(layer: str, z: int, x: int, y: int, state: Optional[ATMState] = None) -> bytes:
+    """
+    Tuile MVT z/x/y de la couche (éclaircie selon le zoom, servie depuis le
+    cache LRU). Couche 'atms' : depuis `state` (par défaut l'état courant).
+    """
+    if not 0 <= z <= MAX_TILE_ZOOM:
+        raise ValueError(f"Zoom hors limites (0..{MAX_TILE_ZOOM}): {z}")
+    if not (0 <= x < (1 << z) and 0 <= y < (1 << z)):
+        raise ValueError(f"Tuile hors limites au zoom {z}: {x}/{y}")
+    source = _atm_tiles(state or atm_service.state) if layer == "atms" else _load_tile_source(layer)
+    return source.tile(z, x, y)
+
+
+# =====================================================================
+# Agrégation hexagonale multi-résolution
+# =====================================================================
+
+HEX_LAYERS = ("atms", "competitors", "pois", "transport", "population")
+# Colonnes sommées par hexagone (en plus de l'effectif)
+HEX_SUM_COLUMNS: Dict[str, Tuple[str, ...]] = {"population": ("densite", "nb_atm")}
+
+
+def parse_bbox(raw: Optional[str]) -> Tuple[float, float, float, float]:
+    """'w,s,e,n' -> (s, n, w, e) ; bbox absente = monde entier. ValueError si invalide."""
+    if raw is None or not raw.strip():
+        return -90.0, 90.0, -180.0, 180.0
+    try:
+        w, s, e, n = (float(v) for v in raw.split(","))
+    except ValueError:
+        raise ValueError(f"bbox invalide '{raw}' (attendu: ouest,sud,est,nord)")
+    if not (-90.0 <= s <= n <= 90.0 and -180.0 <= w <= 180.0 and -180.0 <= e <= 180.0):
+        raise ValueError(f"bbox hors limites '{raw}'")
+    return s, n, w, e
+
+
+@generation_cached()
+def _load_hex_pyramid(layer: str) -> HexPyramid:
+    """Pyramide hexagonale d'une couche (hors ATMs), préconstruite au chargement (cf. prebuild_layers)."""
+    if layer == "competitors":
+        records = _load_competitor_records()
+        return HexPyramid([r["latitude"] for r in records], [r["longitude"] for r in records])
+    if layer == "pois":
+        df = _load_poi_df()
+        lat_col, lng_col = "latitude", "longitude"
+    elif layer == "transport":
+        df = _load_transport_df()
+        lat_col, lng_col = "lat", "lon"
+    elif layer == "population":
+        df = _load_population_df()
+        lat_col, lng_col = "latitude", "longitude"
+    else:
+        raise KeyError(f"Couche inconnue '{layer}' (attendu: {', '.join(HEX_LAYERS)})")
+
+    values = {
+        col: pd.to_numeric(df[col], errors="coerce").to_numpy()
+        for col in HEX_SUM_COLUMNS.get(layer, ()) if col in df.columns
+    }
+    return HexPyramid(df[lat_col].to_numpy(), df[lng_col].to_numpy(), values)
+
+
+def get_hexbins(layer: str, res: int, bbox: Optional[str] = None, state: Optional[ATMState] = None) -> Dict[str, Any]:
+    """
+    Hexagones de la couche à la résolution `res` (≈ zoom) dans la bbox
+    'w,s,e,n'. Couche 'atms' : depuis `state` (par défaut l'état courant).
+    """
+    if not 0 <= res <= MAX_HEX_RES:
+        raise ValueError(f"Résolution hors limites (0..{MAX_HEX_RES}): {res}")
+    s, n, w, e = parse_bbox(bbox)
+    pyramid = _atm_hexbins(state or atm_service.state) if layer == "atms" else _load_hex_pyramid(layer)
+    bins = pyramid.query(res, s=s, n=n, w=w, e=e)
+    return {
+        "layer": layer,
+        "res": res,
+        "sums": pyramid.sum_names,
+        "bins": bins,
+        "total_count": len(bins),
+        "point_count": sum(b["count"] for b in bins),
+    }
+
+
+# =====================================================================
+# Recherche par nom (communes, concurrents ; ATMs dans ATMService)
+# =====================================================================
+
+# Nombre maximal de résultats par type pour /search
+MAX_SEARCH_LIMIT = 50
+
+
+@generation_cached()
+def _load_commune_names() -> NameIndex:
+    """
+    Index des noms du master (ref = rang iloc). commune_norm d'abord, puis
+    commune et code : à clé égale, une correspondance sur commune_norm l'emporte.
+    """
     df = _load_population_df()
+    index = NameIndex()
+    for col in ("commune_norm", "commune", "code"):
+        if col in df.columns:
+            for pos, name in enumerate(df[col].tolist()):
+                index.add(pos, name)
+    return index
 
-    d2 = (df["latitude"] - lat) ** 2 + (df["longitude"] - lng) ** 2
-    idx = int(d2.idxmin())
-    row = df.loc[idx].to_dict()
 
+@generation_cached()
+def _load_competitor_names() -> Tuple[NameIndex, List[Dict[str, Any]]]:
+    """Index des concurrents (banque, id, commune) + leurs enregistrements CompetitorData."""
+    records = _load_competitor_records()
+    index = NameIndex()
+    for pos, rec in enumerate(records):
+        index.add(pos, rec["bank_name"], rec["id"], rec["commune"])
+    return index, records
+
+
+def search_communes(query: str, limit: int = 10) -> List[Dict[str, Any]]:
+    df = _load_population_df()
+    commune = df["commune"] if "commune" in df.columns else df["commune_norm"]
+    results = []
+    for pos, relevance in _load_commune_names().search(query, limit):
+        results.append({
+            "commune": commune.iat[pos],
+            "commune_norm": df["commune_norm"].iat[pos],
+            "latitude": float(df["latitude"].iat[pos]),
+            "longitude": float(df["longitude"].iat[pos]),
+            "relevance": relevance,
+        })
+    return results
+
+
+def search_competitors(query: str, limit: int = 10) -> List[Dict[str, Any]]:
+    index, records = _load_competitor_names()
+    return [{**records[pos], "relevance": relevance} for pos, relevance in index.search(query, limit)]
+
+
+def resolve_commune_positions(lats: Any, lngs: Any) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Rang (iloc) de la ligne du master pour chaque point : commune dont le
+    polygone contient le point, sinon centroïde le plus proche.
+    Retourne (positions, masque 'résolu par polygone').
+    """
+    df = _load_population_df()
+    index, feature_rows = _load_commune_polygons()
+    lats = np.asarray(lats, dtype=np.float64)
+    lngs = np.asarray(lngs, dtype=np.float64)
+
+    pos = np.full(len(lats), -1, dtype=np.int64)
+    if index is not None and len(index):
+        fid = index.locate_many(lats, lngs)
+        hit = fid >= 0
+        pos[hit] = feature_rows[fid[hit]]
+    by_polygon = pos >= 0
+
+    # Repli : centroïde le plus proche (distance² en degrés), par blocs
+    miss = np.flatnonzero(~by_polygon)
+    if miss.size:
+        clat = df["latitude"].to_numpy(dtype=np.float64)
+        clng = df["longitude"].to_numpy(dtype=np.float64)
+        step = max(1, (1 << 22) // max(len(clat), 1))
+        for a in range(0, miss.size, step):
+            chunk = miss[a:a + step]
+            d2 = (clat[None, :] - lats[chunk, None]) ** 2 + (clng[None, :] - lngs[chunk, None]) ** 2
+            pos[chunk] = np.argmin(d2, axis=1)
+    return pos, by_polygon
+
+
+def _commune_indicators_payload(row: Dict[str, Any], lat: float, lng: float, by_polygon: bool) -> Dict[str, Any]:
     raw_keys = [
         "densite_norm", "Indice_POI", "Indice_POI_r",
         "indice_densite", "indice_densi",
@@ -917,6 +1730,7 @@ def get_commune_indicators(lat: float, lng: float) -> Dict[str, Any]:
         "latitude": float(row["latitude"]),
         "longitude": float(row["longitude"]),
         "distance_km": _haversine_km(lat, lng, float(row["latitude"]), float(row["longitude"])),
+        "resolved_by": "polygon" if by_polygon else "centroid",
         "indicators": indicators,
         "normalized": score_obj["normalized"],
         "weights": score_obj["weights"],
@@ -925,32 +1739,467 @@ def get_commune_indicators(lat: float, lng: float) -> Dict[str, Any]:
     }
 
 
+def get_commune_indicators(lat: float, lng: float) -> Dict[str, Any]:
+    """Retourne la commune contenant le point (sinon centroïde le + proche) et ses indicateurs + score détaillé."""
+    df = _load_population_df()
+    index, feature_rows = _load_commune_polygons()
+    fid = index.locate(lat, lng) if index is not None else -1
+    if fid >= 0 and feature_rows[fid] >= 0:
+        return _commune_indicators_payload(df.iloc[int(feature_rows[fid])].to_dict(), lat, lng, True)
+    return get_commune_indicators_batch([lat], [lng])[0]
+
+
+def get_commune_indicators_batch(lats: List[float], lngs: List[float]) -> List[Dict[str, Any]]:
+    """Version batch de get_commune_indicators (une seule résolution vectorisée)."""
+    df = _load_population_df()
+    pos, by_polygon = resolve_commune_positions(lats, lngs)
+    return [
+        _commune_indicators_payload(df.iloc[p].to_dict(), float(lat), float(lng), bool(poly))
+        for p, lat, lng, poly in zip(pos.tolist(), lats, lngs, by_polygon.tolist())
+    ]
+
+
 # =====================================================================
-# Clear caches (hot reload)
+# Enrichissement des emplacements (features dérivées de lat/lng)
 # =====================================================================
 
-async def clear_data_caches():
-    # Population
-    try:
-        _load_population_df.cache_clear()
-    except Exception:
-        pass
+_feature_cache = CellFeatureCache()
 
-    # Concurrents
+
+@generation_cached()
+def _load_competitor_points() -> NearestIndex:
+    records = _load_competitor_records()
+    return NearestIndex([r["latitude"] for r in records], [r["longitude"] for r in records])
+
+
+def _optional_layer(loader) -> Optional[Any]:
+    """Couche facultative pour l'enrichissement (None si le fichier manque)."""
     try:
-        _load_competitors_df.cache_clear()
-    except Exception:
-        pass
+        return loader()
+    except FileNotFoundError:
+        return None
+
+
+NEARBY_LAYERS = ("competitors", "pois", "transport")
+
+
+@generation_cached()
+def _load_nearby_index(layer: str) -> GridIndex:
+    """Index des comptages de voisinage d'une couche, cellule de la taille de NEARBY_RADIUS_KM."""
+    if layer == "competitors":
+        records = _load_competitor_records()
+        lats, lngs = [r["latitude"] for r in records], [r["longitude"] for r in records]
+    elif layer == "pois":
+        df = _load_poi_df()
+        lats, lngs = df["latitude"].to_numpy(), df["longitude"].to_numpy()
+    elif layer == "transport":
+        df = _load_transport_df()
+        lats, lngs = df["lat"].to_numpy(), df["lon"].to_numpy()
+    else:
+        raise KeyError(f"Couche inconnue '{layer}' (attendu: {', '.join(NEARBY_LAYERS)})")
+    return GridIndex(lats, lngs, cell_deg=NEARBY_RADIUS_KM / KM_PER_DEG_LAT)
 
-    # POI
+
+def _cell_features(lats: np.ndarray, lngs: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Features du prédicteur dérivables en chaque point : densité et
+    accessibilité (0..10) de la commune, concurrents, POI et arrêts de
+    transport à moins de NEARBY_RADIUS_KM. NaN / champ absent = non dérivable.
+    """
+    df = _load_population_df()
+    rows, _ = resolve_commune_positions(lats, lngs)
+    features: Dict[str, np.ndarray] = {
+        "accessibility_score": 10.0 * _score_column(df, "Indice_acces", "indice_acces")[rows],
+        "competitor_atms_500m": _load_nearby_index("competitors").count_within_km(lats, lngs, NEARBY_RADIUS_KM),
+    }
+    if "densite" in df.columns:
+        features["population_density"] = pd.to_numeric(df["densite"], errors="coerce").to_numpy()[rows]
+
+    transport = _optional_layer(lambda: _load_nearby_index("transport"))
+    if transport is not None:
+        stops = transport.count_within_km(lats, lngs, NEARBY_RADIUS_KM)
+        features["public_transport_nearby"] = (stops > 0).astype(np.float64)
+    pois = _optional_layer(lambda: _load_nearby_index("pois"))
+    if pois is not None:
+        count = pois.count_within_km(lats, lngs, NEARBY_RADIUS_KM)
+        features["commercial_poi_count"] = count
+        features["business_district"] = (count >= BUSINESS_POI_COUNT).astype(np.float64)
+    return features
+
+
+def _enrichment_version() -> str:
+    """Version des sources de l'enrichissement (charge les jeux si besoin)."""
+    _load_population_df()
+    _load_competitor_records()
+    _optional_layer(_load_transport_df)
+    _optional_layer(_load_poi_df)
+    return "-".join(dataset_version(name) or "" for name in ("population", "competitors", "transport", "poi"))
+
+
+def enrich_locations(locations: List[LocationData]) -> List[LocationData]:
+    """
+    Complète les champs non fournis de chaque emplacement à partir de ses
+    coordonnées (cf. enrichment) ; les champs fournis sont conservés.
+    """
+    if not locations:
+        return []
+    lats = np.array([loc.latitude for loc in locations], dtype=np.float64)
+    lngs = np.array([loc.longitude for loc in locations], dtype=np.float64)
     try:
-        _load_poi_df.cache_clear()
-    except Exception:
-        pass
+        values = _feature_cache.values(lats, lngs, _enrichment_version(), _cell_features)
+    except FileNotFoundError as e:
+        # Sans le master, la prédiction reste possible avec les valeurs fournies / par défaut
+        logger.warning("Enrichissement indisponible: %s", e)
+        return list(locations)
+    return apply_features(locations, values)
+
+
+def _locations_at(lats: np.ndarray, lngs: np.ndarray) -> List[LocationData]:
+    """LocationData enrichies de points de grille."""
+    return enrich_locations([
+        LocationData(latitude=lat, longitude=lng)
+        for lat, lng in zip(np.asarray(lats).tolist(), np.asarray(lngs).tolist())
+    ])
 
-    # 🔁 Recharger les ATMs depuis atms_maroc_clean.csv
+
+# =====================================================================
+# Surface d'opportunité (zones prioritaires du tableau de bord)
+# =====================================================================
+
+# Hors polygones communaux, une cellule n'est retenue qu'à moins de ce rayon d'un centroïde
+OPPORTUNITY_CENTROID_KM = 15.0
+OPPORTUNITY_ZONES = 6
+
+_opportunity_lock = threading.Lock()
+_opportunity: Optional[Tuple[str, OpportunitySurface]] = None
+_opportunity_refresh: Optional[threading.Thread] = None
+# Dernières zones servies : ((version, limite, prédicteur), zones)
+_opportunity_zones: Optional[Tuple[Tuple[Any, ...], List[Dict[str, Any]]]] = None
+
+
+def _opportunity_indicator(lats: np.ndarray, lngs: np.ndarray) -> Tuple[np.ndarray, ...]:
+    """
+    Score d'indicateurs (profil par défaut) et distance au centroïde de la
+    commune de chaque cellule ; cellules hors territoire écartées.
+    """
+    df = _load_population_df()
+    pos, by_polygon = resolve_commune_positions(lats, lngs)
+    clat = df["latitude"].to_numpy(dtype=np.float64)[pos]
+    clng = df["longitude"].to_numpy(dtype=np.float64)[pos]
+    centroid_km = haversine_km(lats, lngs, clat, clng)
+    keep = by_polygon | (centroid_km <= OPPORTUNITY_CENTROID_KM)
+    return _load_scoring_engine().scores(DEFAULT_WEIGHTS)[pos], pos, centroid_km, keep
+
+
+def get_opportunity_surface(stale_ok: bool = False) -> Tuple[str, OpportunitySurface]:
+    """
+    (version, surface) ; recalculée quand le réseau d'ATMs, le master ou
+    les concurrents changent, sinon servie depuis la mémoire. Avec stale_ok,
+    une surface périmée est servie telle quelle pendant que la nouvelle est
+    calculée dans un thread (seule la toute première est calculée sur place).
+    """
+    global _opportunity
+    _load_population_df()
+    competitors = _load_competitor_points()
+    state = atm_service.state
+    version = "-".join((state.version, dataset_version("population") or "",
+                        dataset_version("competitors") or ""))
+    cached = _opportunity
+    if cached is not None and cached[0] == version:
+        return cached
+    if stale_ok and cached is not None:
+        _refresh_opportunity_surface()
+        return cached
+
+    with _opportunity_lock:
+        cached = _opportunity
+        if cached is None or cached[0] != version:
+            t0 = time.perf_counter()
+            surface = build_surface(_opportunity_indicator, state.points, competitors)
+            logger.info("Surface d'opportunité %s: %d cellules en %.0f ms",
+                        version, len(surface), (time.perf_counter() - t0) * 1000)
+            cached = _opportunity = (version, surface)
+    return cached
+
+
+def _refresh_opportunity_surface() -> None:
+    """Recalcule la surface dans un thread, sauf si un recalcul est déjà en cours."""
+    global _opportunity_refresh
+    with _opportunity_lock:
+        if _opportunity_refresh is not None and _opportunity_refresh.is_alive():
+            return
+        _opportunity_refresh = threading.Thread(target=_rebuild_opportunity_surface,
+                                                name="opportunity-surface", daemon=True)
+        _opportunity_refresh.start()
+
+
+def _rebuild_opportunity_surface() -> None:
     try:
-        await atm_service.reload_data()
-        logger.info("Caches vidés et ATMs rechargés depuis le CSV.")
+        get_opportunity_surface()
     except Exception as e:
-        logger.error("Erreur lors du rechargement des ATMs: %s", e, exc_info=True)
\ No newline at end of file
+        logger.warning("Surface d'opportunité non recalculée: %s", e)
+
+
+def _competition_level(count: int) -> str:
+    if count <= 1:
+        return "Faible"
+    return "Moyenne" if count <= 5 else "Élevée"
+
+
+def _priority(score: float) -> str:
+    if score >= 50:
+        return "Haute"
+    return "Moyenne" if score >= 35 else "Faible"
+
+
+def get_opportunity_zones(limit: int = OPPORTUNITY_ZONES) -> List[Dict[str, Any]]:
+    """
+    Meilleures zones de la surface d'opportunité (une par commune), au format
+    OpportunityZone. potential_volume vient du prédicteur s'il est chargé (0 sinon).
+    Après un ajout d'ATM, la surface précédente est servie pendant son recalcul.
+    """
+    global _opportunity_zones
+    version, surface = get_opportunity_surface(stale_ok=True)
+    predictor = atm_service.predictor
+    key = (version, limit, id(predictor), predictor.is_trained)
+    cached = _opportunity_zones
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    best = surface.top_zones(limit)
+    if not best.size:
+        return []
+
+    df = _load_population_df()
+    regions, _ = _load_commune_regions()
+    rows = surface.commune[best]
+    commune = (df["commune"] if "commune" in df.columns else df["commune_norm"]).to_numpy()[rows]
+    locations = _locations_at(surface.lat[best], surface.lng[best])
+    try:
+        volumes = [p["predicted_volume"] for p in predictor.predict_locations(locations)]
+    except ModelNotReadyError:
+        volumes = [0.0] * len(locations)
+
+    zones = []
+    for k, i in enumerate(best.tolist()):
+        score = float(surface.opportunity[i])
+        zones.append({
+            "zone": f"{commune[k]} ({surface.lat[i]:.3f}, {surface.lng[i]:.3f})",
+            "score": int(round(score)),
+            "potential_volume": int(round(max(volumes[k], 0.0))),
+            "competition_level": _competition_level(int(surface.competitors[i])),
+            "priority": _priority(score),
+            "region": str(regions[rows[k]]),
+        })
+    _opportunity_zones = (key, zones)
+    return zones
+
+
+# =====================================================================
+# Couverture du réseau (population à moins de d km d'un ATM)
+# =====================================================================
+
+def _build_network_coverage(atms: NearestIndex) -> NetworkCoverage:
+    """Centroïdes du master pondérés par 'densite', rattachés à l'ATM le plus proche de `atms`."""
+    df = _load_population_df()
+    regions, _ = _load_commune_regions()
+    weights = pd.to_numeric(df["densite"], errors="coerce").to_numpy() \
+        if "densite" in df.columns else np.ones(len(df))
+    communes = (df["commune"] if "commune" in df.columns else df["commune_norm"]).to_numpy()
+    t0 = time.perf_counter()
+    coverage = NetworkCoverage(df["latitude"].to_numpy(), df["longitude"].to_numpy(), weights,
+                               communes, regions, atms)
+    logger.info("Couverture du réseau: %d communes en %.1f ms", len(coverage), (time.perf_counter() - t0) * 1000)
+    return coverage
+
+
+def parse_coverage_bands(raw: Optional[str]) -> Tuple[float, ...]:
+    """'1,2,5' -> (1.0, 2.0, 5.0) ; absent = COVERAGE_BANDS_KM. ValueError si invalide."""
+    if raw is None or not raw.strip():
+        return COVERAGE_BANDS_KM
+    try:
+        bands = tuple(float(v) for v in raw.split(",") if v.strip())
+    except ValueError:
+        raise ValueError(f"Bandes invalides '{raw}' (attendu: distances en km séparées par des virgules)")
+    if not bands or len(bands) > MAX_COVERAGE_BANDS:
+        raise ValueError(f"Entre 1 et {MAX_COVERAGE_BANDS} bandes attendues")
+    if any(not math.isfinite(b) or b <= 0 for b in bands):
+        raise ValueError(f"Bandes non positives ou infinies '{raw}'")
+    return bands
+
+
+def get_network_coverage(bands: Optional[Tuple[float, ...]] = None) -> Dict[str, Any]:
+    """Part pondérée par la densité à moins de chaque bande d'un ATM : réseau, régions, communes."""
+    return atm_service.coverage().report(bands or COVERAGE_BANDS_KM)
+
+
+def get_coverage_rate() -> float:
+    """Taux de couverture du tableau de bord : part pondérée par la densité à moins de COVERAGE_RADIUS_KM (%)."""
+    return atm_service.coverage().share_within(COVERAGE_RADIUS_KM)
+
+
+# =====================================================================
+# Optimisation du placement de k nouveaux sites
+# =====================================================================
+
+MAX_PLACEMENT_CANDIDATES = 2000
+# Candidats scorés (enrichissement, prédiction, cannibalisation) entre deux contrôles de l'échéance
+PLACEMENT_SCORE_CHUNK = 250
+
+
+def placement_candidates(bbox: str, max_candidates: int = MAX_PLACEMENT_CANDIDATES) -> List[LocationData]:
+    """
+    Candidats d'une bbox 'w,s,e,n' : grille régulière d'au plus
+    max_candidates points, restreinte au territoire des communes.
+    """
+    s, n, w, e = parse_bbox(bbox)
+    if w > e:
+        raise ValueError("bbox traversant l'antiméridien non supportée pour le placement")
+    step = max(math.sqrt((n - s) * (e - w) / max_candidates), 1e-4)
+    lats, lngs = grid_centers(s, n, w, e, step)
+    keep = _opportunity_indicator(lats, lngs)[3]
+    return _locations_at(lats[keep][:max_candidates], lngs[keep][:max_candidates])
+
+
+# =====================================================================
+# Rechargement à chaud
+# =====================================================================
+
+# Couche -> (jeu de données, loader) pour les versions (ETag)
+_LAYER_DATASETS = {
+    "population": ("population", _load_population_df),
+    "pois": ("poi", _load_poi_df),
+    "transport": ("transport", _load_transport_df),
+    "competitors": ("competitors", _load_competitors_df),
+    "communes": ("communes", _load_communes_geojson),
+}
+
+
+def get_dataset_version(layer: str) -> str:
+    """
+    Version courante des données servies par une couche. Le loader n'est
+    réellement exécuté que si le jeu n'a pas encore été chargé.
+    """
+    if layer == "atms":
+        return atm_service.version
+    if layer not in _LAYER_DATASETS:
+        raise KeyError(f"Couche inconnue '{layer}'")
+    name, loader = _LAYER_DATASETS[layer]
+    loader()
+    return dataset_version(name)
+
+
+# Fichier source de chaque jeu de données ; "atms" est republié par ATMService
+DATASET_FILES: Dict[str, Path] = {
+    "population": POP_FILE,
+    "competitors": COMPETITORS_FILE,
+    "poi": POI_FILE,
+    "transport": TRANSPORT_FILE,
+    "communes": COMMUNES_GEOJSON,
+    "atms": ATM_FILE,
+}
+
+
+class DataReloader:
+    """
+    Rechargement à chaud des jeux de données. Chaque passage relève
+    l'empreinte (taille + mtime) des fichiers de DATA_DIR ; seuls les jeux
+    dont la source a réellement changé (sha256 différent de la version
+    chargée) sont reconstruits, dans un thread, avec toutes les structures
+    qui en dépendent, puis publiés d'un bloc (cf. data_generation). Les
+    requêtes continuent d'être servies par la génération précédente d'ici là.
+    """
+
+    def __init__(self, data_dir: Path = DATA_DIR):
+        self.data_dir = data_dir
+        self._fingerprints = self.scan()
+        self._lock = asyncio.Lock()
+
+    def scan(self) -> Dict[Path, Tuple[int, int]]:
+        """Empreinte (taille, mtime_ns) de chaque fichier sous data_dir."""
+        fingerprints: Dict[Path, Tuple[int, int]] = {}
+        if not self.data_dir.exists():
+            return fingerprints
+        for path in self.data_dir.rglob("*"):
+            try:
+                if path.is_file():
+                    fp = file_fingerprint(path)
+                    fingerprints[path] = (fp["size"], fp["mtime_ns"])
+            except OSError:
+                continue  # supprimé pendant le parcours
+        return fingerprints
+
+    def changed_datasets(self, fingerprints: Dict[Path, Tuple[int, int]]) -> Set[str]:
+        """Jeux dont la source a changé depuis le dernier passage (contenu identique ignoré)."""
+        changed: Set[str] = set()
+        for name, path in DATASET_FILES.items():
+            if fingerprints.get(path) == self._fingerprints.get(path):
+                continue
+            loaded = current_generation().versions.get(name)
+            if loaded is not None and path in fingerprints and loaded == digest_version(file_digest(path)):
+                continue  # copie, touch : même contenu
+            changed.add(name)
+        return changed
+
+    async def reload(self, force: bool = False) -> List[str]:
+        """Recharge les jeux modifiés (tous avec force) ; renvoie leurs noms."""
+        async with self._lock:
+            fingerprints = await asyncio.to_thread(self.scan)
+            changed = set(DATASET_FILES) if force else \
+                await asyncio.to_thread(self.changed_datasets, fingerprints)
+            if not changed:
+                self._fingerprints = fingerprints
+                return []
+
+            t0 = time.perf_counter()
+            datasets = changed - {"atms"}
+            if datasets:
+                # Erreur de lecture : rien n'est publié, nouvel essai au prochain passage
+                publish(await asyncio.to_thread(_rebuild_generation, datasets))
+            if "atms" in changed:
+                await atm_service.reload_data()
+            self._fingerprints = fingerprints
+            logger.info("Jeux rechargés (%s) en %.0f ms", ", ".join(sorted(changed)), (time.perf_counter() - t0) * 1000)
+
+            if _opportunity is not None:
+                # La surface servie au tableau de bord dépend des ATMs, du master et des concurrents
+                try:
+                    await asyncio.to_thread(get_opportunity_surface)
+                except Exception as e:
+                    logger.warning("Surface d'opportunité non recalculée: %s", e)
+            return sorted(changed)
+
+
+data_reloader = DataReloader()
+
+
+def prebuild_layers() -> None:
+    """
+    Construit, dans la génération active, les structures des endpoints de
+    carte (clusters et hexbins des couches hors ATMs, topologie des communes)
+    et les index de voisinage de l'enrichissement, pour qu'aucune requête ne
+    les calcule dans la boucle d'événements. La fonction est bloquante et doit
+    donc être appelée dans un thread (asyncio.to_thread). Une couche dont la
+    source manque est ignorée.
+    """
+    builders = [_load_competitor_clusters, _load_commune_topology]
+    builders += [functools.partial(_load_hex_pyramid, layer) for layer in HEX_LAYERS if layer != "atms"]
+    builders += [functools.partial(_load_nearby_index, layer) for layer in NEARBY_LAYERS]
+    for build in builders:
+        try:
+            build()
+        except (FileNotFoundError, KeyError) as e:
+            logger.info("Couche non préconstruite: %s", e)
+
+
+def _rebuild_generation(datasets: Set[str]) -> DataGeneration:
+    """Génération suivante reconstruite pour `datasets`, couches de carte comprises, non publiée."""
+    generation = rebuild(datasets)
+    with pinned(generation):
+        prebuild_layers()
+    return generation
+
+
+async def clear_data_caches() -> List[str]:
+    """Recharge tous les jeux et les ATMs depuis les fichiers, publiés d'un bloc une fois prêts."""
+    return await data_reloader.reload(force=True)
@@ -0,0 +1,479 @@
+"""
+Index spatiaux en mémoire pour les couches cartographiques.
+
+GridIndex : grille régulière lat/lon construite une seule fois au chargement
+d'un DataFrame. Une requête bbox ne parcourt que les cellules candidates et
+renvoie des positions (iloc), sans jamais copier le DataFrame complet.
+Les comptages dans un rayon (count_within_km) parcourent, pour un lot de
+requêtes, les seules cellules voisines de chacune (cellule ~ rayon).
+
+PointIndex : index de voisinage incrémental (insertions une à une) pour les
+requêtes de rayon ; la fenêtre en longitude tient compte de cos(lat) pour
+les distances haversine.
+
+NearestIndex : plus proche voisin (et comptage dans un rayon) haversine
+pour des lots de requêtes, par produits scalaires sur vecteurs unitaires.
+
+PolygonIndex : localisation point -> polygone (Polygon / MultiPolygon GeoJSON),
+préfiltre par grille de bbox puis test exact des anneaux (trous compris).
+"""
+
+from __future__ import annotations
+
+import math
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEG_LAT = math.pi * EARTH_RADIUS_KM / 180.0
+
+# Taille de cellule par défaut (degrés). ~11 km : quelques dizaines de points
+# par cellule en ville, et un nombre de cellules occupées très inférieur à N.
+DEFAULT_CELL_DEG = 0.1
+
+# Décalage pour encoder (iy, ix) dans un seul int64 (ix peut être négatif).
+_IX_SPAN = 1 << 24
+
+
+class GridIndex:
+    """Index bbox sur une grille régulière, construit une fois par jeu de données."""
+
+    def __init__(self, lats, lngs, cell_deg: float = DEFAULT_CELL_DEG):
+        self.cell_deg = float(cell_deg)
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lngs = np.asarray(lngs, dtype=np.float64)
+
+        iy = np.floor(self.lats / self.cell_deg).astype(np.int64)
+        ix = np.floor(self.lngs / self.cell_deg).astype(np.int64)
+        keys = iy * _IX_SPAN + (ix + _IX_SPAN // 2)
+
+        # Tri stable : à l'intérieur d'une cellule, l'ordre d'origine est conservé.
+        self.order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[self.order]
+
+        cell_keys, starts = np.unique(sorted_keys, return_index=True)
+        self.cell_keys = cell_keys
+        self.cell_starts = starts
+        self.cell_ends = np.append(starts[1:], len(sorted_keys))
+        self.cell_iy = cell_keys // _IX_SPAN
+        self.cell_ix = cell_keys % _IX_SPAN - _IX_SPAN // 2
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def _cell_range(self, lo: float, hi: float) -> Tuple[int, int]:
+        return int(np.floor(lo / self.cell_deg)), int(np.floor(hi / self.cell_deg))
+
+    def _candidate_cells(self, s: float, n: float, w: float, e: float) -> np.ndarray:
+        """
+        Indices (croissants) des cellules occupées qui intersectent la bbox.
+        Les clés étant triées par ligne de latitude, seule la bande [s, n] est examinée.
+        """
+        iy0, iy1 = self._cell_range(s, n)
+        lo = int(np.searchsorted(self.cell_keys, iy0 * _IX_SPAN, side="left"))
+        hi = int(np.searchsorted(self.cell_keys, (iy1 + 1) * _IX_SPAN, side="left"))
+        cell_ix = self.cell_ix[lo:hi]
+        if w <= e:
+            ix0, ix1 = self._cell_range(w, e)
+            in_lng = (cell_ix >= ix0) & (cell_ix <= ix1)
+        else:
+            # bbox à cheval sur le méridien 180° : [w, 180] ∪ [-180, e]
+            ix_w, _ = self._cell_range(w, w)
+            _, ix_e = self._cell_range(e, e)
+            in_lng = (cell_ix >= ix_w) | (cell_ix <= ix_e)
+        return np.flatnonzero(in_lng) + lo
+
+    @staticmethod
+    def _ranges(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+        """Concaténation vectorisée des plages [start, end)."""
+        lengths = ends - starts
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        return np.arange(lengths.sum()) + offsets
+
+    def _in_bbox(self, cand: np.ndarray, s: float, n: float, w: float, e: float) -> np.ndarray:
+        lat = self.lats[cand]
+        lng = self.lngs[cand]
+        keep = (lat >= s) & (lat <= n)
+        if w <= e:
+            keep &= (lng >= w) & (lng <= e)
+        else:
+            keep &= (lng >= w) | (lng <= e)
+        return keep
+
+    def query(self, s: float, n: float, w: float, e: float) -> np.ndarray:
+        """
+        Positions (iloc) des points dans la bbox, bornes incluses, triées dans
+        l'ordre d'origine du DataFrame (même ordre que l'ancien masque booléen).
+        """
+        cells = self._candidate_cells(s, n, w, e)
+        if cells.size == 0:
+            return np.empty(0, dtype=np.int64)
+
+        cand = self.order[self._ranges(self.cell_starts[cells], self.cell_ends[cells])]
+        return np.sort(cand[self._in_bbox(cand, s, n, w, e)])
+
+    def query_page(self, s: float, n: float, w: float, e: float,
+                   after: int = -1, limit: int = 300) -> Tuple[np.ndarray, Optional[int]]:
+        """
+        Page de la bbox dans l'ordre spatial de l'index (rang dans self.order),
+        en reprenant après le rang `after` (-1 = début). Seules les cellules
+        nécessaires à la page sont parcourues.
+        Retourne (positions iloc, rang du dernier point émis s'il reste des points, sinon None).
+        """
+        cells = self._candidate_cells(s, n, w, e)
+        # Première cellule pouvant contenir le rang after + 1
+        cells = cells[np.searchsorted(self.cell_ends[cells], after + 1, side="right"):]
+
+        need = limit + 1  # un point de plus pour savoir s'il existe une page suivante
+        found: List[np.ndarray] = []
+        i, step = 0, 8
+        while i < len(cells) and need > 0:
+            chunk = cells[i:i + step]
+            i += step
+            step *= 2
+            ranks = self._ranges(np.maximum(self.cell_starts[chunk], after + 1), self.cell_ends[chunk])
+            ranks = ranks[self._in_bbox(self.order[ranks], s, n, w, e)][:need]
+            found.append(ranks)
+            need -= len(ranks)
+
+        ranks = np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+        has_more = len(ranks) > limit
+        ranks = ranks[:limit]
+        return self.order[ranks], (int(ranks[-1]) if has_more else None)
+
+    def count_within_km(self, lats, lngs, radius_km: float) -> np.ndarray:
+        """
+        Nombre de points à moins de radius_km (haversine) de chaque requête.
+        Vectorisé par décalage de cellule : pour chaque (dy, dx) de la fenêtre,
+        toutes les requêtes sont traitées d'un coup. Efficace pour cell_deg
+        de l'ordre du rayon (fenêtre de 2-3 cellules par axe).
+        """
+        lats = np.asarray(lats, dtype=np.float64)
+        lngs = np.asarray(lngs, dtype=np.float64)
+        counts = np.zeros(len(lats), dtype=np.int64)
+        if not len(lats) or not len(self.order):
+            return counts
+        dlat = radius_km / KM_PER_DEG_LAT
+        coslat = np.maximum(np.cos(np.radians(np.minimum(np.abs(lats) + dlat, 89.9))), 1e-6)
+        dlng = dlat / coslat
+        iy0 = np.floor((lats - dlat) / self.cell_deg).astype(np.int64)
+        iy1 = np.floor((lats + dlat) / self.cell_deg).astype(np.int64)
+        ix0 = np.floor((lngs - dlng) / self.cell_deg).astype(np.int64)
+        ix1 = np.floor((lngs + dlng) / self.cell_deg).astype(np.int64)
+        point_lats = self.lats[self.order]
+        point_lngs = self.lngs[self.order]
+
+        for dy in range(int((iy1 - iy0).max()) + 1):
+            for dx in range(int((ix1 - ix0).max()) + 1):
+                q = np.flatnonzero((iy0 + dy <= iy1) & (ix0 + dx <= ix1))
+                keys = (iy0[q] + dy) * _IX_SPAN + (ix0[q] + dx + _IX_SPAN // 2)
+                cells = np.minimum(np.searchsorted(self.cell_keys, keys), len(self.cell_keys) - 1)
+                hit = self.cell_keys[cells] == keys
+                q, cells = q[hit], cells[hit]
+                if not len(q):
+                    continue
+                starts, ends = self.cell_starts[cells], self.cell_ends[cells]
+                ranks = self._ranges(starts, ends)
+                pair_q = np.repeat(q, ends - starts)
+                d = haversine_km(lats[pair_q], lngs[pair_q], point_lats[ranks], point_lngs[ranks])
+                counts += np.bincount(pair_q[d <= radius_km], minlength=len(lats))
+        return counts
+
+    def estimate_count(self, s: float, n: float, w: float, e: float) -> int:
+        """Majorant du nombre de points de la bbox (effectifs des cellules candidates)."""
+        cells = self._candidate_cells(s, n, w, e)
+        return int((self.cell_ends[cells] - self.cell_starts[cells]).sum())
+
+
+def haversine_km(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Distance haversine vectorisée (km), broadcast numpy."""
+    p1 = np.radians(lat1)
+    p2 = np.radians(lat2)
+    dphi = p2 - p1
+    dlmb = np.radians(np.asarray(lon2, dtype=np.float64) - lon1)
+    a = np.sin(dphi / 2) ** 2 + np.cos(p1) * np.cos(p2) * np.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class PointIndex:
+    """
+    Index de voisinage incrémental sur grille lat/lon.
+    Les identifiants sont les rangs d'insertion (0, 1, 2...).
+    """
+
+    def __init__(self, cell_deg: float = DEFAULT_CELL_DEG):
+        self.cell_deg = float(cell_deg)
+        self._lats = np.empty(64, dtype=np.float64)
+        self._lngs = np.empty(64, dtype=np.float64)
+        self._n = 0
+        self._cells: Dict[Tuple[int, int], List[int]] = {}
+
+    def __len__(self) -> int:
+        return self._n
+
+    def copy(self) -> "PointIndex":
+        """Copie indépendante (les insertions dans l'une ne touchent pas l'autre)."""
+        other = PointIndex(self.cell_deg)
+        other._lats, other._lngs, other._n = self._lats.copy(), self._lngs.copy(), self._n
+        other._cells = {cell: list(ids) for cell, ids in self._cells.items()}
+        return other
+
+    @property
+    def lats(self) -> np.ndarray:
+        return self._lats[:self._n]
+
+    @property
+    def lngs(self) -> np.ndarray:
+        return self._lngs[:self._n]
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        return int(math.floor(lat / self.cell_deg)), int(math.floor(lng / self.cell_deg))
+
+    def add(self, lat: float, lng: float) -> int:
+        """Insère un point en O(1) amorti et retourne son identifiant."""
+        if self._n == len(self._lats):
+            self._lats = np.resize(self._lats, 2 * self._n)
+            self._lngs = np.resize(self._lngs, 2 * self._n)
+        i = self._n
+        self._lats[i] = lat
+        self._lngs[i] = lng
+        self._n += 1
+        self._cells.setdefault(self._cell(lat, lng), []).append(i)
+        return i
+
+    def window(self, lat: float, lng: float, dlat: float, dlng: float) -> np.ndarray:
+        """Identifiants (triés) des points des cellules couvrant [lat±dlat] x [lng±dlng]."""
+        iy0, ix0 = self._cell(lat - dlat, lng - dlng)
+        iy1, ix1 = self._cell(lat + dlat, lng + dlng)
+        found: List[int] = []
+        for iy in range(iy0, iy1 + 1):
+            for ix in range(ix0, ix1 + 1):
+                ids = self._cells.get((iy, ix))
+                if ids:
+                    found.extend(ids)
+        if not found:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(np.fromiter(found, dtype=np.int64, count=len(found)))
+
+    def within_km(self, lat: float, lng: float, radius_km: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Points à moins de radius_km (haversine) : (ids triés, distances km)."""
+        dlat = radius_km / KM_PER_DEG_LAT
+        coslat = max(math.cos(math.radians(min(abs(lat) + dlat, 89.9))), 1e-6)
+        ids = self.window(lat, lng, dlat, dlat / coslat)
+        d = haversine_km(lat, lng, self._lats[ids], self._lngs[ids])
+        keep = d <= radius_km
+        return ids[keep], d[keep]
+
+
+# Taille max (requêtes x points) d'un bloc de produits scalaires
+_NEAREST_CHUNK = 1 << 21
+
+
+def _unit_vectors(lats, lngs) -> np.ndarray:
+    phi = np.radians(np.asarray(lats, dtype=np.float64))
+    lmb = np.radians(np.asarray(lngs, dtype=np.float64))
+    cos_phi = np.cos(phi)
+    return np.column_stack((cos_phi * np.cos(lmb), cos_phi * np.sin(lmb), np.sin(phi)))
+
+
+class NearestIndex:
+    """
+    Plus proche voisin exact sur la sphère, pour des lots de requêtes.
+    L'angle entre deux points décroît avec leur produit scalaire : un
+    argmax par bloc (requêtes x points) suffit, la distance retenue étant
+    ensuite recalculée en haversine. Adapté à quelques milliers de points
+    (réseau d'ATMs, concurrents) ; insertions une à une en O(1) amorti.
+    """
+
+    def __init__(self, lats=(), lngs=()):
+        lats = np.asarray(lats, dtype=np.float64)
+        lngs = np.asarray(lngs, dtype=np.float64)
+        self._n = len(lats)
+        self._lats = np.resize(lats, max(64, self._n))
+        self._lngs = np.resize(lngs, max(64, self._n))
+        self._xyz = np.resize(_unit_vectors(lats, lngs), (max(64, self._n), 3))
+
+    def __len__(self) -> int:
+        return self._n
+
+    @property
+    def lats(self) -> np.ndarray:
+        return self._lats[:self._n]
+
+    @property
+    def lngs(self) -> np.ndarray:
+        return self._lngs[:self._n]
+
+    def copy(self) -> "NearestIndex":
+        """Copie indépendante (les insertions dans l'une ne touchent pas l'autre)."""
+        other = NearestIndex.__new__(NearestIndex)
+        other._n = self._n
+        other._lats, other._lngs, other._xyz = self._lats.copy(), self._lngs.copy(), self._xyz.copy()
+        return other
+
+    def add(self, lat: float, lng: float) -> int:
+        if self._n == len(self._lats):
+            self._lats = np.resize(self._lats, 2 * self._n)
+            self._lngs = np.resize(self._lngs, 2 * self._n)
+            self._xyz = np.resize(self._xyz, (2 * self._n, 3))
+        i = self._n
+        self._lats[i], self._lngs[i] = lat, lng
+        self._xyz[i] = _unit_vectors([lat], [lng])[0]
+        self._n += 1
+        return i
+
+    def _blocks(self, lats, lngs):
+        q = _unit_vectors(lats, lngs)
+        step = max(1, _NEAREST_CHUNK // max(self._n, 1))
+        xyz = self._xyz[:self._n]
+        for a in range(0, len(q), step):
+            yield a, q[a:a + step] @ xyz.T
+
+    def nearest(self, lats, lngs) -> Tuple[np.ndarray, np.ndarray]:
+        """(identifiant, distance km) du point le plus proche de chaque requête (-1, inf si vide)."""
+        lats = np.asarray(lats, dtype=np.float64)
+        lngs = np.asarray(lngs, dtype=np.float64)
+        ids = np.full(len(lats), -1, dtype=np.int64)
+        dist = np.full(len(lats), np.inf)
+        if not self._n or not len(lats):
+            return ids, dist
+        for a, dots in self._blocks(lats, lngs):
+            ids[a:a + len(dots)] = np.argmax(dots, axis=1)
+        dist[:] = haversine_km(lats, lngs, self.lats[ids], self.lngs[ids])
+        return ids, dist
+
+    def count_within(self, lats, lngs, radius_km: float) -> np.ndarray:
+        """Nombre de points à moins de radius_km de chaque requête."""
+        lats = np.asarray(lats, dtype=np.float64)
+        counts = np.zeros(len(lats), dtype=np.int64)
+        if not self._n or not len(lats):
+            return counts
+        min_dot = math.cos(min(radius_km / EARTH_RADIUS_KM, math.pi))
+        for a, dots in self._blocks(lats, lngs):
+            counts[a:a + len(dots)] = np.count_nonzero(dots >= min_dot, axis=1)
+        return counts
+
+
+# Taille max (points x arêtes) d'un bloc de test point-dans-anneau
+_PIP_CHUNK = 1 << 20
+
+
+def _points_in_ring(xs: np.ndarray, ys: np.ndarray, edges: Tuple[np.ndarray, ...]) -> np.ndarray:
+    """Test pair/impair (ray casting) de plusieurs points contre un anneau, vectorisé."""
+    xi, yi, xj, yj = edges
+    out = np.empty(len(xs), dtype=bool)
+    step = max(1, _PIP_CHUNK // max(len(xi), 1))  # borne la matrice points x arêtes
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for a in range(0, len(xs), step):
+            px, py = xs[a:a + step, None], ys[a:a + step, None]
+            crosses = (yi > py) != (yj > py)
+            x_at = (xj - xi) * (py - yi) / (yj - yi) + xi
+            out[a:a + step] = (np.count_nonzero(crosses & (px < x_at), axis=1) % 2) == 1
+    return out
+
+
+def _ring_edges(ring: Any) -> Tuple[np.ndarray, ...]:
+    arr = np.asarray(ring, dtype=np.float64)[:, :2]
+    xi, yi = arr[:, 0], arr[:, 1]
+    return xi, yi, np.roll(xi, 1), np.roll(yi, 1)
+
+
+class PolygonIndex:
+    """
+    Index de polygones construit une fois à partir de géométries GeoJSON.
+    Les identifiants retournés sont les rangs des géométries (-1 = hors polygones).
+    """
+
+    def __init__(self, geometries: List[Optional[Dict[str, Any]]], cell_deg: float = 0.25):
+        self.cell_deg = float(cell_deg)
+        self._owner: List[int] = []
+        self._rings: List[List[Tuple[np.ndarray, ...]]] = []  # [extérieur, trous...]
+        bboxes: List[Tuple[float, float, float, float]] = []
+
+        for gid, geom in enumerate(geometries):
+            if not geom or "coordinates" not in geom:
+                continue
+            if geom.get("type") == "Polygon":
+                polys = [geom["coordinates"]]
+            elif geom.get("type") == "MultiPolygon":
+                polys = geom["coordinates"]
+            else:
+                continue
+            for rings in polys:
+                if not rings or len(rings[0]) < 3:
+                    continue
+                edges = [_ring_edges(r) for r in rings if len(r) >= 3]
+                xs, ys = edges[0][0], edges[0][1]
+                self._owner.append(gid)
+                self._rings.append(edges)
+                bboxes.append((xs.min(), ys.min(), xs.max(), ys.max()))
+
+        self._bbox = np.array(bboxes, dtype=np.float64).reshape(-1, 4)
+        self._bbox_list = self._bbox.tolist()
+        self._cells: Dict[Tuple[int, int], List[int]] = {}
+        for pid, (x0, y0, x1, y1) in enumerate(self._bbox):
+            for iy in range(self._idx(y0), self._idx(y1) + 1):
+                for ix in range(self._idx(x0), self._idx(x1) + 1):
+                    self._cells.setdefault((iy, ix), []).append(pid)
+
+    def __len__(self) -> int:
+        return len(self._owner)
+
+    def _idx(self, v: float) -> int:
+        return int(math.floor(v / self.cell_deg))
+
+    def _part_contains(self, pid: int, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        rings = self._rings[pid]
+        inside = _points_in_ring(xs, ys, rings[0])
+        for hole in rings[1:]:
+            if not inside.any():
+                break
+            inside &= ~_points_in_ring(xs, ys, hole)
+        return inside
+
+    def locate(self, lat: float, lng: float) -> int:
+        """Géométrie contenant (lat, lng), ou -1."""
+        parts = self._cells.get((self._idx(lat), self._idx(lng)))
+        if not parts:
+            return -1
+        xs, ys = np.array([lng], dtype=np.float64), np.array([lat], dtype=np.float64)
+        for pid in parts:
+            x0, y0, x1, y1 = self._bbox_list[pid]
+            if x0 <= lng <= x1 and y0 <= lat <= y1 and self._part_contains(pid, xs, ys)[0]:
+                return self._owner[pid]
+        return -1
+
+    def locate_many(self, lats: Any, lngs: Any) -> np.ndarray:
+        """Version batch : points regroupés par cellule, tests d'anneaux vectorisés."""
+        ys = np.asarray(lats, dtype=np.float64)
+        xs = np.asarray(lngs, dtype=np.float64)
+        out = np.full(len(xs), -1, dtype=np.int64)
+        if len(xs) == 0 or not self._cells:
+            return out
+
+        iy = np.floor(ys / self.cell_deg).astype(np.int64)
+        ix = np.floor(xs / self.cell_deg).astype(np.int64)
+        order = np.lexsort((ix, iy))
+        keys = np.stack([iy[order], ix[order]], axis=1)
+        starts = np.flatnonzero(np.r_[True, np.any(keys[1:] != keys[:-1], axis=1)])
+        ends = np.append(starts[1:], len(order))
+
+        for a, b in zip(starts.tolist(), ends.tolist()):
+            parts = self._cells.get((int(keys[a, 0]), int(keys[a, 1])))
+            if not parts:
+                continue
+            pts = order[a:b]
+            for pid in parts:
+                todo = pts[out[pts] < 0]
+                if todo.size == 0:
+                    break
+                x0, y0, x1, y1 = self._bbox[pid]
+                px, py = xs[todo], ys[todo]
+                in_box = (px >= x0) & (px <= x1) & (py >= y0) & (py <= y1)
+                if not in_box.any():
+                    continue
+                cand = todo[in_box]
+                hit = self._part_contains(pid, xs[cand], ys[cand])
+                out[cand[hit]] = self._owner[pid]
+        return out
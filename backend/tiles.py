@@ -0,0 +1,195 @@
+"""
+Tuiles vectorielles Mapbox (MVT v2) pour les couches de points.
+
+Encodeur protobuf minimal écrit à la main (une couche de points par tuile,
+pas de dépendance externe). Chaque TileSource précalcule, pour chaque
+point, le zoom minimal auquel il apparaît (éclaircissement : un point par
+cellule de THIN_CELL_PX pixels jusqu'à THIN_MAX_ZOOM), puis sert les tuiles
+depuis un cache LRU.
+"""
+
+from __future__ import annotations
+
+import math
+import struct
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from clustering import mercator_xy
+from spatial_index import GridIndex
+
+MVT_EXTENT = 4096
+# Marge autour de la tuile (unités de tuile) pour ne pas couper les icônes
+MVT_BUFFER = 64
+# Éclaircissement : au plus un point par cellule de 16 px (256 / 16 = 2**4)
+THIN_CELL_PX = 16
+THIN_SHIFT = 4
+# À partir de ce zoom, tous les points sont servis
+THIN_MAX_ZOOM = 14
+# Tuiles gardées en mémoire par couche
+TILE_CACHE_SIZE = 2048
+MVT_MEDIA_TYPE = "application/vnd.mapbox-vector-tile"
+
+
+# ---------- Encodage protobuf ----------
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        bits = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(bits | 0x80)
+        else:
+            out.append(bits)
+            return bytes(out)
+
+
+def _zigzag(value: int) -> int:
+    return (value << 1) ^ (value >> 63)
+
+
+def _field(number: int, wire_type: int) -> bytes:
+    return _varint((number << 3) | wire_type)
+
+
+def _bytes_field(number: int, payload: bytes) -> bytes:
+    return _field(number, 2) + _varint(len(payload)) + payload
+
+
+def _packed(number: int, values: Sequence[int]) -> bytes:
+    return _bytes_field(number, b"".join(_varint(v) for v in values))
+
+
+def _encode_value(value: Any) -> bytes:
+    """Message Value : string (1), double (3), sint (6), bool (7)."""
+    if isinstance(value, (bool, np.bool_)):
+        return _field(7, 0) + _varint(int(bool(value)))
+    if isinstance(value, (int, np.integer)) and -(1 << 63) <= int(value) < (1 << 63):
+        return _field(6, 0) + _varint(_zigzag(int(value)))
+    if isinstance(value, (float, np.floating)):
+        return _field(3, 1) + struct.pack("<d", float(value))
+    return _bytes_field(1, str(value).encode("utf-8"))
+
+
+def encode_point_layer(name: str, points: Sequence[Tuple[int, int]],
+                       properties: Sequence[Dict[str, Any]], extent: int = MVT_EXTENT) -> bytes:
+    """Tuile MVT d'une seule couche de points (coordonnées déjà en unités de tuile)."""
+    keys: Dict[str, int] = {}
+    values: Dict[Tuple[type, Any], int] = {}
+    features = []
+    for fid, ((px, py), props) in enumerate(zip(points, properties)):
+        tags: List[int] = []
+        for k, v in props.items():
+            if v is None or (isinstance(v, float) and math.isnan(v)):
+                continue
+            tags.append(keys.setdefault(k, len(keys)))
+            tags.append(values.setdefault((type(v), v), len(values)))
+        # MoveTo(1) puis le point en delta zigzag depuis (0, 0)
+        geometry = (9, _zigzag(px), _zigzag(py))
+        feat = (_field(1, 0) + _varint(fid)
+                + (_packed(2, tags) if tags else b"")
+                + _field(3, 0) + _varint(1)
+                + _packed(4, geometry))
+        features.append(_bytes_field(2, feat))
+
+    layer = (_field(15, 0) + _varint(2)
+             + _bytes_field(1, name.encode("utf-8"))
+             + b"".join(features)
+             + b"".join(_bytes_field(3, k.encode("utf-8")) for k in keys)
+             + b"".join(_bytes_field(4, _encode_value(v)) for (_, v) in values)
+             + _field(5, 0) + _varint(extent))
+    return _bytes_field(3, layer)
+
+
+# ---------- Géométrie des tuiles ----------
+
+def tile_bounds(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """(s, n, w, e) en degrés de la tuile z/x/y."""
+    n_tiles = 1 << z
+
+    def lat(ty: float) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * ty / n_tiles))))
+
+    return lat(y + 1), lat(y), x / n_tiles * 360.0 - 180.0, (x + 1) / n_tiles * 360.0 - 180.0
+
+
+def _min_zooms(mx: np.ndarray, my: np.ndarray) -> np.ndarray:
+    """
+    Zoom minimal d'affichage de chaque point : à chaque zoom, le premier point
+    (ordre d'origine) de chaque cellule est retenu. Les grilles étant
+    emboîtées, un point retenu au zoom z l'est aussi à tous les zooms suivants.
+    """
+    minzoom = np.full(len(mx), THIN_MAX_ZOOM, dtype=np.int8)
+    for z in range(THIN_MAX_ZOOM - 1, -1, -1):
+        size = float(1 << (z + THIN_SHIFT))
+        keys = (mx * size).astype(np.int64) * (1 << (z + THIN_SHIFT)) + (my * size).astype(np.int64)
+        _, first = np.unique(keys, return_index=True)
+        minzoom[first] = z
+    return minzoom
+
+
+class TileSource:
+    """Points d'une couche + propriétés, servis en tuiles MVT avec cache LRU."""
+
+    def __init__(self, name: str, lats: Sequence[float], lngs: Sequence[float],
+                 properties: Dict[str, Sequence[Any]]):
+        self.name = name
+        lats = np.asarray(lats, dtype=np.float64)
+        lngs = np.asarray(lngs, dtype=np.float64)
+        self.index = GridIndex(lats, lngs)
+        self.mx, self.my = mercator_xy(lats, lngs)
+        self.minzoom = _min_zooms(self.mx, self.my)
+        self.columns = {k: list(v) for k, v in properties.items()}
+        self._cache: "OrderedDict[Tuple[int, int, int], bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.mx)
+
+    def tile(self, z: int, x: int, y: int) -> bytes:
+        key = (z, x, y)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached
+
+        data = self._render(z, x, y)
+
+        with self._lock:
+            self._cache[key] = data
+            if len(self._cache) > TILE_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return data
+
+    def _render(self, z: int, x: int, y: int) -> bytes:
+        n_tiles = 1 << z
+        pad = MVT_BUFFER / MVT_EXTENT
+        s, n, w, e = self._padded_bounds(z, x, y, pad)
+
+        pos = self.index.query(s, n, w, e)
+        if z < THIN_MAX_ZOOM:
+            pos = pos[self.minzoom[pos] <= z]
+
+        px = np.round((self.mx[pos] * n_tiles - x) * MVT_EXTENT).astype(np.int64)
+        py = np.round((self.my[pos] * n_tiles - y) * MVT_EXTENT).astype(np.int64)
+        inside = (px >= -MVT_BUFFER) & (px <= MVT_EXTENT + MVT_BUFFER) \
+            & (py >= -MVT_BUFFER) & (py <= MVT_EXTENT + MVT_BUFFER)
+        pos, px, py = pos[inside], px[inside], py[inside]
+
+        cols = self.columns
+        properties = [{k: col[i] for k, col in cols.items()} for i in pos.tolist()]
+        return encode_point_layer(self.name, list(zip(px.tolist(), py.tolist())), properties)
+
+    @staticmethod
+    def _padded_bounds(z: int, x: int, y: int, pad: float) -> Tuple[float, float, float, float]:
+        n_tiles = 1 << z
+        s, n, w, e = tile_bounds(z, x, y)
+        dlng = 360.0 / n_tiles * pad
+        # Marge en latitude : hauteur de la tuile (en degrés) * pad
+        dlat = (n - s) * pad
+        return max(s - dlat, -90.0), min(n + dlat, 90.0), max(w - dlng, -180.0), min(e + dlng, 180.0)
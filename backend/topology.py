@@ -0,0 +1,251 @@
+"""
+Encodage topologique et simplification par zoom des polygones de communes.
+
+Les coordonnées sont quantifiées sur une grille entière (même pas en x et
+en y), les anneaux découpés en arcs aux jonctions (points où le voisinage
+change) et les arcs communs à deux communes stockés une seule fois. Chaque
+sommet reçoit une fois pour toutes son aire effective (Visvalingam–Whyatt) ;
+simplifier pour un zoom revient alors à filtrer les sommets par seuil, de
+façon identique de part et d'autre d'une frontière partagée.
+
+Sorties : TopoJSON (arcs quantifiés, codés en delta) ou GeoJSON reconstruit.
+"""
+
+from __future__ import annotations
+
+import heapq
+import math
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Taille de la grille de quantification (pas ~2 m sur l'emprise du Maroc)
+QUANTIZATION = 1_000_000
+# Aire minimale conservée, en pixels² à l'écran (tuiles de 256 px)
+MIN_AREA_PX = 0.5
+
+Point = Tuple[int, int]
+
+
+def _polygons(geometry: Dict[str, Any]) -> List[List[List[Any]]]:
+    """Polygon / MultiPolygon -> liste de polygones (liste d'anneaux de coordonnées)."""
+    if not geometry:
+        return []
+    if geometry.get("type") == "Polygon":
+        return [geometry.get("coordinates") or []]
+    if geometry.get("type") == "MultiPolygon":
+        return geometry.get("coordinates") or []
+    return []
+
+
+def _ring_points(ring: List[List[float]], x0: float, y0: float, k: float) -> List[Point]:
+    """Anneau -> points quantifiés, sans doublons consécutifs ni point de fermeture."""
+    pts: List[Point] = []
+    for c in ring:
+        p = (int(round((c[0] - x0) / k)), int(round((c[1] - y0) / k)))
+        if not pts or pts[-1] != p:
+            pts.append(p)
+    if len(pts) > 1 and pts[0] == pts[-1]:
+        pts.pop()
+    return pts
+
+
+def _visvalingam(arc: np.ndarray) -> np.ndarray:
+    """Aire effective (x2) de chaque sommet ; extrémités à +inf."""
+    n = len(arc)
+    weights = np.full(n, np.inf)
+    if n < 3:
+        return weights
+
+    xs = arc[:, 0].astype(np.float64).tolist()
+    ys = arc[:, 1].astype(np.float64).tolist()
+    prev = list(range(-1, n - 1))
+    nxt = list(range(1, n + 1))
+
+    def area(i: int) -> float:
+        a, b = prev[i], nxt[i]
+        return abs((xs[a] - xs[i]) * (ys[b] - ys[i]) - (xs[b] - xs[i]) * (ys[a] - ys[i]))
+
+    current = [0.0] * n
+    heap = []
+    for i in range(1, n - 1):
+        current[i] = area(i)
+        heap.append((current[i], i))
+    heapq.heapify(heap)
+
+    removed = [False] * n
+    max_area = 0.0
+    while heap:
+        a, i = heapq.heappop(heap)
+        if removed[i] or a != current[i]:
+            continue
+        # Aire effective monotone : un sommet n'est jamais moins important que ceux retirés avant lui
+        max_area = max(max_area, a)
+        weights[i] = max_area
+        removed[i] = True
+        p, q = prev[i], nxt[i]
+        nxt[p], prev[q] = q, p
+        for j in (p, q):
+            if 0 < j < n - 1 and not removed[j]:
+                current[j] = area(j)
+                heapq.heappush(heap, (current[j], j))
+    return weights
+
+
+class Topology:
+    """Topologie quantifiée d'une FeatureCollection de (Multi)Polygons."""
+
+    def __init__(self, features: List[Dict[str, Any]], quantization: int = QUANTIZATION):
+        polygons = [_polygons(f.get("geometry")) for f in features]
+        coords = [c for polys in polygons for poly in polys for ring in poly for c in ring]
+        if coords:
+            arr = np.asarray([c[:2] for c in coords], dtype=np.float64)
+            x0, y0 = arr.min(axis=0)
+            x1, y1 = arr.max(axis=0)
+        else:
+            x0 = y0 = 0.0
+            x1 = y1 = 1.0
+        # Même pas sur les deux axes : les aires Visvalingam restent isotropes
+        self.k = max(x1 - x0, y1 - y0, 1e-9) / (quantization - 1)
+        self.x0, self.y0 = float(x0), float(y0)
+        self.properties = [f.get("properties") or {} for f in features]
+        self.types = [(f.get("geometry") or {}).get("type") for f in features]
+
+        rings = [[[_ring_points(r, self.x0, self.y0, self.k) for r in poly] for poly in polys] for polys in polygons]
+        junctions = self._junctions(rings)
+
+        self._arc_ids: Dict[Tuple[Point, ...], int] = {}
+        self.arcs: List[np.ndarray] = []
+        self._protected: set = set()
+        self.geometries: List[List[List[List[int]]]] = [
+            [[self._ring_arcs(r, junctions) for r in poly if len(r) >= 3]
+             for poly in feature_rings if poly and len(poly[0]) >= 3]
+            for feature_rings in rings
+        ]
+        self.weights = [self._arc_weights(i, arc) for i, arc in enumerate(self.arcs)]
+        del self._arc_ids
+
+    def __len__(self) -> int:
+        return len(self.properties)
+
+    @staticmethod
+    def _junctions(rings: List[List[List[List[Point]]]]) -> set:
+        """Points dont les voisins (non ordonnés) diffèrent d'un passage à l'autre."""
+        neighbours: Dict[Point, Tuple[Point, Point]] = {}
+        junctions = set()
+        for polys in rings:
+            for ring in (r for poly in polys for r in poly):
+                n = len(ring)
+                for i, p in enumerate(ring):
+                    a, b = ring[i - 1], ring[(i + 1) % n]
+                    pair = (a, b) if a <= b else (b, a)
+                    seen = neighbours.setdefault(p, pair)
+                    if seen != pair:
+                        junctions.add(p)
+        return junctions
+
+    def _arc_index(self, pts: List[Point]) -> int:
+        key = tuple(pts)
+        idx = self._arc_ids.get(key)
+        if idx is not None:
+            return idx
+        idx = self._arc_ids.get(key[::-1])
+        if idx is not None:
+            return ~idx
+        idx = len(self.arcs)
+        self._arc_ids[key] = idx
+        self.arcs.append(np.asarray(pts, dtype=np.int64))
+        return idx
+
+    def _ring_arcs(self, ring: List[Point], junctions: set) -> List[int]:
+        cut = [i for i, p in enumerate(ring) if p in junctions]
+        if not cut:
+            # Anneau isolé : un seul arc fermé, départ canonique au plus petit point
+            start = ring.index(min(ring))
+            arcs = [self._arc_index(ring[start:] + ring[:start + 1])]
+        else:
+            start = cut[0]
+            rotated = ring[start:] + ring[:start] + [ring[start]]
+            offsets = [i - start for i in cut] + [len(ring)]
+            arcs = [self._arc_index(rotated[a:b + 1]) for a, b in zip(offsets, offsets[1:])]
+        if len(arcs) < 3:
+            # Un anneau d'un ou deux arcs garde quelques sommets à tout zoom
+            self._protected.update(a if a >= 0 else ~a for a in arcs)
+        return arcs
+
+    def _arc_weights(self, index: int, arc: np.ndarray) -> np.ndarray:
+        weights = _visvalingam(arc)
+        n = len(arc)
+        if index in self._protected and n >= 4:
+            weights[n // 3] = weights[(2 * n) // 3] = np.inf
+        elif index in self._protected and n == 3:
+            weights[1] = np.inf
+        return weights
+
+    # ---------- Simplification ----------
+
+    def min_area(self, zoom: Optional[int]) -> float:
+        """Seuil d'aire effective (x2, unités quantifiées) pour un zoom ; 0 = pleine résolution."""
+        if zoom is None:
+            return 0.0
+        px = 360.0 / (256 * (1 << int(zoom))) / self.k
+        return 2.0 * MIN_AREA_PX * px * px
+
+    def simplified_arcs(self, zoom: Optional[int]) -> List[np.ndarray]:
+        threshold = self.min_area(zoom)
+        if threshold <= 0:
+            return self.arcs
+        return [arc[w >= threshold] for arc, w in zip(self.arcs, self.weights)]
+
+    # ---------- Sorties ----------
+
+    def to_topojson(self, zoom: Optional[int] = None, object_name: str = "communes") -> Dict[str, Any]:
+        arcs = []
+        for arc in self.simplified_arcs(zoom):
+            delta = np.diff(arc, axis=0, prepend=np.zeros((1, 2), dtype=np.int64))
+            arcs.append(delta.tolist())
+
+        geometries = []
+        for kind, polys, props in zip(self.types, self.geometries, self.properties):
+            if not polys:
+                geometries.append({"type": None, "properties": props})
+            elif kind == "Polygon":
+                geometries.append({"type": "Polygon", "arcs": polys[0], "properties": props})
+            else:
+                geometries.append({"type": "MultiPolygon", "arcs": polys, "properties": props})
+
+        return {
+            "type": "Topology",
+            "transform": {"scale": [self.k, self.k], "translate": [self.x0, self.y0]},
+            "objects": {object_name: {"type": "GeometryCollection", "geometries": geometries}},
+            "arcs": arcs,
+        }
+
+    def to_geojson(self, zoom: Optional[int] = None) -> Dict[str, Any]:
+        arcs = self.simplified_arcs(zoom)
+        # Décimales utiles : pas de quantification, ou dixième de pixel au zoom demandé
+        step = self.k if zoom is None else max(self.k, 36.0 / (256 * (1 << int(zoom))))
+        decimals = max(0, int(math.ceil(-math.log10(step))))
+
+        def ring_coords(ring: List[int]) -> List[List[float]]:
+            parts = [arcs[a] if a >= 0 else arcs[~a][::-1] for a in ring]
+            pts = np.concatenate([parts[0]] + [p[1:] for p in parts[1:]])
+            xy = np.round(pts * self.k + (self.x0, self.y0), decimals)
+            return xy.tolist()
+
+        features = []
+        for kind, polys, props in zip(self.types, self.geometries, self.properties):
+            out = []
+            for poly in polys:
+                rings = [ring_coords(r) for r in poly]
+                if len(rings[0]) < 4:
+                    continue  # commune réduite à moins d'un pixel à ce zoom
+                out.append([r for r in rings if len(r) >= 4])
+            if not out:
+                geometry = None
+            elif kind == "Polygon" and len(out) == 1:
+                geometry = {"type": "Polygon", "coordinates": out[0]}
+            else:
+                geometry = {"type": "MultiPolygon", "coordinates": out}
+            features.append({"type": "Feature", "properties": props, "geometry": geometry})
+        return {"type": "FeatureCollection", "features": features}